@@ -1,17 +1,35 @@
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, request, jsonify, render_template, send_file, stream_with_context, g
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
 import os
+import re
 from config import Config
 from utils.csv_handler import CSVHandler
 from utils.pdf_handler import PDFHandler
 from utils.coze_handler import CozeHandler
+from utils.cache_manager import CacheManager, MISS
+from utils.handler_registry import HandlerRegistry
+from utils.page_cache import PageResultCache
+from utils.mrz_parser import parse_mrz
+from utils.file_hash import save_stream, record_hash, hash_file
+from utils.job_manager import JobManager, FINISHED_STATES
+from utils.photo_index import PhotoIndex
+from utils.photo_derivatives import PhotoDerivativeCache
+from utils.disk_quota import DirectoryQuota
+from utils.metrics import metrics, server_timing_header
 import hashlib
 import json
+import uuid
 import time
 import logging
 from flask_caching import Cache
+from utils.scheduler import AdaptiveScheduler
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from threading import Lock
+import zipfile
+import mimetypes
+from urllib.parse import quote
+import itertools
+import math
 
 # 配置日志
 logging.basicConfig(
@@ -33,15 +51,171 @@ cache.init_app(app, config=app.config['CACHE_CONFIG'])
 # 记录当前使用的缓存类型
 logger.info(f"使用的缓存类型: {app.config['CACHE_CONFIG']['CACHE_TYPE']}")
 
-# 创建线程池
-MAX_WORKERS = 6  # 最大线程数
-executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
-progress_lock = Lock()  # 用于保护进度更新
+# 远程调用调度器：自适应并发、限流退避重试、按文件公平调度
+scheduler = AdaptiveScheduler(
+    min_concurrency=app.config['COZE_MIN_CONCURRENCY'],
+    max_concurrency=app.config['COZE_MAX_CONCURRENCY'],
+    initial_concurrency=app.config['COZE_INITIAL_CONCURRENCY'],
+    target_latency=app.config['COZE_TARGET_LATENCY'],
+    max_retries=app.config['COZE_MAX_RETRIES'],
+    base_delay=app.config['COZE_RETRY_BASE_DELAY'],
+    max_delay=app.config['COZE_RETRY_MAX_DELAY']
+)
+
+# 两级缓存（进程内存 + 磁盘），CSV/PDF 处理结果和单页识别结果都保存在这里
+cache_manager = CacheManager(
+    app.config['CACHE_FOLDER'],
+    max_memory_bytes=app.config['CACHE_MEMORY_MAX_BYTES'],
+    max_disk_bytes=app.config['CACHE_DISK_MAX_BYTES']
+)
+
+# 单页识别结果缓存，跨文档共享
+page_cache = PageResultCache(cache_manager)
+
+# CSV/PDF 处理器注册表，同一文件的请求共用内存中的处理器
+handler_registry = HandlerRegistry(
+    max_bytes=app.config['HANDLER_REGISTRY_MAX_BYTES'],
+    max_entries=app.config['HANDLER_REGISTRY_MAX_ENTRIES']
+)
+
+# 后台任务管理器，任务状态保存在护照缓存目录下，供所有 worker 查询
+job_manager = JobManager(
+    app.config['JOBS_FOLDER'],
+    max_workers=app.config['JOB_WORKERS'],
+    retention=app.config['JOB_RETENTION'],
+    stale_timeout=app.config['JOB_STALE_TIMEOUT']
+)
+
+# 照片文件名索引，上传照片时增量更新
+photo_index = PhotoIndex(app.config['PHOTOS_FOLDER'])
+
+# 照片缩略图缓存
+photo_derivatives = PhotoDerivativeCache(
+    app.config['PHOTO_CACHE_FOLDER'],
+    sizes=app.config['PHOTO_SIZES'],
+    quality=app.config['PHOTO_QUALITY'],
+    max_bytes=app.config['PHOTO_CACHE_MAX_BYTES']
+)
+
+# PDF单页图片的磁盘占用限制
+page_render_quota = DirectoryQuota(
+    app.config['PAGE_RENDER_FOLDER'],
+    app.config['PAGE_RENDER_CACHE_MAX_BYTES'],
+    max_age=app.config['PAGE_RENDER_CACHE_MAX_AGE']
+)
+
+# 照片上传线程池，多个文件并发写入磁盘
+photo_executor = ThreadPoolExecutor(
+    max_workers=app.config['PHOTO_UPLOAD_WORKERS'],
+    thread_name_prefix='photo'
+)
 
 # 确保上传目录存在
 for folder in [app.config['CSV_FOLDER'], app.config['PHOTOS_FOLDER'], app.config['PASSPORTS_FOLDER']]:
     os.makedirs(folder, exist_ok=True)
 
+def collect_runtime_metrics():
+    """导出指标时采集缓存命中、调度器和线程池队列的当前状态"""
+    cache_stats = cache_manager.stats()
+    yield 'cache_memory_bytes', 'gauge', {}, cache_stats['memory_bytes']
+    yield 'cache_memory_entries', 'gauge', {}, cache_stats['memory_entries']
+    for namespace, counts in cache_stats['namespaces'].items():
+        if namespace == '_disk':
+            yield 'cache_evictions_total', 'counter', {'tier': 'disk'}, counts.get('evictions', 0)
+            continue
+        for result in ('memory_hits', 'disk_hits', 'misses'):
+            yield 'cache_lookups_total', 'counter', {'namespace': namespace, 'result': result}, counts.get(result, 0)
+        yield 'cache_bytes_total', 'counter', {'namespace': namespace, 'direction': 'read'}, counts.get('bytes_read', 0)
+        yield 'cache_bytes_total', 'counter', {'namespace': namespace, 'direction': 'write'}, counts.get('bytes_written', 0)
+        yield 'cache_evictions_total', 'counter', {'tier': 'memory', 'namespace': namespace}, counts.get('memory_evictions', 0)
+    
+    registry_stats = handler_registry.stats()
+    yield 'handler_registry_bytes', 'gauge', {}, registry_stats['bytes']
+    yield 'handler_registry_entries', 'gauge', {}, registry_stats['entries']
+    for result in ('hits', 'misses'):
+        yield 'handler_registry_lookups_total', 'counter', {'result': result}, registry_stats.get(result, 0)
+    yield 'handler_registry_evictions_total', 'counter', {}, registry_stats.get('evictions', 0)
+    
+    for key, value in scheduler.stats().items():
+        yield f'scheduler_{key}', 'gauge', {}, value
+    for key, value in job_manager.stats().items():
+        yield f'jobs_{key}', 'gauge', {}, value
+    # ThreadPoolExecutor 没有公开的队列长度接口
+    yield 'photo_upload_queue', 'gauge', {}, photo_executor._work_queue.qsize()
+
+metrics.register_collector(collect_runtime_metrics)
+
+@app.before_request
+def start_request_timer():
+    g.request_start_time = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """记录请求耗时，按配置附加 Server-Timing 响应头"""
+    start_time = g.get('request_start_time')
+    if start_time is None:
+        return response
+    duration = time.perf_counter() - start_time
+    
+    if app.config['SERVER_TIMING_ENABLED']:
+        header = server_timing_header(duration)
+        if header:
+            response.headers['Server-Timing'] = header
+    
+    # 使用路由规则而不是实际路径作为标签，避免标签数量无限增长
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.observe('http_request_seconds', duration, endpoint=endpoint,
+                    method=request.method, status=response.status_code)
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """以 Prometheus 文本格式输出当前 worker 的指标"""
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def create_coze_handler():
+    """创建 CozeHandler，共享进程内的连接池和缓存的连接健康状态"""
+    coze_handler = CozeHandler(
+        app.config['COZE_API_KEY'],
+        app.config['COZE_BOT_ID'],
+        base_url=app.config['COZE_API_URL'],
+        timeout=(app.config['COZE_CONNECT_TIMEOUT'], app.config['COZE_READ_TIMEOUT']),
+        probe_timeout=app.config['COZE_PROBE_TIMEOUT'],
+        health_ttl=app.config['COZE_HEALTH_TTL'],
+        pool_size=app.config['COZE_MAX_CONCURRENCY']
+    )
+    # 健康状态未过期时不会重新测试连接
+    coze_handler.ensure_connection()
+    return coze_handler
+
+def create_csv_handler(filepath, file_hash=None):
+    """获取使用共享缓存和照片索引的CSV处理器，同一内容的文件复用注册表中的处理器"""
+    file_hash = file_hash or hash_file(filepath)
+    return handler_registry.get(
+        'csv', file_hash, filepath,
+        lambda: CSVHandler(filepath, cache=cache_manager, file_hash=file_hash, photo_index=photo_index)
+    )
+
+def create_pdf_handler(filepath, lazy=False):
+    """获取 PDFHandler，页数超过阈值时使用多进程提取文本；lazy 为真时按需提取单页
+
+    处理器按文件内容哈希登记在注册表中，非按需模式下确保已加载全部页面文本。
+    """
+    file_hash = PDFHandler.hash_from_filename(filepath) or hash_file(filepath)
+    pdf_handler = handler_registry.get(
+        'pdf', file_hash, filepath,
+        lambda: PDFHandler(
+            filepath,
+            cache=cache_manager,
+            parallel_threshold=app.config['PDF_PARALLEL_THRESHOLD'],
+            max_processes=app.config['PDF_MAX_PROCESSES'],
+            lazy=True
+        )
+    )
+    if not lazy:
+        pdf_handler.get_all_texts()
+    return pdf_handler
+
 def allowed_file(filename, file_type):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS'][file_type]
@@ -74,9 +248,12 @@ def upload_csv():
     try:
         filename = secure_filename(file.filename)
         filepath = os.path.join(app.config['CSV_FOLDER'], filename)
-        file.save(filepath)
+        # 写入磁盘的同时计算哈希值，无需再次读取文件
+        file_hash, _ = save_stream(file.stream, filepath)
+        # 文件被覆盖，移除旧内容的处理器
+        handler_registry.invalidate(file_path=filepath)
         
-        csv_handler = CSVHandler(filepath, cache=cache)
+        csv_handler = create_csv_handler(filepath, file_hash=file_hash)
         data = csv_handler.to_json()
         
         if not data:
@@ -86,7 +263,8 @@ def upload_csv():
             
         return jsonify({
             'message': 'CSV文件上传成功',
-            'data': data
+            'data': data,
+            'validation': csv_handler.validation
         })
     except Exception as e:
         return jsonify({
@@ -109,10 +287,9 @@ def upload_passport():
         return jsonify({'error': f'文件太大，最大允许 {app.config["MAX_FILE_SIZE"]["passport"] // (1024 * 1024)}MB'}), 413
     
     try:
-        # 计算文件哈希值
-        file_content = file.read()
-        file_hash = hashlib.sha256(file_content).hexdigest()
-        file.seek(0)  # 重置文件指针
+        # 分块写入临时文件并计算哈希值，不把整个文件读入内存
+        tmp_path = os.path.join(app.config['PASSPORTS_FOLDER'], f".upload_{uuid.uuid4().hex}.pdf")
+        file_hash, _ = save_stream(file.stream, tmp_path)
         
         # 使用哈希值作为文件名
         filename = f"{file_hash}.pdf"
@@ -122,28 +299,17 @@ def upload_passport():
         is_new_file = not os.path.exists(filepath)
         
         if is_new_file:
-            file.save(filepath)
+            os.replace(tmp_path, filepath)
+            record_hash(filepath, file_hash)
             app.logger.info(f"保存新文件: {filename}")
             
             # 清除与该文件相关的缓存
-            # 1. 清除Flask缓存
-            cache_key = f"pdf_data_{file_hash}"
-            if cache.has(cache_key):
-                cache.delete(cache_key)
-                app.logger.info(f"已清除Flask缓存: {cache_key}")
-                
-            # 2. 清除文件系统缓存
-            cache_dir = os.path.join(app.config['PASSPORTS_FOLDER'], 'cache')
-            cache_file = os.path.join(cache_dir, f"{file_hash}_processed.json")
-            if os.path.exists(cache_file):
-                os.remove(cache_file)
-                app.logger.info(f"已清除文件缓存: {cache_file}")
-                
-            # 3. 清除文本缓存
-            text_cache_file = os.path.join(cache_dir, f"{file_hash}_text.json")
-            if os.path.exists(text_cache_file):
-                os.remove(text_cache_file)
-                app.logger.info(f"已清除文本缓存: {text_cache_file}")
+            for namespace in ('pdf_text', 'pdf_index', 'pdf_processed'):
+                cache_manager.delete(namespace, file_hash)
+            handler_registry.invalidate(file_hash=file_hash)
+            app.logger.info(f"已清除文件相关缓存: {file_hash}")
+        else:
+            os.remove(tmp_path)
         
         return jsonify({
             'message': '护照文件上传成功',
@@ -155,205 +321,248 @@ def upload_passport():
         app.logger.error(f'护照上传失败: {str(e)}', exc_info=True)
         return jsonify({'error': str(e)}), 500
 
-def process_page(page_num, text, coze_handler):
-    """处理单个页面的函数"""
-    try:
-        passport_data = coze_handler.process_passport_text(text)
-        if passport_data and coze_handler.validate_response(passport_data):
-            passport_data['page_number'] = page_num + 1  # 转换为1开始的页码
-            return passport_data
-    except Exception as e:
-        logger.error(f'处理第 {page_num + 1} 页时出错: {str(e)}')
+def with_page_number(passport_data, page_num):
+    """复制页面结果并附加页码（缓存中的结果不含页码）"""
+    if not passport_data:
+        return None
+    passport_data = dict(passport_data)
+    passport_data['page_number'] = page_num + 1  # 转换为1开始的页码
+    return passport_data
+
+def process_page(page_num, text, coze_handler, text_hash=None):
+    """处理单个页面的函数，异常交由调度器判断是否重试"""
+    passport_data = coze_handler.process_passport_text(text)
+    if not (passport_data and coze_handler.validate_response(passport_data)):
+        passport_data = None
+    # 只缓存成功返回的结果，异常不缓存以便下次重试；未通过校验的结果只短期缓存
+    if text_hash:
+        page_cache.set(text_hash, passport_data)
+    return with_page_number(passport_data, page_num)
+
+def load_processed_cache(file_hash):
+    """加载整份PDF的处理结果缓存，缓存不存在或无效时返回 None"""
+    cached_data = cache_manager.get('pdf_processed', file_hash, None)
+    
+    # 验证缓存数据是否有效
+    if not cached_data:
+        return None
+    
+    passport_data_list = cached_data.get('passport_data_list')
+    if passport_data_list and isinstance(passport_data_list, list) and len(passport_data_list) > 0:
+        # 进一步验证护照数据的结构
+        for passport_data in passport_data_list:
+            if not isinstance(passport_data, dict) or 'passport_number' not in passport_data:
+                logger.warning(f"缓存数据验证失败，将重新处理")
+                return None
+        return cached_data
+    
     return None
 
-@app.route('/preprocess/passport', methods=['POST'])
-def preprocess_passport():
-    try:
-        data = request.get_json()
-        if not data or 'pdf_filename' not in data:
-            return jsonify({'error': '缺少文件名'}), 400
+def cached_passport_events(cached_data):
+    """返回缓存的处理结果，使用与实时处理相同的事件格式"""
+    yield {
+        'status': '从缓存加载数据...',
+        'progress': 50
+    }
+    
+    yield {
+        'status': '加载完成',
+        'progress': 100,
+        'passport_data_list': cached_data['passport_data_list'],
+        'valid_pages': cached_data['valid_pages'],
+        'from_cache': True
+    }
+
+def preprocess_passport_events(filepath, file_hash, force_reprocess=False):
+    """预处理护照PDF，逐条产生进度事件，在后台任务中执行
+
+    强制重新处理时不读取单页缓存，所有页面重新识别，新结果写回缓存。
+    """
+    with app.app_context():
+        try:
+            # 初始化 PDF 处理器
+            pdf_handler = create_pdf_handler(filepath)
+            total_pages = pdf_handler.get_page_count()
             
-        filename = data['pdf_filename']
-        filepath = os.path.join(app.config['PASSPORTS_FOLDER'], filename)
-        
-        if not os.path.exists(filepath):
-            return jsonify({'error': '文件不存在'}), 404
-        
-        # 是否强制重新处理，忽略缓存
-        force_reprocess = data.get('force_reprocess', False)
-        
-        # 提取文件哈希值（从文件名中获取）
-        file_hash = filename.split('.')[0]
+            yield {
+                'status': '正在初始化...',
+                'progress': 0
+            }
             
-        # 检查Flask缓存是否存在
-        cache_key = f"pdf_processed_{file_hash}"
-        cached_data = None
-        
-        if not force_reprocess:
-            # 1. 首先检查Flask缓存
-            if cache.has(cache_key):
-                cached_data = cache.get(cache_key)
-                logger.info(f"从Flask缓存获取到处理结果: {cache_key}")
+            # 获取所有页面的文本
+            all_texts = pdf_handler.get_all_texts()
             
-            # 2. 如果Flask缓存不存在，检查文件系统缓存
-            if not cached_data:
-                cache_dir = os.path.join(app.config['PASSPORTS_FOLDER'], 'cache')
-                os.makedirs(cache_dir, exist_ok=True)
-                cache_file = os.path.join(cache_dir, f"{file_hash}_processed.json")
-                
-                if os.path.exists(cache_file):
-                    try:
-                        with open(cache_file, 'r', encoding='utf-8') as f:
-                            cached_data = json.load(f)
-                            logger.info(f"从文件缓存获取到处理结果: {cache_file}")
-                            
-                            # 将文件缓存同步到Flask缓存以加速未来访问
-                            cache.set(cache_key, cached_data)
-                    except Exception as e:
-                        logger.error(f"读取缓存文件失败: {str(e)}")
-                        # 如果读取损坏，删除损坏的缓存文件
-                        try:
-                            os.remove(cache_file)
-                            logger.info(f"已删除损坏的缓存文件: {cache_file}")
-                        except:
-                            pass
-        
-        # 验证缓存数据是否有效
-        if cached_data and not force_reprocess:
-            passport_data_list = cached_data.get('passport_data_list')
-            if passport_data_list and isinstance(passport_data_list, list) and len(passport_data_list) > 0:
-                # 进一步验证护照数据的结构
-                valid_data = True
-                for passport_data in passport_data_list:
-                    if not isinstance(passport_data, dict) or 'passport_number' not in passport_data:
-                        valid_data = False
-                        break
-                
-                if valid_data:
-                    # 返回缓存数据，但使用流式响应格式以保持一致性
-                    def generate_cached():
-                        yield json.dumps({
-                            'status': '从缓存加载数据...',
-                            'progress': 50
-                        }) + '\n'
-                        
-                        yield json.dumps({
-                            'status': '加载完成',
-                            'progress': 100,
-                            'passport_data_list': passport_data_list,
-                            'valid_pages': cached_data['valid_pages'],
-                            'from_cache': True
-                        }) + '\n'
-                    
-                    return app.response_class(
-                        generate_cached(),
-                        mimetype='text/event-stream'
-                    )
+            yield {
+                'status': '成功提取文本',
+                'progress': 20
+            }
+            
+            # 处理所有页面的文本
+            passport_data_list = []
+            valid_pages = []
+            failed_pages = []
+            processed_count = 0
+            total_count = len(all_texts)
+            
+            # 先查询单页缓存，再尝试本地解析机读区，都不成功的页面才调用 Coze API
+            resolved_results = {}
+            pending_pages = []
+            mrz_count = 0
+            for page_num, text in all_texts.items():
+                page_num = int(page_num)
+                if force_reprocess:
+                    text_hash, cached_result = page_cache.text_hash(text), MISS
                 else:
-                    logger.warning(f"缓存数据验证失败，将重新处理")
-        
-        def generate():
-            try:
-                # 初始化 PDF 处理器
-                pdf_handler = PDFHandler(filepath, cache=cache)
-                total_pages = pdf_handler.get_page_count()
+                    text_hash, cached_result = page_cache.lookup(text)
+                if cached_result is not MISS:
+                    resolved_results[page_num] = with_page_number(cached_result, page_num)
+                    continue
                 
-                yield json.dumps({
-                    'status': '正在初始化...',
-                    'progress': 0
-                }) + '\n'
+                mrz_data = parse_mrz(text)
+                if mrz_data and CozeHandler.validate_response(mrz_data):
+                    resolved_results[page_num] = with_page_number(mrz_data, page_num)
+                    mrz_count += 1
+                    continue
                 
-                # 获取所有页面的文本
-                all_texts = pdf_handler.get_all_texts()
-                
-                yield json.dumps({
-                    'status': '成功提取文本',
-                    'progress': 20
-                }) + '\n'
-                
-                # 初始化 CozeHandler
-                coze_handler = CozeHandler(app.config['COZE_API_KEY'], app.config['COZE_BOT_ID'])
-                
-                # 处理所有页面的文本
-                passport_data_list = []
-                valid_pages = []
-                processed_count = 0
-                total_count = len(all_texts)
-                
-                # 创建任务列表
-                futures = []
-                for page_num, text in all_texts.items():
-                    future = executor.submit(process_page, int(page_num), text, coze_handler)
-                    futures.append((int(page_num), future))
-                
-                # 处理完成的任务结果
-                for page_num, future in futures:
-                    try:
-                        passport_data = future.result()
-                        processed_count += 1
-                        progress = 20 + (processed_count * 70 // total_count)
-                        
-                        with progress_lock:
-                            yield json.dumps({
-                                'status': f'正在处理第 {page_num + 1} 页... ({processed_count}/{total_count})',
-                                'progress': progress
-                            }) + '\n'
-                        
-                        if passport_data:
-                            passport_data_list.append(passport_data)
-                            valid_pages.append(page_num + 1)
-                            
-                    except Exception as e:
-                        logger.error(f'处理第 {page_num + 1} 页时出错: {str(e)}')
-                        continue
-                
-                if not passport_data_list:
-                    yield json.dumps({
-                        'status': '未能提取到有效的护照信息',
-                        'progress': 100,
-                        'error': '未能从任何页面提取到完整的护照信息'
-                    }) + '\n'
-                    return
-                
-                # 保存处理结果到缓存
-                cache_data = {
-                    'file_hash': file_hash,
-                    'passport_data_list': passport_data_list,
-                    'total_pages': total_pages,
-                    'valid_pages': valid_pages,
-                    'processed_time': time.strftime('%Y-%m-%d %H:%M:%S')
+                pending_pages.append((page_num, text, text_hash))
+            
+            if resolved_results:
+                logger.info(f"单页缓存命中 {len(resolved_results) - mrz_count} 页，"
+                            f"机读区解析 {mrz_count} 页，共 {total_count} 页")
+            
+            # 初始化 CozeHandler（全部页面已在本地得到结果时无需连接 API）
+            coze_handler = None
+            if pending_pages:
+                coze_handler = create_coze_handler()
+            
+            # 提交未命中缓存的页面
+            future_pages = {}
+            for page_num, text, text_hash in pending_pages:
+                future = scheduler.submit(file_hash, process_page, page_num, text, coze_handler, text_hash)
+                future_pages[future] = page_num
+            
+            def page_event(page_num, passport_data):
+                """单页完成事件，包含该页的识别结果，客户端可以提前开始比对"""
+                nonlocal processed_count
+                processed_count += 1
+                event = {
+                    'status': f'正在处理第 {page_num + 1} 页... ({processed_count}/{total_count})',
+                    'progress': 20 + (processed_count * 70 // total_count),
+                    'page_number': page_num + 1
                 }
-                
-                # 保存到Flask缓存
-                cache.set(cache_key, cache_data)
-                logger.info(f"已保存处理结果到Flask缓存: {cache_key}")
-                
-                # 保存到文件缓存
-                cache_dir = os.path.join(app.config['PASSPORTS_FOLDER'], 'cache')
-                os.makedirs(cache_dir, exist_ok=True)
-                cache_file = os.path.join(cache_dir, f"{file_hash}_processed.json")
-                
-                with open(cache_file, 'w', encoding='utf-8') as f:
-                    json.dump(cache_data, f, ensure_ascii=False, indent=2)
-                logger.info(f"已保存处理结果到文件缓存: {cache_file}")
-                
-                yield json.dumps({
-                    'status': '处理完成',
-                    'progress': 100,
-                    'passport_data_list': passport_data_list,
-                    'valid_pages': valid_pages
-                }) + '\n'
-                
-            except Exception as e:
-                logger.error(f'预处理失败: {str(e)}', exc_info=True)
-                yield json.dumps({
-                    'status': '处理失败',
+                if passport_data:
+                    passport_data_list.append(passport_data)
+                    valid_pages.append(page_num + 1)
+                    event['passport_data'] = passport_data
+                return event
+            
+            # 本地得到结果的页面立即返回，其余页面按完成顺序返回
+            for page_num in sorted(resolved_results):
+                yield page_event(page_num, resolved_results[page_num])
+            
+            for future in as_completed(future_pages):
+                page_num = future_pages[future]
+                try:
+                    passport_data = future.result()
+                except Exception as e:
+                    # 重试后仍然失败的页面单独记录，不再被当作非护照页
+                    logger.error(f'处理第 {page_num + 1} 页时出错: {str(e)}')
+                    failed_pages.append(page_num + 1)
+                    passport_data = None
+                yield page_event(page_num, passport_data)
+            
+            # 最终结果按页码排序
+            passport_data_list.sort(key=lambda p: p['page_number'])
+            valid_pages.sort()
+            failed_pages.sort()
+            
+            if failed_pages:
+                logger.warning(f"{len(failed_pages)} 页处理失败: {failed_pages}")
+            
+            if not passport_data_list:
+                yield {
+                    'status': '未能提取到有效的护照信息',
                     'progress': 100,
-                    'error': str(e)
-                }) + '\n'
+                    'error': '未能从任何页面提取到完整的护照信息'
+                }
+                return
+            
+            # 保存处理结果到缓存
+            cache_data = {
+                'file_hash': file_hash,
+                'passport_data_list': passport_data_list,
+                'total_pages': total_pages,
+                'valid_pages': valid_pages,
+                'failed_pages': failed_pages,
+                'processed_time': time.strftime('%Y-%m-%d %H:%M:%S')
+            }
+            
+            cache_manager.set('pdf_processed', file_hash, cache_data)
+            logger.info(f"已保存处理结果到缓存: {file_hash}")
+            
+            yield {
+                'status': f'处理完成，{len(failed_pages)} 页处理失败' if failed_pages else '处理完成',
+                'progress': 100,
+                'passport_data_list': passport_data_list,
+                'valid_pages': valid_pages,
+                'failed_pages': failed_pages
+            }
+            
+        except Exception as e:
+            logger.error(f'预处理失败: {str(e)}', exc_info=True)
+            yield {
+                'status': '处理失败',
+                'progress': 100,
+                'error': str(e)
+            }
+
+def submit_preprocess_job(filename, force_reprocess=False):
+    """提交护照预处理任务，命中缓存时同步完成，返回任务ID
+
+    同一文件的预处理任务正在运行时（包括其他 worker 提交的），返回该任务的ID，不重复处理。
+    """
+    filepath = os.path.join(app.config['PASSPORTS_FOLDER'], filename)
+    
+    # 提取文件哈希值（从文件名中获取）
+    file_hash = filename.split('.')[0]
+    params = {'pdf_filename': filename, 'force_reprocess': force_reprocess}
+    
+    cached_data = None if force_reprocess else load_processed_cache(file_hash)
+    if cached_data:
+        return job_manager.run('passport', cached_passport_events, cached_data, params=params)
+    
+    return job_manager.submit('passport', preprocess_passport_events, filepath, file_hash, force_reprocess,
+                              params=params, dedupe_key=file_hash)
+
+def get_preprocess_request():
+    """解析预处理请求参数，返回 (文件名, 是否强制重新处理, 错误响应)"""
+    data = request.get_json(silent=True)
+    if not data or 'pdf_filename' not in data:
+        return None, False, (jsonify({'error': '缺少文件名'}), 400)
+    
+    filename = secure_filename(data['pdf_filename'])
+    if not filename or not os.path.exists(os.path.join(app.config['PASSPORTS_FOLDER'], filename)):
+        return None, False, (jsonify({'error': '文件不存在'}), 404)
+    
+    # 是否强制重新处理，忽略缓存
+    return filename, data.get('force_reprocess', False), None
+
+@app.route('/preprocess/passport', methods=['POST'])
+def preprocess_passport():
+    """提交预处理任务并以流式响应返回进度（客户端断开不会中断任务）
+
+    流式响应在处理期间一直占用一个 worker，前端改用 /jobs/passport 提交后轮询事件，
+    该接口保留用于兼容。
+    """
+    try:
+        filename, force_reprocess, error_response = get_preprocess_request()
+        if error_response:
+            return error_response
+        
+        job_id = submit_preprocess_job(filename, force_reprocess)
         
         return app.response_class(
-            generate(),
+            job_manager.iter_events(job_id),
             mimetype='text/event-stream'
         )
         
@@ -361,8 +570,177 @@ def preprocess_passport():
         logger.error(f'预处理失败: {str(e)}', exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+@app.route('/jobs/passport', methods=['POST'])
+def submit_passport_job():
+    """提交护照预处理后台任务，立即返回任务ID"""
+    try:
+        filename, force_reprocess, error_response = get_preprocess_request()
+        if error_response:
+            return error_response
+        
+        job_id = submit_preprocess_job(filename, force_reprocess)
+        
+        return jsonify({
+            'message': '任务已提交',
+            'job_id': job_id,
+            'job': job_manager.get(job_id)
+        }), 202
+        
+    except Exception as e:
+        logger.error(f'提交预处理任务失败: {str(e)}', exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """查询任务状态，任务完成后包含处理结果"""
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({'error': '任务不存在'}), 404
+    
+    if job_manager.is_stale(job):
+        job['state'] = 'failed'
+        job['error'] = '任务长时间无响应，请重新提交'
+    
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """订阅任务进度事件流
+
+    带 offset 参数时立即返回该位置之后的事件（轮询），不会长时间占用 worker；
+    否则以流式响应持续返回事件直到任务结束。
+    """
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({'error': '任务不存在'}), 404
+    
+    if 'offset' not in request.args:
+        return app.response_class(
+            job_manager.iter_events(job_id),
+            mimetype='text/event-stream'
+        )
+    
+    offset = request.args.get('offset', 0, type=int)
+    if offset < 0:
+        return jsonify({'error': 'offset 无效'}), 400
+    
+    # 先读取状态再读取日志，任务已结束时返回的事件是完整的
+    events, offset = job_manager.read_events(job_id, offset)
+    finished = job.get('state') in FINISHED_STATES
+    if not finished and job_manager.is_stale(job):
+        events.append(job_manager.stale_event(job_id))
+        finished = True
+    
+    return jsonify({
+        'job_id': job_id,
+        'state': job.get('state'),
+        'events': events,
+        'offset': offset,
+        'finished': finished
+    })
+
+def save_photo(open_stream, original_name):
+    """将单张照片流式写入照片目录并返回处理结果
+
+    先写入临时文件再原子重命名；同名文件内容相同（哈希一致）时不重复写入。
+    """
+    filename = secure_filename(os.path.basename(original_name))
+    result = {'file': original_name, 'filename': filename}
+    if not filename:
+        result.update(status='error', error=f"文件 {original_name} 文件名无效")
+        return result
+
+    # 临时文件写入子目录，不改变照片目录的修改时间，照片索引可以判断目录是否被其他 worker 修改
+    tmp_dir = os.path.join(app.config['PHOTOS_FOLDER'], '.uploads')
+    tmp_path = os.path.join(tmp_dir, f"{uuid.uuid4().hex}_{filename}")
+    try:
+        os.makedirs(tmp_dir, exist_ok=True)
+        with open_stream() as stream:
+            file_hash, _ = save_stream(stream, tmp_path)
+
+        filepath = os.path.join(app.config['PHOTOS_FOLDER'], filename)
+        if os.path.exists(filepath) and hash_file(filepath) == file_hash:
+            os.remove(tmp_path)
+            result['status'] = 'duplicate'
+        else:
+            previous_signature = photo_index.dir_signature()
+            os.replace(tmp_path, filepath)
+            record_hash(filepath, file_hash)
+            photo_index.add(filename, previous_signature)
+            result['status'] = 'saved'
+        result['hash'] = file_hash
+    except Exception as e:
+        app.logger.error(f'保存照片失败: {original_name}, 错误: {str(e)}')
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        result.update(status='error', error=f"文件 {original_name} 上传失败: {str(e)}")
+    return result
+
+def collect_photo_uploads(files):
+    """展开上传的照片和 zip 压缩包
+
+    返回 (待保存的 (文件名, 打开文件流的函数) 列表, 校验失败的结果列表)
+    """
+    photo_limit = app.config['MAX_FILE_SIZE']['photo']
+    size_error = f"超过大小限制 {photo_limit // (1024 * 1024)}MB"
+    uploads = []
+    rejected = []
+
+    for file in files:
+        if not file.filename:
+            continue
+
+        if allowed_file(file.filename, 'photo_archive'):
+            if not check_file_size(file, 'photo_archive'):
+                rejected.append({'file': file.filename, 'status': 'error',
+                                 'error': f"压缩包 {file.filename} 超过大小限制"})
+                continue
+            try:
+                archive = zipfile.ZipFile(file.stream)
+            except zipfile.BadZipFile:
+                rejected.append({'file': file.filename, 'status': 'error',
+                                 'error': f"压缩包 {file.filename} 无法解压"})
+                continue
+
+            for info in archive.infolist():
+                name = os.path.basename(info.filename)
+                # 跳过目录和 macOS 生成的附加文件
+                if info.is_dir() or not name or name.startswith('.') or info.filename.startswith('__MACOSX/'):
+                    continue
+                if not allowed_file(name, 'photo'):
+                    rejected.append({'file': name, 'status': 'error', 'error': f"文件 {name} 类型不支持"})
+                elif info.file_size > photo_limit:
+                    rejected.append({'file': name, 'status': 'error', 'error': f"文件 {name} {size_error}"})
+                else:
+                    uploads.append((name, lambda archive=archive, info=info: archive.open(info)))
+            continue
+
+        if not allowed_file(file.filename, 'photo'):
+            rejected.append({'file': file.filename, 'status': 'error', 'error': f"文件 {file.filename} 类型不支持"})
+        elif not check_file_size(file, 'photo'):
+            rejected.append({'file': file.filename, 'status': 'error', 'error': f"文件 {file.filename} {size_error}"})
+        else:
+            uploads.append((file.filename, lambda file=file: file.stream))
+
+    return uploads, rejected
+
+def summarize_photo_results(results):
+    """汇总照片上传结果，保持原有的响应格式"""
+    uploaded_files = [r['filename'] for r in results if r['status'] in ('saved', 'duplicate')]
+    errors = [r['error'] for r in results if r['status'] == 'error']
+    return {
+        'message': f'成功上传 {len(uploaded_files)} 个文件',
+        'uploaded_files': uploaded_files,
+        'duplicate_files': [r['filename'] for r in results if r['status'] == 'duplicate'],
+        'errors': errors if errors else None
+    }
+
 @app.route('/upload/photos', methods=['POST'])
 def upload_photos():
+    """批量上传照片（支持 zip 压缩包），多个文件并发写入
+
+    请求参数 stream=1 时以流式响应逐个返回每个文件的结果，最后返回汇总。
+    """
     try:
         if 'files[]' not in request.files:
             return jsonify({'error': '没有文件上传'}), 400
@@ -371,65 +749,36 @@ def upload_photos():
         if not files or all(not f.filename for f in files):
             return jsonify({'error': '没有选择文件'}), 400
         
-        uploaded_files = []
-        errors = []
-        total_size = 0
-        
-        # 首先检查所有文件的总大小
-        for file in files:
-            if not file.filename:
-                continue
-            file.seek(0, os.SEEK_END)
-            total_size += file.tell()
-            file.seek(0)
-        
-        if total_size > app.config['MAX_CONTENT_LENGTH']:
-            return jsonify({
-                'error': f'文件总大小超过限制，最大允许 {app.config["MAX_CONTENT_LENGTH"] // (1024 * 1024)}MB'
-            }), 413
-        
         # 确保上传目录存在
         os.makedirs(app.config['PHOTOS_FOLDER'], exist_ok=True)
         
-        for file in files:
-            if not file.filename:
-                continue
-                
-            if not allowed_file(file.filename, 'photo'):
-                errors.append(f"文件 {file.filename} 类型不支持")
-                continue
+        uploads, rejected = collect_photo_uploads(files)
+        futures = [photo_executor.submit(save_photo, open_stream, name) for name, open_stream in uploads]
+        total = len(futures) + len(rejected)
+        
+        if request.args.get('stream') == '1':
+            def generate():
+                results = []
+                for result in itertools.chain(rejected, (future.result() for future in as_completed(futures))):
+                    results.append(result)
+                    yield json.dumps(dict(result, progress=int(len(results) * 100 / total)), ensure_ascii=False) + '\n'
+                yield json.dumps(dict(summarize_photo_results(results), progress=100), ensure_ascii=False) + '\n'
             
-            if not check_file_size(file, 'photo'):
-                errors.append(f"文件 {file.filename} 超过大小限制 {app.config['MAX_FILE_SIZE']['photo'] // (1024 * 1024)}MB")
-                continue
-                
-            try:
-                # 直接使用原始文件名，只清理不安全的字符
-                filename = secure_filename(os.path.basename(file.filename))
-                filepath = os.path.join(app.config['PHOTOS_FOLDER'], filename)
-                
-                # 如果文件已存在，先删除它
-                if os.path.exists(filepath):
-                    os.remove(filepath)
-                
-                file.save(filepath)
-                uploaded_files.append(filename)
-                app.logger.debug(f'成功保存照片: {filename} -> {filepath}')
-            except Exception as e:
-                app.logger.error(f'保存照片失败: {filename}, 错误: {str(e)}')
-                errors.append(f"文件 {file.filename} 上传失败: {str(e)}")
+            # 请求上下文保持到所有文件写入完成，上传的临时文件才不会被提前关闭
+            return app.response_class(stream_with_context(generate()), mimetype='text/event-stream')
         
-        if not uploaded_files and errors:
+        results = [future.result() for future in futures] + rejected
+        summary = summarize_photo_results(results)
+        summary['results'] = results
+        app.logger.info(f"照片上传完成: {summary['message']}, 内容未变化 {len(summary['duplicate_files'])} 个")
+        
+        if not summary['uploaded_files'] and summary['errors']:
             return jsonify({
                 'error': '所有文件上传失败',
-                'details': errors
+                'details': summary['errors']
             }), 400
             
-        return jsonify({
-            'message': f'成功上传 {len(uploaded_files)} 个文件',
-            'uploaded_files': uploaded_files,
-            'errors': errors if errors else None
-        })
+        return jsonify(summary)
     except Exception as e:
         app.logger.error(f'照片上传过程发生错误: {str(e)}')
         return jsonify({
@@ -452,8 +801,14 @@ def get_request_cache_key():
     
     return f"{method}:{path}:{args_hash}:{data_hash}"
 
+def get_compare_cache_key():
+    """比较结果的缓存键：请求内容 + 当前CSV文件的哈希值（重新上传CSV后不会命中旧结果）"""
+    csv_path = os.path.join(app.config['CSV_FOLDER'], 'current.csv')
+    csv_hash = hash_file(csv_path) if os.path.exists(csv_path) else ''
+    return f"compare:{get_request_cache_key()}:{csv_hash}"
+
 @app.route('/api/compare', methods=['POST'])
-@cache.memoize(timeout=60 * 30)  # 缓存30分钟
+@cache.cached(timeout=60 * 30, make_cache_key=get_compare_cache_key)  # 缓存30分钟
 def compare_data():
     try:
         data = request.json
@@ -463,41 +818,248 @@ def compare_data():
         csv_index = data.get('csv_index')
         passport_data = data.get('passport_data')
         
-        if csv_index is None or passport_data is None:
+        if not isinstance(passport_data, dict):
             return jsonify({'error': '缺少必要的比较数据'}), 400
         
-        csv_handler = CSVHandler(os.path.join(app.config['CSV_FOLDER'], 'current.csv'), cache=cache)
+        csv_handler = create_csv_handler(os.path.join(app.config['CSV_FOLDER'], 'current.csv'))
+        # 未指定行号时按护照号码（或姓名和出生日期）通过索引查找对应的记录
+        if csv_index is None:
+            csv_index = csv_handler.find_row(passport_data)
+            if csv_index is None:
+                return jsonify({'error': '未找到对应的CSV记录'}), 404
         comparison_result = csv_handler.compare_with_passport_data(csv_index, passport_data)
         
         return jsonify({
             'message': '数据比较完成',
+            'csv_index': csv_index,
             'result': comparison_result
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def resolve_csv_filename(requested='current.csv'):
+    """确定要使用的CSV文件：优先指定文件，其次 current.csv，最后任一CSV文件"""
+    csv_files = [f for f in os.listdir(app.config['CSV_FOLDER']) if f.endswith('.csv')]
+    if not csv_files:
+        return None
+    if requested in csv_files:
+        return requested
+    if 'current.csv' in csv_files:
+        return 'current.csv'
+    return csv_files[0]
+
+@app.route('/api/reconcile', methods=['POST'])
+def reconcile_data():
+    """批量比对整份CSV与护照数据，一次返回所有记录的匹配和差异报告"""
+    try:
+        data = request.json or {}
+
+        # 护照数据可以直接提交，也可以指定已预处理的PDF文件
+        passport_data_list = data.get('passport_data_list')
+        if passport_data_list is None and data.get('filename'):
+            filepath = os.path.join(app.config['PASSPORTS_FOLDER'], secure_filename(data['filename']))
+            if not os.path.exists(filepath):
+                return jsonify({'error': '文件不存在'}), 404
+            cached_data = load_processed_cache(hash_file(filepath))
+            if not cached_data:
+                return jsonify({'error': '该PDF尚未预处理'}), 409
+            passport_data_list = cached_data['passport_data_list']
+
+        if not isinstance(passport_data_list, list):
+            return jsonify({'error': '缺少护照数据'}), 400
+
+        csv_filename = resolve_csv_filename(data.get('csv_file', 'current.csv'))
+        if not csv_filename:
+            return jsonify({'error': '未找到CSV文件'}), 404
+
+        csv_handler = create_csv_handler(os.path.join(app.config['CSV_FOLDER'], csv_filename))
+        report = csv_handler.reconcile_passports(passport_data_list)
+
+        return jsonify({
+            'message': '批量比对完成',
+            'file': csv_filename,
+            **report
+        })
+    except Exception as e:
+        logger.error(f"批量比对失败: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+def send_upload_file(path, etag, max_age, immutable=False, mimetype=None):
+    """发送 uploads 目录中的文件，使用强 ETag 并支持条件请求和 Range 请求
+
+    开启 USE_X_ACCEL_REDIRECT 时只返回响应头，由 nginx 发送文件内容。
+    """
+    mimetype = mimetype or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    upload_folder = os.path.abspath(app.config['UPLOAD_FOLDER'])
+    relative_path = os.path.relpath(os.path.abspath(path), upload_folder)
+    
+    if app.config['USE_X_ACCEL_REDIRECT'] and not relative_path.startswith('..'):
+        response = app.response_class(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = app.config['X_ACCEL_PREFIX'] + quote(relative_path.replace(os.sep, '/'))
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+        # 条件请求在这里处理，命中时直接返回 304，不再转给 nginx
+        response = response.make_conditional(request)
+        if response.status_code == 304:
+            del response.headers['X-Accel-Redirect']
+    else:
+        response = send_file(path, mimetype=mimetype, etag=etag, conditional=True, max_age=max_age)
+    
+    if immutable:
+        response.cache_control.immutable = True
+    return response
+
 @app.route('/uploads/photos/<filename>')
 def photo_file(filename):
-    # 添加调试日志
-    app.logger.debug(f'请求照片文件: {filename}')
-    app.logger.debug(f'照片文件夹路径: {app.config["PHOTOS_FOLDER"]}')
-    full_path = os.path.join(app.config['PHOTOS_FOLDER'], filename)
-    app.logger.debug(f'完整文件路径: {full_path}')
-    app.logger.debug(f'文件是否存在: {os.path.exists(full_path)}')
-    
-    if not os.path.exists(full_path):
-        app.logger.error(f'照片文件不存在: {full_path}')
+    """返回证件照；带 size 参数（如 ?size=thumb）时返回缓存的缩略图"""
+    full_path = safe_join(app.config['PHOTOS_FOLDER'], filename)
+    if not full_path or not os.path.isfile(full_path):
+        app.logger.error(f'照片文件不存在: {filename}')
         return jsonify({'error': '照片文件不存在'}), 404
         
     try:
-        return send_from_directory(app.config['PHOTOS_FOLDER'], filename)
+        size = request.args.get('size')
+        if size:
+            fmt = photo_derivatives.choose_format(request.headers.get('Accept'))
+            path, etag, mimetype = photo_derivatives.get(full_path, size, fmt)
+            response = send_upload_file(path, etag, app.config['PHOTO_CACHE_MAX_AGE'], mimetype=mimetype)
+            # 同一地址按 Accept 返回不同格式
+            response.vary.add('Accept')
+            return response
+        
+        return send_upload_file(full_path, hash_file(full_path), app.config['PHOTO_CACHE_MAX_AGE'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         app.logger.error(f'发送文件失败: {str(e)}')
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/photos/prewarm', methods=['POST'])
+def prewarm_photos():
+    """为CSV中所有记录的证件照预先生成缩略图"""
+    try:
+        data = request.get_json(silent=True) or {}
+        csv_filename = resolve_csv_filename(data.get('csv_file', 'current.csv'))
+        if not csv_filename:
+            return jsonify({'error': '未找到CSV文件'}), 404
+        
+        sizes = data.get('sizes') or list(app.config['PHOTO_SIZES'])
+        invalid_sizes = [size for size in sizes if size not in app.config['PHOTO_SIZES']]
+        if invalid_sizes:
+            return jsonify({'error': f'不支持的图片尺寸: {", ".join(map(str, invalid_sizes))}'}), 400
+        # 浏览器都支持 WebP，默认只生成页面实际会请求的格式
+        fmt = photo_derivatives.choose_format('image/webp')
+        
+        records = create_csv_handler(os.path.join(app.config['CSV_FOLDER'], csv_filename)).to_json()
+        photo_paths = []
+        missing = []
+        for photo_filename in dict.fromkeys(r['photo_filename'] for r in records if r['photo_filename']):
+            path = safe_join(app.config['PHOTOS_FOLDER'], photo_filename)
+            if path and os.path.isfile(path):
+                photo_paths.append(path)
+            else:
+                missing.append(photo_filename)
+        
+        futures = [
+            photo_executor.submit(photo_derivatives.get, path, size, fmt)
+            for path in photo_paths for size in sizes
+        ]
+        failed = 0
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                failed += 1
+                app.logger.warning(f'生成缩略图失败: {str(e)}')
+        
+        return jsonify({
+            'message': f'已为 {len(photo_paths)} 张照片生成缩略图',
+            'file': csv_filename,
+            'photos': len(photo_paths),
+            'missing_photos': missing,
+            'failed': failed
+        })
+    except Exception as e:
+        logger.error(f"生成缩略图失败: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+def parse_render_params(args):
+    """解析页面渲染参数，取整以限制缓存的图片数量：
+    缩放比例按 0.25 取整；裁剪区域为 x0,y0,x1,y1 比例，按 PAGE_RENDER_CLIP_STEP 向外取整（只会略微扩大裁剪范围）
+    """
+    zoom = float(args.get('zoom', 1.0))
+    if not math.isfinite(zoom):
+        raise ValueError('缩放比例必须是有限数值')
+    zoom = min(max(round(zoom * 4) / 4, 0.25), app.config['PAGE_RENDER_MAX_ZOOM'])
+    
+    clip = None
+    if args.get('clip'):
+        values = [float(v) for v in args['clip'].split(',')]
+        if len(values) != 4 or not all(math.isfinite(v) for v in values):
+            raise ValueError('裁剪区域格式应为 x0,y0,x1,y1，取值范围 0-1')
+        steps = round(1 / app.config['PAGE_RENDER_CLIP_STEP'])
+        x0, y0 = (math.floor(v * steps + 1e-9) / steps for v in values[:2])
+        x1, y1 = (math.ceil(v * steps - 1e-9) / steps for v in values[2:])
+        clip = (x0, y0, x1, y1)
+        if not (0 <= x0 < x1 <= 1 and 0 <= y0 < y1 <= 1):
+            raise ValueError('裁剪区域格式应为 x0,y0,x1,y1，取值范围 0-1')
+    return zoom, clip
+
+def render_passport_page(filepath, page_number, zoom, clip=None):
+    """渲染PDF单页并缓存到磁盘，返回 (图片路径, 缓存名称)；page_number 从0开始"""
+    pdf_handler = create_pdf_handler(filepath, lazy=True)
+    clip_key = 'full' if not clip else '_'.join(f'{v:g}' for v in clip)
+    render_name = f"{pdf_handler.file_hash}_p{page_number + 1}_z{zoom:g}_{clip_key}"
+    render_path = os.path.join(app.config['PAGE_RENDER_FOLDER'], f"{render_name}.jpg")
+    
+    if os.path.exists(render_path):
+        page_render_quota.touch(render_path)
+    else:
+        image = pdf_handler.render_page(page_number, zoom, clip, quality=app.config['PAGE_RENDER_QUALITY'])
+        os.makedirs(app.config['PAGE_RENDER_FOLDER'], exist_ok=True)
+        tmp_path = f"{render_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(image)
+        os.replace(tmp_path, render_path)
+        page_render_quota.record_write(len(image))
+        logger.debug(f"已渲染第 {page_number + 1} 页: {render_path}")
+    
+    return render_path, render_name
+
+@app.route('/api/passport_page/<filename>/<int:page_number>', methods=['GET'])
+def passport_page_image(filename, page_number):
+    """返回PDF单页的图片（页码从1开始），浏览器无需下载整个PDF"""
+    try:
+        filepath = os.path.join(app.config['PASSPORTS_FOLDER'], secure_filename(filename))
+        if not os.path.exists(filepath):
+            return jsonify({'error': '文件不存在'}), 404
+        
+        zoom, clip = parse_render_params(request.args)
+        render_path, render_name = render_passport_page(filepath, page_number - 1, zoom, clip)
+        
+        # 文件以内容哈希命名，同一地址的图片不会变化
+        return send_upload_file(render_path, render_name, app.config['IMMUTABLE_MAX_AGE'],
+                                immutable=True, mimetype='image/jpeg')
+    except IndexError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"渲染PDF页面失败: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/uploads/passports/<filename>')
 def passport_file(filename):
-    return send_from_directory(app.config['PASSPORTS_FOLDER'], filename)
+    """返回护照PDF，支持 Range 请求以便分段加载"""
+    filepath = safe_join(app.config['PASSPORTS_FOLDER'], filename)
+    if not filepath or not os.path.isfile(filepath):
+        return jsonify({'error': '文件不存在'}), 404
+    
+    # 上传的PDF以内容哈希命名，内容不会变化，可以长期缓存
+    if re.fullmatch(r'[0-9a-f]{64}\.pdf', filename):
+        return send_upload_file(filepath, filename[:-4], app.config['IMMUTABLE_MAX_AGE'], immutable=True)
+    return send_upload_file(filepath, hash_file(filepath), 0)
 
 @app.route('/recheck/errors', methods=['POST'])
 def recheck_errors():
@@ -512,9 +1074,9 @@ def recheck_errors():
         if not os.path.exists(os.path.join(app.config['PASSPORTS_FOLDER'], pdf_filename)):
             return jsonify({'error': 'PDF文件不存在'}), 404
 
-        # 初始化处理器
-        pdf_handler = PDFHandler(os.path.join(app.config['PASSPORTS_FOLDER'], pdf_filename), cache=cache)
-        coze_handler = CozeHandler(app.config['COZE_API_KEY'], app.config['COZE_BOT_ID'])
+        # 初始化处理器（按需模式，只提取需要复核的页面）
+        pdf_handler = create_pdf_handler(os.path.join(app.config['PASSPORTS_FOLDER'], pdf_filename), lazy=True)
+        coze_handler = create_coze_handler()
         
         updated_records = []
         
@@ -525,15 +1087,16 @@ def recheck_errors():
                     # 对于已找到护照首页的记录,使用指定页面
                     page_text = pdf_handler.get_text(record['page_number'] - 1)  # PDF页码从0开始
                 else:
-                    # 对于未找到护照首页的记录,遍历所有页面寻找匹配
+                    # 对于未找到护照首页的记录,通过文档索引查找匹配的页面
                     page_text = None
-                    for page_num in range(pdf_handler.get_page_count()):
-                        text = pdf_handler.get_text(page_num)
-                        # 检查文本中是否包含护照号码
-                        if record['passport_number'] in text:
-                            page_text = text
-                            record['page_number'] = page_num + 1  # 转换为1开始的页码
-                            break
+                    pages = pdf_handler.find_pages(
+                        record.get('passport_number'),
+                        record.get('surname'),
+                        record.get('given_name')
+                    )
+                    if pages:
+                        page_text = pdf_handler.get_text(pages[0])
+                        record['page_number'] = pages[0] + 1  # 转换为1开始的页码
                 
                 if page_text:
                     # 使用 Coze API 重新识别护照信息
@@ -543,18 +1106,19 @@ def recheck_errors():
                         passport_data['page_number'] = record['page_number']
                         updated_records.append(passport_data)
                         
-                        # 更新缓存
-                        cache_key = f"passport_data_{pdf_filename}"
-                        cached_data = cache.get(cache_key)
+                        # 更新整份PDF的处理结果缓存（缓存中的对象不能直接修改，先复制）
+                        cached_data = cache_manager.get('pdf_processed', pdf_handler.file_hash, None)
                         if cached_data:
+                            passport_data_list = list(cached_data['passport_data_list'])
                             # 更新或添加新记录
-                            index = next((i for i, p in enumerate(cached_data['passport_data_list']) 
+                            index = next((i for i, p in enumerate(passport_data_list) 
                                         if p['passport_number'] == passport_data['passport_number']), -1)
                             if index != -1:
-                                cached_data['passport_data_list'][index] = passport_data
+                                passport_data_list[index] = passport_data
                             else:
-                                cached_data['passport_data_list'].append(passport_data)
-                            cache.set(cache_key, cached_data)
+                                passport_data_list.append(passport_data)
+                            cache_manager.set('pdf_processed', pdf_handler.file_hash,
+                                              dict(cached_data, passport_data_list=passport_data_list))
             except Exception as e:
                 logger.error(f"处理记录时出错: {str(e)}", exc_info=True)
                 continue
@@ -576,7 +1140,7 @@ def get_passport_data(filename):
         if not os.path.exists(filepath):
             return jsonify({'error': '文件不存在'}), 404
             
-        pdf_handler = PDFHandler(filepath, cache=cache)
+        pdf_handler = create_pdf_handler(filepath)
         passport_data = pdf_handler.extract_passport_data()
         
         return jsonify({
@@ -593,19 +1157,12 @@ def get_acceptance_numbers():
     """获取所有受理号列表，用于前期核对"""
     try:
         # 获取CSV文件路径
-        csv_files = [f for f in os.listdir(app.config['CSV_FOLDER']) if f.endswith('.csv')]
-        if not csv_files:
+        current_csv = resolve_csv_filename(request.args.get('file', 'current.csv'))
+        if not current_csv:
             return jsonify({'error': '未找到CSV文件'}), 404
             
-        # 使用最新的CSV文件或指定文件
-        current_csv = request.args.get('file', 'current.csv')
-        if current_csv not in csv_files and 'current.csv' in csv_files:
-            current_csv = 'current.csv'
-        elif current_csv not in csv_files and csv_files:
-            current_csv = csv_files[0]
-            
         csv_path = os.path.join(app.config['CSV_FOLDER'], current_csv)
-        csv_handler = CSVHandler(csv_path, cache=cache)
+        csv_handler = create_csv_handler(csv_path)
         
         # 获取所有记录
         records = csv_handler.to_json()
@@ -666,7 +1223,21 @@ def clear_cache():
                 logger.info(f"已从{dir_path}中删除 {files_removed} 个文件")
         
         # 3. 清除所有缓存目录
+        files_removed = cache_manager.clear()
+        handler_registry.clear()
+        if files_removed > 0:
+            cleared_items.append(f"数据缓存({files_removed}个文件)")
+        logger.info(f"已清除数据缓存: {files_removed} 个文件")
+        
+        # 只删除已结束的任务记录，运行中的任务和任务锁文件保留
+        files_removed = job_manager.clear_finished()
+        if files_removed > 0:
+            cleared_items.append(f"任务记录({files_removed}个文件)")
+        logger.info(f"已清除任务记录: {files_removed} 个文件")
+        
         cache_dirs = [
+            app.config['PHOTO_CACHE_FOLDER'],                       # 照片缩略图目录
+            app.config['PAGE_RENDER_FOLDER'],                       # PDF单页图片目录
             os.path.join(app.config['PASSPORTS_FOLDER'], 'cache'),  # 护照缓存目录
             os.path.join(app.config['BASE_DIR'], 'cache'),          # 基础缓存目录
             os.path.join(app.config['BASE_DIR'], 'uploads/cache')   # uploads缓存目录
@@ -697,6 +1268,9 @@ def clear_cache():
                 except Exception as e:
                     logger.error(f"删除空缓存目录失败: {cache_dir}, 错误: {str(e)}")
         
+        # 后续写入需要的目录
+        os.makedirs(app.config['PHOTO_CACHE_FOLDER'], exist_ok=True)
+        
         # 4. 清除日志目录
         logs_dir = os.path.join(app.config['BASE_DIR'], 'logs')
         if os.path.exists(logs_dir):
@@ -741,38 +1315,11 @@ def check_cache():
             
         filename = data['pdf_filename']
         file_hash = filename.split('.')[0]  # 从文件名中提取哈希值
+        if not re.fullmatch(r'[0-9a-f]{64}', file_hash):
+            return jsonify({'success': True, 'has_cache': False})
         
         # 检查是否存在有效的缓存
-        has_cache = False
-        
-        # 1. 检查Flask缓存
-        cache_key = f"pdf_processed_{file_hash}"
-        if cache.has(cache_key):
-            cached_data = cache.get(cache_key)
-            if cached_data and 'passport_data_list' in cached_data:
-                has_cache = True
-                logger.info(f"在Flask缓存中找到数据: {cache_key}")
-        
-        # 2. 如果Flask缓存不存在，检查文件系统缓存
-        if not has_cache:
-            cache_dir = os.path.join(app.config['PASSPORTS_FOLDER'], 'cache')
-            cache_file = os.path.join(cache_dir, f"{file_hash}_processed.json")
-            
-            if os.path.exists(cache_file):
-                try:
-                    with open(cache_file, 'r', encoding='utf-8') as f:
-                        cached_data = json.load(f)
-                        if cached_data and 'passport_data_list' in cached_data:
-                            has_cache = True
-                            logger.info(f"在文件系统缓存中找到数据: {cache_file}")
-                except Exception as e:
-                    logger.error(f"读取缓存文件失败: {str(e)}")
-                    # 如果缓存文件损坏，删除它
-                    try:
-                        os.remove(cache_file)
-                        logger.info(f"已删除损坏的缓存文件: {cache_file}")
-                    except:
-                        pass
+        has_cache = load_processed_cache(file_hash) is not None
         
         return jsonify({
             'success': True,
@@ -0,0 +1,121 @@
+import os
+import csv
+import random
+import string
+from typing import Dict, List, Optional
+import fitz  # PyMuPDF
+from PIL import Image, ImageDraw
+from utils.mrz_parser import compute_check_digit
+
+# 生成拼音姓名使用的音节
+SYLLABLES = ['ZHANG', 'WANG', 'LI', 'ZHAO', 'CHEN', 'LIU', 'YANG', 'HUANG', 'ZHOU', 'WU',
+             'XU', 'SUN', 'MA', 'ZHU', 'HU', 'GUO', 'HE', 'LIN', 'LUO', 'GAO',
+             'MING', 'HUA', 'JUN', 'WEI', 'FANG', 'LEI', 'TAO', 'YAN', 'PING', 'XIN']
+
+# 护照页面文本中的字段标签，模拟 Coze 服务按这些标签提取字段
+PAGE_LABELS = {
+    'passport_number': 'Passport No',
+    'surname': 'Surname',
+    'given_name': 'Given names',
+    'gender': 'Sex',
+    'birth_date': 'Date of birth',
+    'expiry_date': 'Date of expiry'
+}
+
+
+def generate_people(count: int, seed: int = 0) -> List[Dict[str, str]]:
+    """生成随机的申请人信息，护照号码不重复"""
+    rng = random.Random(seed)
+    people = []
+    for i in range(count):
+        prefix = rng.choice(['EA', 'EB', 'EC', 'ED', 'EE'])
+        people.append({
+            'passport_number': f"{prefix}{i:07d}",
+            'surname': rng.choice(SYLLABLES),
+            'given_name': rng.choice(SYLLABLES) + (rng.choice(SYLLABLES) if rng.random() < 0.5 else ''),
+            'gender': rng.choice('MF'),
+            'birth_date': f"{rng.randint(1950, 2015)}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}",
+            'expiry_date': f"{rng.randint(2026, 2036)}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}",
+            'photo_filename': f"{prefix}{i:07d}.jpg"
+        })
+    return people
+
+
+def write_csv(path: str, people: List[Dict[str, str]], missing_date_ratio: float = 0.0,
+              seed: int = 0) -> str:
+    """按业务 CSV 的列顺序（无表头，23 列）写入申请人数据
+
+    missing_date_ratio 为出生日期留空的比例，用于覆盖含空值的列。
+    """
+    rng = random.Random(seed)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        for i, person in enumerate(people, 1):
+            birth_date = '' if rng.random() < missing_date_ratio else person['birth_date']
+            writer.writerow([
+                i, 'Y', person['passport_number'], person['expiry_date'],
+                person['surname'], person['given_name'], person['gender'], birth_date,
+                'CHN', '', '', '', '', person['photo_filename'], f"B{i // 500 + 1}", '',
+                'T', '30', 'C', 'V', '', '', ''
+            ])
+    return path
+
+
+def _mrz_lines(person: Dict[str, str]) -> List[str]:
+    """生成校验位正确的 TD3 机读区两行"""
+    number = person['passport_number'].ljust(9, '<')
+    birth_date = person['birth_date'][2:]
+    expiry_date = person['expiry_date'][2:]
+    first = f"P<CHN{person['surname']}<<{person['given_name']}".ljust(44, '<')[:44]
+    body = (number + compute_check_digit(number) + 'CHN' + birth_date + compute_check_digit(birth_date)
+            + person['gender'] + expiry_date + compute_check_digit(expiry_date))
+    personal = '<' * 14
+    second = body + personal + compute_check_digit(personal)
+    composite = second[0:10] + second[13:20] + second[21:43]
+    return [first, second + compute_check_digit(composite)]
+
+
+def write_passport_pdf(path: str, people: List[Dict[str, str]], other_pages: int = 1,
+                       mrz_ratio: float = 0.0, run_id: Optional[str] = None, seed: int = 0) -> str:
+    """生成护照扫描件 PDF：每人一页护照资料页，后跟 other_pages 页签证/空白页
+
+    mrz_ratio 为带机读区（可在本地解析）的护照页比例，其余页面需要调用远程识别。
+    run_id 写入每页文本，不同的 run_id 生成的页面文本不同，不会命中单页识别缓存。
+    """
+    rng = random.Random(seed)
+    run_id = run_id or ''.join(rng.choice(string.ascii_lowercase) for _ in range(8))
+    doc = fitz.open()
+    for person in people:
+        page = doc.new_page()
+        y = 72
+        page.insert_text((72, y), "PEOPLE'S REPUBLIC OF CHINA  PASSPORT", fontsize=14)
+        for field, label in PAGE_LABELS.items():
+            y += 24
+            page.insert_text((72, y), f"{label}: {person[field]}", fontsize=11)
+        page.insert_text((72, y + 24), f"Ref: {run_id}", fontsize=8)
+        if rng.random() < mrz_ratio:
+            for i, line in enumerate(_mrz_lines(person)):
+                page.insert_text((40, 700 + i * 14), line, fontname='cour', fontsize=9)
+
+        for j in range(other_pages):
+            page = doc.new_page()
+            page.insert_text((72, 72), f"VISAS  page {j + 1}", fontsize=14)
+            page.insert_text((72, 96), f"Entry stamp {rng.randint(1000, 9999)}  Ref: {run_id}", fontsize=11)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def write_photos(photos_dir: str, people: List[Dict[str, str]], size=(480, 640)) -> List[str]:
+    """为每个申请人生成一张证件照，返回文件路径列表"""
+    os.makedirs(photos_dir, exist_ok=True)
+    paths = []
+    for i, person in enumerate(people):
+        image = Image.new('RGB', size, (200 + i % 50, 220, 240))
+        draw = ImageDraw.Draw(image)
+        draw.ellipse((size[0] // 4, size[1] // 5, size[0] * 3 // 4, size[1] * 3 // 5), fill=(120, 90, 70))
+        draw.text((10, size[1] - 30), person['passport_number'], fill=(0, 0, 0))
+        path = os.path.join(photos_dir, person['photo_filename'])
+        image.save(path, format='JPEG', quality=85)
+        paths.append(path)
+    return paths
@@ -0,0 +1,193 @@
+"""本地模拟的 Coze 对话接口，用于基准测试，不消耗真实 API 额度
+
+单独启动：
+    python -m benchmark.mock_coze --port 8900 --profile throttled
+然后以 COZE_API_URL=http://127.0.0.1:8900/open_api/v2/chat 启动应用。
+"""
+import re
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+from benchmark.generators import PAGE_LABELS
+
+logger = logging.getLogger(__name__)
+
+CHAT_PATH = '/open_api/v2/chat'
+
+# 预置的服务端表现
+PROFILES = {
+    'fast': {'latency': 0.05, 'jitter': 0.02},
+    'normal': {'latency': 1.0, 'jitter': 0.5},
+    'slow': {'latency': 5.0, 'jitter': 2.0},
+    'flaky': {'latency': 1.0, 'jitter': 0.5, 'error_rate': 0.1},  # 10% 的请求返回 500
+    'throttled': {'latency': 1.0, 'jitter': 0.5, 'max_concurrency': 4, 'retry_after': 1},  # 超过 4 个并发返回 429
+}
+
+# 返回给客户端的字段名（与 Coze 机器人的输出一致）
+RESPONSE_FIELDS = {
+    'passport_number': '护照号码',
+    'surname': '拼音姓',
+    'given_name': '拼音名',
+    'gender': '性别',
+    'birth_date': '出生日期',
+    'expiry_date': '护照到期日'
+}
+
+
+def extract_fields(text: str) -> Dict[str, Optional[str]]:
+    """按生成器写入的标签从页面文本中提取字段，非护照页返回空字符串"""
+    result = {}
+    for field, label in PAGE_LABELS.items():
+        match = re.search(rf'{re.escape(label)}:\s*(\S+)', text or '')
+        result[RESPONSE_FIELDS[field]] = match.group(1) if match else ''
+    result['中文姓名'] = ''
+    return result
+
+
+class MockCozeServer:
+    """模拟 Coze v2 chat 接口的 HTTP 服务
+
+    - latency / jitter：每个请求的处理时间（秒）为 latency ± jitter
+    - error_rate：返回 500 的请求比例
+    - max_concurrency：同时处理的请求数超过该值时返回 429（0 表示不限制），附带 Retry-After
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.05,
+                 jitter: float = 0.0, error_rate: float = 0.0, max_concurrency: int = 0,
+                 retry_after: int = 1, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.max_concurrency = max_concurrency
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._stats = {'requests': 0, 'ok': 0, 'errors': 0, 'throttled': 0, 'max_in_flight': 0}
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # 支持长连接
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    body = {}
+                status, headers, payload = server.handle(self.path, body)
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @classmethod
+    def from_profile(cls, profile: str, **overrides) -> 'MockCozeServer':
+        """按预置表现创建，overrides 中不为 None 的参数覆盖预置值"""
+        options = dict(PROFILES[profile])
+        options.update({key: value for key, value in overrides.items() if value is not None})
+        return cls(**options)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}{CHAT_PATH}"
+
+    def start(self) -> 'MockCozeServer':
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='mock-coze', daemon=True)
+        self._thread.start()
+        logger.info(f"模拟 Coze 服务已启动: {self.url}")
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def handle(self, path: str, body: Dict[str, Any]) -> Tuple[int, Dict[str, str], Dict[str, Any]]:
+        """处理一个请求，返回 (状态码, 响应头, 响应体)"""
+        if path.split('?')[0] != CHAT_PATH:
+            return 404, {}, {'code': 404, 'msg': 'not found'}
+
+        with self._lock:
+            self._stats['requests'] += 1
+            if self.max_concurrency and self._in_flight >= self.max_concurrency:
+                self._stats['throttled'] += 1
+                return 429, {'Retry-After': str(self.retry_after)}, {'code': 4029, 'msg': 'rate limited'}
+            self._in_flight += 1
+            self._stats['max_in_flight'] = max(self._stats['max_in_flight'], self._in_flight)
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            failed = self._random.random() < self.error_rate
+
+        try:
+            time.sleep(delay)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+        if failed:
+            with self._lock:
+                self._stats['errors'] += 1
+            return 500, {}, {'code': 500, 'msg': 'internal error'}
+
+        with self._lock:
+            self._stats['ok'] += 1
+        content = json.dumps(extract_fields(body.get('query', '')), ensure_ascii=False)
+        return 200, {}, {
+            'code': 0,
+            'msg': 'success',
+            'conversation_id': body.get('conversation_id'),
+            'messages': [{
+                'role': 'assistant',
+                'type': 'answer',
+                'content': f"```json\n{content}\n```",
+                'content_type': 'text'
+            }]
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地模拟 Coze 对话接口')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='normal')
+    parser.add_argument('--latency', type=float)
+    parser.add_argument('--jitter', type=float)
+    parser.add_argument('--error-rate', type=float)
+    parser.add_argument('--max-concurrency', type=int)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = MockCozeServer.from_profile(
+        args.profile, host=args.host, port=args.port, latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, max_concurrency=args.max_concurrency
+    )
+    logger.info(f"模拟 Coze 服务: {server.url} ({args.profile})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,343 @@
+"""处理流程基准测试
+
+在临时目录中生成测试数据，启动本地模拟的 Coze 服务，通过 Flask 测试客户端调用实际接口，
+输出吞吐量、延迟分位数、进程内存峰值和缓存命中率。在 backend 目录下运行：
+
+    python -m benchmark.run                                   # 全部场景，默认规模
+    python -m benchmark.run --scenario preprocess --passports 200 --profile throttled
+    python -m benchmark.run --rows 50000 --json result.json   # 同时保存 JSON 结果
+
+场景：
+    csv         CSV 解析、to_json 以及 /upload/csv（首次和命中缓存）
+    pdf         PDFHandler 提取全部页面文本
+    preprocess  /upload/passport + /jobs/passport 全流程（首次、命中单页缓存和强制重新处理）
+    photos      /upload/photos 批量上传和缩略图生成/命中缓存
+"""
+import io
+import os
+import math
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows 不支持 resource 模块
+    resource = None
+
+SCENARIOS = ('csv', 'pdf', 'preprocess', 'photos')
+
+# 轮询任务事件的间隔（秒），决定单页返回时间的精度
+EVENT_POLL_INTERVAL = 0.01
+
+logger = logging.getLogger('benchmark')
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """最近秩法计算分位数（q 取 0-100）"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered), math.ceil(q / 100 * len(ordered))) - 1)
+    return ordered[index]
+
+
+def latency_summary(values: List[float]) -> Dict[str, Any]:
+    """延迟统计（毫秒）"""
+    return {
+        'count': len(values),
+        'p50_ms': round(percentile(values, 50) * 1000, 1) if values else None,
+        'p99_ms': round(percentile(values, 99) * 1000, 1) if values else None,
+        'max_ms': round(max(values) * 1000, 1) if values else None
+    }
+
+
+def peak_rss_mb() -> Optional[float]:
+    """当前进程的内存峰值（MB）"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def cache_hit_ratios(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Any]:
+    """按缓存类型计算两次统计之间的命中率"""
+    ratios = {}
+    for name, counts in after['namespaces'].items():
+        previous = before['namespaces'].get(name, {})
+        delta = {key: counts.get(key, 0) - previous.get(key, 0)
+                 for key in ('memory_hits', 'disk_hits', 'misses')}
+        lookups = sum(delta.values())
+        if lookups:
+            ratios[name] = {
+                'lookups': lookups,
+                'hit_ratio': round((delta['memory_hits'] + delta['disk_hits']) / lookups, 3)
+            }
+    return ratios
+
+
+def timed(func: Callable, *args, **kwargs):
+    """执行函数，返回 (结果, 耗时秒数)"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+class Benchmark:
+    """基准测试上下文：工作目录、模拟服务和应用实例"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.workdir = args.workdir or tempfile.mkdtemp(prefix='passport-bench-')
+        self.data_dir = os.path.join(self.workdir, 'generated')
+        os.makedirs(self.data_dir, exist_ok=True)
+
+        from benchmark.mock_coze import MockCozeServer
+        self.mock = MockCozeServer.from_profile(
+            args.profile, latency=args.latency, jitter=args.jitter,
+            error_rate=args.error_rate, max_concurrency=args.max_concurrency, seed=args.seed
+        ).start()
+
+        # 应用配置在导入时读取环境变量，必须在导入 app 之前设置
+        os.environ['UPLOAD_FOLDER'] = os.path.join(self.workdir, 'uploads')
+        os.environ['COZE_API_URL'] = self.mock.url
+        import app as app_module
+        self.app_module = app_module
+        self.client = app_module.app.test_client()
+
+    def close(self) -> None:
+        self.mock.stop()
+        if not self.args.workdir and not self.args.keep:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def run(self, scenario: str) -> Dict[str, Any]:
+        """执行单个场景，附加内存峰值和缓存命中率"""
+        cache_before = self.app_module.cache_manager.stats()
+        mock_before = self.mock.stats()
+        result, elapsed = timed(getattr(self, f'scenario_{scenario}'))
+        cache_after = self.app_module.cache_manager.stats()
+        mock_after = self.mock.stats()
+
+        result['elapsed_s'] = round(elapsed, 3)
+        result['peak_rss_mb'] = peak_rss_mb()
+        result['cache'] = cache_hit_ratios(cache_before, cache_after)
+        mock_delta = {key: mock_after[key] - mock_before[key] for key in mock_after if key != 'max_in_flight'}
+        if mock_delta['requests']:
+            mock_delta['max_in_flight'] = mock_after['max_in_flight']
+            result['coze'] = mock_delta
+        return result
+
+    def scenario_csv(self) -> Dict[str, Any]:
+        from benchmark.generators import generate_people, write_csv
+        from utils.csv_handler import CSVHandler
+
+        rows = self.args.rows
+        people = generate_people(rows, seed=self.args.seed)
+        path = write_csv(os.path.join(self.data_dir, 'applicants.csv'), people,
+                         missing_date_ratio=0.01, seed=self.args.seed)
+
+        handler, parse_time = timed(CSVHandler, path)
+        records, to_json_time = timed(handler.to_json)
+
+        with open(path, 'rb') as f:
+            content = f.read()
+        upload_latencies = []
+        for _ in range(self.args.repeat):
+            response, elapsed = timed(self.client.post, '/upload/csv', data={
+                'file': (io.BytesIO(content), 'current.csv')
+            }, content_type='multipart/form-data')
+            if response.status_code != 200:
+                raise RuntimeError(f"/upload/csv 返回 {response.status_code}: {response.get_data(as_text=True)[:200]}")
+            upload_latencies.append(elapsed)
+
+        return {
+            'rows': rows,
+            'parse_rows_per_s': round(rows / parse_time),
+            'to_json_rows_per_s': round(len(records) / to_json_time),
+            'upload_first_ms': round(upload_latencies[0] * 1000, 1),
+            'upload': latency_summary(upload_latencies[1:])
+        }
+
+    def scenario_pdf(self) -> Dict[str, Any]:
+        from benchmark.generators import generate_people, write_passport_pdf
+        from utils.pdf_handler import PDFHandler
+
+        people = generate_people(self.args.passports, seed=self.args.seed)
+        path = write_passport_pdf(os.path.join(self.data_dir, 'passports.pdf'), people,
+                                  other_pages=self.args.other_pages, seed=self.args.seed)
+        app = self.app_module.app
+        with app.app_context():
+            handler, elapsed = timed(
+                PDFHandler, path, cache=None,
+                parallel_threshold=app.config['PDF_PARALLEL_THRESHOLD'],
+                max_processes=app.config['PDF_MAX_PROCESSES']
+            )
+        pages = handler.get_page_count()
+        return {
+            'pages': pages,
+            'pages_per_s': round(pages / elapsed, 1),
+            'parallel': pages >= handler.parallel_threshold and handler.max_processes > 1
+        }
+
+    def _preprocess(self, filename: str, force_reprocess: bool) -> Dict[str, Any]:
+        """提交预处理任务并以短间隔轮询事件，记录每页结果返回的时间
+
+        不使用 /preprocess/passport 的流式响应：它按 0.5 秒间隔读取事件，测得的是轮询间隔而不是处理延迟。
+        """
+        start = time.perf_counter()
+        response = self.client.post('/jobs/passport', json={
+            'pdf_filename': filename, 'force_reprocess': force_reprocess
+        })
+        if response.status_code not in (200, 202):
+            raise RuntimeError(f"/jobs/passport 返回 {response.status_code}: {response.get_data(as_text=True)[:200]}")
+        job_id = response.get_json()['job_id']
+
+        page_times = []
+        final_event = {}
+        offset = 0
+        while True:
+            body = self.client.get(f'/jobs/{job_id}/events?offset={offset}').get_json()
+            now = time.perf_counter() - start
+            for event in body['events']:
+                if 'page_number' in event:
+                    page_times.append(now)
+                final_event = event
+            offset = body['offset']
+            if body['finished']:
+                break
+            time.sleep(EVENT_POLL_INTERVAL)
+        elapsed = time.perf_counter() - start
+
+        if final_event.get('error'):
+            raise RuntimeError(f"预处理失败: {final_event['error']}")
+        pages = len(page_times)
+        return {
+            'pages': pages,
+            'pages_per_s': round(pages / elapsed, 1) if pages else None,
+            'valid_pages': len(final_event.get('valid_pages', [])),
+            'failed_pages': len(final_event.get('failed_pages', [])),
+            'time_to_page': latency_summary(page_times),
+            'elapsed_s': round(elapsed, 3)
+        }
+
+    def scenario_preprocess(self) -> Dict[str, Any]:
+        from benchmark.generators import generate_people, write_passport_pdf
+
+        people = generate_people(self.args.passports, seed=self.args.seed)
+        path = write_passport_pdf(os.path.join(self.data_dir, 'preprocess.pdf'), people,
+                                  other_pages=self.args.other_pages, mrz_ratio=self.args.mrz_ratio,
+                                  run_id=f"{os.getpid()}{time.time_ns()}", seed=self.args.seed)
+        with open(path, 'rb') as f:
+            response, upload_time = timed(self.client.post, '/upload/passport', data={
+                'file': (f, 'passports.pdf')
+            }, content_type='multipart/form-data')
+        if response.status_code != 200:
+            raise RuntimeError(f"/upload/passport 返回 {response.status_code}: {response.get_data(as_text=True)[:200]}")
+        filename = response.get_json()['pdf_filename']
+
+        cold = self._preprocess(filename, force_reprocess=False)
+        # 删除整份文档的处理结果，页面结果命中单页缓存
+        self.app_module.cache_manager.delete('pdf_processed', filename.split('.')[0])
+        warm = self._preprocess(filename, force_reprocess=False)
+        return {
+            'upload_ms': round(upload_time * 1000, 1),
+            'cold': cold,
+            'warm': warm,
+            # 强制重新处理：跳过所有缓存，重新调用 Coze API
+            'force': self._preprocess(filename, force_reprocess=True)
+        }
+
+    def scenario_photos(self) -> Dict[str, Any]:
+        from benchmark.generators import generate_people, write_photos
+
+        people = generate_people(self.args.photos, seed=self.args.seed)
+        paths = write_photos(os.path.join(self.data_dir, 'photos'), people)
+
+        handles = [open(path, 'rb') for path in paths]
+        try:
+            response, upload_time = timed(self.client.post, '/upload/photos', data={
+                'files[]': [(f, os.path.basename(f.name)) for f in handles]
+            }, content_type='multipart/form-data')
+        finally:
+            for f in handles:
+                f.close()
+        if response.status_code != 200:
+            raise RuntimeError(f"/upload/photos 返回 {response.status_code}: {response.get_data(as_text=True)[:200]}")
+
+        def fetch_thumbnails():
+            latencies = []
+            for person in people:
+                thumb, elapsed = timed(self.client.get, f"/uploads/photos/{person['photo_filename']}?size=thumb",
+                                       headers={'Accept': 'image/webp,image/*'})
+                thumb.close()
+                latencies.append(elapsed)
+            return latencies
+
+        return {
+            'photos': len(paths),
+            'upload_photos_per_s': round(len(paths) / upload_time, 1),
+            'thumbnail_cold': latency_summary(fetch_thumbnails()),
+            'thumbnail_cached': latency_summary(fetch_thumbnails())
+        }
+
+
+def print_result(name: str, result: Dict[str, Any], indent: int = 0) -> None:
+    """逐行输出结果"""
+    print(' ' * indent + f"{name}:")
+    for key, value in result.items():
+        if isinstance(value, dict):
+            print_result(key, value, indent + 2)
+        else:
+            print(' ' * (indent + 2) + f"{key}: {value}")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    from benchmark.mock_coze import PROFILES
+
+    parser = argparse.ArgumentParser(description='护照核对流程基准测试')
+    parser.add_argument('--scenario', choices=SCENARIOS + ('all',), default='all')
+    parser.add_argument('--rows', type=int, default=10000, help='CSV 行数')
+    parser.add_argument('--passports', type=int, default=50, help='PDF 中的护照数')
+    parser.add_argument('--other-pages', type=int, default=1, help='每本护照后的签证/空白页数')
+    parser.add_argument('--mrz-ratio', type=float, default=0.0, help='带机读区（本地解析）的护照页比例')
+    parser.add_argument('--photos', type=int, default=200, help='证件照数量')
+    parser.add_argument('--repeat', type=int, default=5, help='CSV 上传重复次数')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='fast', help='模拟 Coze 服务的表现')
+    parser.add_argument('--latency', type=float, help='覆盖模拟服务的平均延迟（秒）')
+    parser.add_argument('--jitter', type=float, help='覆盖模拟服务的延迟抖动（秒）')
+    parser.add_argument('--error-rate', type=float, help='覆盖模拟服务的错误率')
+    parser.add_argument('--max-concurrency', type=int, help='覆盖模拟服务的并发上限（超过返回 429）')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', help='工作目录（默认使用临时目录，结束后删除）')
+    parser.add_argument('--keep', action='store_true', help='保留临时工作目录')
+    parser.add_argument('--json', help='结果保存路径')
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    benchmark = Benchmark(args)
+    results = {'profile': args.profile}
+    try:
+        for scenario in (SCENARIOS if args.scenario == 'all' else (args.scenario,)):
+            results[scenario] = benchmark.run(scenario)
+            print_result(scenario, results[scenario])
+    finally:
+        benchmark.close()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
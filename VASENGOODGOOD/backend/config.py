@@ -4,7 +4,7 @@ from datetime import timedelta
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key'
     BASE_DIR = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
-    UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
+    UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or os.path.join(BASE_DIR, 'uploads')
     CSV_FOLDER = os.path.join(UPLOAD_FOLDER, 'csv')
     PHOTOS_FOLDER = os.path.join(UPLOAD_FOLDER, 'photos')
     PASSPORTS_FOLDER = os.path.join(UPLOAD_FOLDER, 'passports')
@@ -17,11 +17,13 @@ class Config:
     ALLOWED_EXTENSIONS = {
         'csv': {'csv'},
         'photo': {'jpg', 'jpeg', 'png', 'bmp'},
+        'photo_archive': {'zip'},
         'passport': {'pdf'}
     }
     MAX_FILE_SIZE = {
-        'csv': 10 * 1024 * 1024,  # 10MB
+        'csv': 100 * 1024 * 1024,  # 100MB（分块解析）
         'photo': 5 * 1024 * 1024,  # 5MB
+        'photo_archive': 200 * 1024 * 1024,  # 200MB
         'passport': 100 * 1024 * 1024  # 100MB
     }
     
@@ -30,6 +32,64 @@ class Config:
     COZE_BOT_ID = '7494531295393939482'
 
     COZE_API_URL = os.environ.get('COZE_API_URL')
+    COZE_CONNECT_TIMEOUT = float(os.environ.get('COZE_CONNECT_TIMEOUT', '5'))  # 连接超时（秒）
+    COZE_READ_TIMEOUT = float(os.environ.get('COZE_READ_TIMEOUT', '30'))  # 读取超时（秒）
+    COZE_PROBE_TIMEOUT = float(os.environ.get('COZE_PROBE_TIMEOUT', '10'))  # 连接测试读取超时（秒）
+    COZE_HEALTH_TTL = float(os.environ.get('COZE_HEALTH_TTL', '300'))  # 连接健康状态缓存时间（秒）
+
+    # Coze API 调度配置（自适应并发与限流重试）
+    COZE_MIN_CONCURRENCY = int(os.environ.get('COZE_MIN_CONCURRENCY', '1'))  # 最小并发请求数
+    COZE_MAX_CONCURRENCY = int(os.environ.get('COZE_MAX_CONCURRENCY', '12'))  # 最大并发请求数
+    COZE_INITIAL_CONCURRENCY = int(os.environ.get('COZE_INITIAL_CONCURRENCY', '6'))  # 初始并发请求数
+    COZE_TARGET_LATENCY = float(os.environ.get('COZE_TARGET_LATENCY', '15'))  # 目标延迟（秒），超过则降低并发
+    COZE_MAX_RETRIES = int(os.environ.get('COZE_MAX_RETRIES', '3'))  # 限流/服务端错误的最大重试次数
+    COZE_RETRY_BASE_DELAY = float(os.environ.get('COZE_RETRY_BASE_DELAY', '1'))  # 重试基础退避时间（秒）
+    COZE_RETRY_MAX_DELAY = float(os.environ.get('COZE_RETRY_MAX_DELAY', '30'))  # 重试最大退避时间（秒）
+
+    # 两级数据缓存配置（CSV/PDF 处理结果、单页识别结果）
+    CACHE_FOLDER = os.path.join(UPLOAD_FOLDER, 'cache', 'data')
+    CACHE_MEMORY_MAX_BYTES = int(os.environ.get('CACHE_MEMORY_MAX_MB', '256')) * 1024 * 1024  # 每个进程的内存缓存上限
+    CACHE_DISK_MAX_BYTES = int(os.environ.get('CACHE_DISK_MAX_MB', '2048')) * 1024 * 1024  # 磁盘缓存上限
+
+    # 处理器注册表配置（每个进程保留最近使用的 CSV/PDF 处理器，按文件内容哈希复用）
+    HANDLER_REGISTRY_MAX_BYTES = int(os.environ.get('HANDLER_REGISTRY_MAX_MB', '512')) * 1024 * 1024  # 内存占用上限
+    HANDLER_REGISTRY_MAX_ENTRIES = int(os.environ.get('HANDLER_REGISTRY_MAX_ENTRIES', '16'))  # 处理器数量上限
+
+    # PDF 单页渲染配置（按文件哈希、页码、缩放比例缓存图片）
+    PAGE_RENDER_FOLDER = os.path.join(PASSPORTS_FOLDER, 'cache', 'renders')
+    PAGE_RENDER_MAX_ZOOM = float(os.environ.get('PAGE_RENDER_MAX_ZOOM', '4'))  # 最大缩放比例
+    PAGE_RENDER_QUALITY = int(os.environ.get('PAGE_RENDER_QUALITY', '85'))  # JPEG 压缩质量
+    PAGE_RENDER_CLIP_STEP = 0.05  # 裁剪区域按该比例步长取整，限制不同裁剪区域的图片数量
+    PAGE_RENDER_CACHE_MAX_BYTES = int(os.environ.get('PAGE_RENDER_CACHE_MAX_MB', '1024')) * 1024 * 1024  # 渲染图片磁盘占用上限
+    PAGE_RENDER_CACHE_MAX_AGE = int(os.environ.get('PAGE_RENDER_CACHE_MAX_AGE', str(7 * 24 * 60 * 60)))  # 渲染图片最长保留时间（秒）
+
+    # PDF 文本提取配置
+    PDF_PARALLEL_THRESHOLD = int(os.environ.get('PDF_PARALLEL_THRESHOLD', '64'))  # 超过该页数时使用多进程提取
+    PDF_MAX_PROCESSES = int(os.environ.get('PDF_MAX_PROCESSES', str(os.cpu_count() or 1)))  # 文本提取最大进程数
+
+    # 后台预处理任务配置
+    JOBS_FOLDER = os.path.join(PASSPORTS_FOLDER, 'cache', 'jobs')
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '4'))  # 每个进程同时运行的任务数
+    JOB_RETENTION = int(os.environ.get('JOB_RETENTION', str(24 * 60 * 60)))  # 任务记录保留时间（秒）
+    JOB_STALE_TIMEOUT = int(os.environ.get('JOB_STALE_TIMEOUT', '120'))  # 任务超过该时间没有心跳视为失效（秒）
+
+    # 照片上传配置
+    PHOTO_UPLOAD_WORKERS = int(os.environ.get('PHOTO_UPLOAD_WORKERS', '8'))  # 并发写入照片的线程数
+
+    # 文件下载配置：开启后由 nginx 通过 X-Accel-Redirect 直接发送 uploads 目录中的文件
+    USE_X_ACCEL_REDIRECT = os.environ.get('USE_X_ACCEL_REDIRECT', 'False').lower() == 'true'
+    X_ACCEL_PREFIX = os.environ.get('X_ACCEL_PREFIX', '/internal-uploads/')  # nginx 中对应 uploads 目录的 internal location
+    IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60  # 以内容哈希命名的文件的浏览器缓存时间（秒）
+
+    # 监控配置：开启后每个响应附带 Server-Timing 头，浏览器开发者工具中可查看各阶段耗时
+    SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING_ENABLED', 'False').lower() == 'true'
+
+    # 照片缩略图配置（按原图内容哈希缓存）
+    PHOTO_CACHE_FOLDER = os.path.join(UPLOAD_FOLDER, 'cache', 'photos')
+    PHOTO_SIZES = {'thumb': 160, 'preview': 600}  # 尺寸名称 -> 最长边像素
+    PHOTO_QUALITY = int(os.environ.get('PHOTO_QUALITY', '80'))  # 缩略图压缩质量
+    PHOTO_CACHE_MAX_AGE = int(os.environ.get('PHOTO_CACHE_MAX_AGE', '3600'))  # 浏览器缓存时间（秒）
+    PHOTO_CACHE_MAX_BYTES = int(os.environ.get('PHOTO_CACHE_MAX_MB', '1024')) * 1024 * 1024  # 缩略图磁盘占用上限
 
     # 缓存基本配置
     CACHE_BASE_CONFIG = {
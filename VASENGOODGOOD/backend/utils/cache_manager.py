@@ -0,0 +1,311 @@
+import os
+import re
+import json
+import time
+import pickle
+import shutil
+import logging
+from collections import OrderedDict, defaultdict
+from threading import Lock, get_ident
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# 缓存未命中时返回的哨兵值，用于区分"未缓存"和"缓存的值为 None"
+MISS = object()
+
+# 缓存键只允许作为文件名安全的字符
+KEY_PATTERN = re.compile(r'^[A-Za-z0-9_.-]{1,200}$')
+
+
+class CacheNamespace:
+    """缓存数据类型：名称、格式版本、序列化方式和过期时间
+
+    版本号写入每条缓存，格式或处理逻辑变化时递增版本号，旧的缓存自动视为未命中。
+    mutable 表示同一个键的值会被更新（如复核后更新识别结果），内存命中时需要与磁盘文件核对。
+    """
+
+    def __init__(self, name: str, version: int = 1, serializer: str = 'json',
+                 ttl: Optional[float] = None, mutable: bool = False):
+        if serializer not in ('json', 'pickle'):
+            raise ValueError(f"不支持的序列化方式: {serializer}")
+        self.name = name
+        self.version = version
+        self.serializer = serializer  # json 用于普通数据，pickle 用于 DataFrame 等对象
+        self.ttl = ttl  # 过期时间（秒），None 表示不过期
+        self.mutable = mutable
+
+    @property
+    def extension(self) -> str:
+        return 'json' if self.serializer == 'json' else 'pkl'
+
+    def dumps(self, value: Any, created: float) -> bytes:
+        """序列化缓存值"""
+        payload = {'version': self.version, 'created': created, 'value': value}
+        if self.serializer == 'json':
+            return json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        return pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, data: bytes) -> Dict[str, Any]:
+        """反序列化缓存值"""
+        if self.serializer == 'json':
+            return json.loads(data.decode('utf-8'))
+        return pickle.loads(data)
+
+
+# 应用使用的缓存类型
+DEFAULT_NAMESPACES = (
+    CacheNamespace('csv_data', version=6, serializer='pickle'),  # CSV 解析后的 DataFrame、校验报告和查询索引
+    CacheNamespace('csv_json', version=5, serializer='pickle'),  # CSV 转换后的记录列表
+    CacheNamespace('pdf_text', version=1),  # PDF 每页文本
+    CacheNamespace('pdf_index', version=1),  # PDF 护照号码/姓名倒排索引
+    CacheNamespace('pdf_processed', version=1, mutable=True),  # 整份 PDF 的护照识别结果（复核、强制重新处理时更新）
+    CacheNamespace('page_result', version=1, mutable=True),  # 按页面文本哈希缓存的单页识别结果（强制重新处理时更新）
+    CacheNamespace('page_result_invalid', version=1, ttl=60 * 60, mutable=True),  # 未通过校验的单页结果，短时间后重新识别
+)
+
+
+class CacheManager:
+    """两级缓存：进程内存 LRU + 磁盘文件
+
+    - 内存层按序列化后的字节数限制大小，超出时淘汰最久未使用的条目
+    - 磁盘层在 cache_dir/{类型}/ 下每个键一个文件，先写临时文件再原子替换，
+      所有 worker 共享；总大小超过上限时按最近使用时间淘汰
+    - 按缓存类型统计内存命中、磁盘命中、未命中、读写字节数等指标
+    - 可变类型的内存条目记录对应磁盘文件的签名（inode、大小、修改时间），命中时核对，
+      其他 worker 更新或删除后重新从磁盘读取
+
+    内存层直接返回缓存的对象，调用方不能修改返回值，需要修改时先复制再调用 set()。
+    """
+
+    def __init__(self, cache_dir: str, namespaces: Iterable[CacheNamespace] = DEFAULT_NAMESPACES,
+                 max_memory_bytes: int = 256 * 1024 * 1024, max_disk_bytes: int = 2 * 1024 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.namespaces = {namespace.name: namespace for namespace in namespaces}
+
+        self._memory = OrderedDict()  # (类型, 键) -> (值, 字节数, 过期时间, 磁盘文件签名)
+        self._memory_bytes = 0
+        self._lock = Lock()
+        self._stats = defaultdict(lambda: defaultdict(int))
+        self._disk_written = 0  # 上次清理后写入磁盘的字节数
+
+        for name in self.namespaces:
+            os.makedirs(os.path.join(self.cache_dir, name), exist_ok=True)
+
+    def _namespace(self, name: str) -> CacheNamespace:
+        namespace = self.namespaces.get(name)
+        if namespace is None:
+            raise KeyError(f"未注册的缓存类型: {name}")
+        return namespace
+
+    def _get_file_path(self, namespace: CacheNamespace, key: str) -> str:
+        """获取缓存文件路径"""
+        if not KEY_PATTERN.match(key):
+            raise ValueError(f"无效的缓存键: {key}")
+        return os.path.join(self.cache_dir, namespace.name, f"{key}.{namespace.extension}")
+
+    def get(self, name: str, key: str, default: Any = MISS) -> Any:
+        """获取缓存值，依次查找内存和磁盘，未命中时返回 default"""
+        namespace = self._namespace(name)
+        file_path = self._get_file_path(namespace, key)
+        now = time.time()
+        signature = self._file_signature(file_path) if namespace.mutable else None
+
+        with self._lock:
+            entry = self._memory.get((name, key))
+            if entry is not None:
+                if (entry[2] is None or entry[2] > now) and entry[3] == signature:
+                    self._memory.move_to_end((name, key))
+                    self._stats[name]['memory_hits'] += 1
+                    return entry[0]
+                self._forget((name, key))
+
+        try:
+            with open(file_path, 'rb') as f:
+                data = f.read()
+                if namespace.mutable:
+                    signature = self._signature_of(os.fstat(f.fileno()))
+            payload = namespace.loads(data)
+        except FileNotFoundError:
+            self._count(name, 'misses')
+            return default
+        except Exception as e:
+            logger.warning(f"读取缓存文件失败，已删除: {file_path}, {str(e)}")
+            self._remove_file(file_path)
+            self._count(name, 'misses')
+            return default
+
+        created = payload.get('created', 0) if isinstance(payload, dict) else 0
+        if (not isinstance(payload, dict) or payload.get('version') != namespace.version
+                or (namespace.ttl and created + namespace.ttl <= now)):
+            # 版本不匹配或已过期
+            self._remove_file(file_path)
+            self._count(name, 'misses')
+            return default
+
+        # 更新修改时间，磁盘淘汰时保留最近使用的文件（可变类型的修改时间用于核对内存条目，不更新）
+        if not namespace.mutable:
+            try:
+                os.utime(file_path)
+            except OSError:
+                pass
+
+        value = payload['value']
+        self._remember(namespace, key, value, len(data), created, signature)
+        with self._lock:
+            self._stats[name]['disk_hits'] += 1
+            self._stats[name]['bytes_read'] += len(data)
+        return value
+
+    def set(self, name: str, key: str, value: Any) -> None:
+        """保存缓存值到内存和磁盘"""
+        namespace = self._namespace(name)
+        created = time.time()
+        data = namespace.dumps(value, created)
+
+        file_path = self._get_file_path(namespace, key)
+        tmp_path = f"{file_path}.{os.getpid()}_{get_ident()}.tmp"
+        signature = None
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+                if namespace.mutable:
+                    f.flush()
+                    signature = self._signature_of(os.fstat(f.fileno()))
+            os.replace(tmp_path, file_path)
+        except Exception as e:
+            logger.error(f"保存缓存文件失败: {file_path}, {str(e)}")
+            self._remove_file(tmp_path)
+            # 可变类型写入失败时不保留内存条目，避免各 worker 不一致
+            if not namespace.mutable:
+                self._remember(namespace, key, value, len(data), created)
+            return
+
+        self._remember(namespace, key, value, len(data), created, signature)
+
+        with self._lock:
+            self._stats[name]['sets'] += 1
+            self._stats[name]['bytes_written'] += len(data)
+            self._disk_written += len(data)
+            # 每写入约上限的 1/10 检查一次磁盘占用
+            should_prune = self._disk_written >= self.max_disk_bytes // 10
+            if should_prune:
+                self._disk_written = 0
+        if should_prune:
+            self.prune()
+
+    def delete(self, name: str, key: str) -> None:
+        """删除缓存值"""
+        namespace = self._namespace(name)
+        with self._lock:
+            self._forget((name, key))
+        self._remove_file(self._get_file_path(namespace, key))
+
+    def clear(self) -> int:
+        """清空所有缓存，返回删除的文件数"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+
+        removed = 0
+        for name in self.namespaces:
+            namespace_dir = os.path.join(self.cache_dir, name)
+            if os.path.isdir(namespace_dir):
+                removed += len(os.listdir(namespace_dir))
+                shutil.rmtree(namespace_dir, ignore_errors=True)
+            os.makedirs(namespace_dir, exist_ok=True)
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存命中统计和内存占用"""
+        with self._lock:
+            return {
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+                'namespaces': {name: dict(counts) for name, counts in self._stats.items()}
+            }
+
+    def prune(self) -> None:
+        """删除过期的缓存文件；磁盘占用超过上限时删除最久未使用的文件，直到低于上限的 90%"""
+        now = time.time()
+        entries = []
+        total_bytes = 0
+        removed = 0
+        for namespace in self.namespaces.values():
+            namespace_dir = os.path.join(self.cache_dir, namespace.name)
+            try:
+                with os.scandir(namespace_dir) as it:
+                    for entry in it:
+                        if not entry.is_file():
+                            continue
+                        stat = entry.stat()
+                        # 过期文件（以及残留的临时文件）直接删除
+                        if ((namespace.ttl and stat.st_mtime + namespace.ttl <= now)
+                                or (entry.name.endswith('.tmp') and stat.st_mtime + 3600 <= now)):
+                            self._remove_file(entry.path)
+                            removed += 1
+                            continue
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+                        total_bytes += stat.st_size
+            except FileNotFoundError:
+                continue
+
+        if total_bytes > self.max_disk_bytes:
+            entries.sort()
+            target = self.max_disk_bytes * 0.9
+            for _, size, path in entries:
+                if total_bytes <= target:
+                    break
+                self._remove_file(path)
+                total_bytes -= size
+                removed += 1
+
+        if removed:
+            self._count('_disk', 'evictions', removed)
+            logger.info(f"缓存清理：已删除 {removed} 个文件，当前磁盘占用 {total_bytes // (1024 * 1024)}MB")
+
+    def _remember(self, namespace: CacheNamespace, key: str, value: Any, size: int, created: float,
+                  signature: Optional[tuple] = None) -> None:
+        """写入内存层并淘汰超出上限的条目"""
+        if size > self.max_memory_bytes:
+            return
+        expires = created + namespace.ttl if namespace.ttl else None
+        with self._lock:
+            self._forget((namespace.name, key))
+            self._memory[(namespace.name, key)] = (value, size, expires, signature)
+            self._memory_bytes += size
+            while self._memory_bytes > self.max_memory_bytes:
+                (evicted_name, _), (_, evicted_size, _, _) = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted_size
+                self._stats[evicted_name]['memory_evictions'] += 1
+
+    def _forget(self, memory_key) -> None:
+        """从内存层删除条目（调用方需持有锁）"""
+        entry = self._memory.pop(memory_key, None)
+        if entry is not None:
+            self._memory_bytes -= entry[1]
+
+    def _count(self, name: str, metric: str, amount: int = 1) -> None:
+        with self._lock:
+            self._stats[name][metric] += amount
+
+    @staticmethod
+    def _signature_of(stat: os.stat_result) -> tuple:
+        """磁盘文件签名，用于判断可变类型的缓存文件是否已被其他 worker 替换"""
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    @classmethod
+    def _file_signature(cls, path: str) -> Optional[tuple]:
+        try:
+            return cls._signature_of(os.stat(path))
+        except OSError:
+            return None
+
+    @staticmethod
+    def _remove_file(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
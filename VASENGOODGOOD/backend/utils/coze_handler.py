@@ -1,37 +1,124 @@
 import requests
-from typing import Dict, Any, Optional
+from requests.adapters import HTTPAdapter
+from typing import Dict, Any, Optional, Tuple
 import json
 import time
 import string
 import random
 import logging
 import re
+from threading import Event, Lock
+from utils.metrics import metrics
 
-# 配置日志记录
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+DEFAULT_BASE_URL = 'https://api.coze.cn/open_api/v2/chat'
+
+# 进程内共享的 HTTP 会话（保持长连接，避免每次请求重新握手）
+_session = None
+_session_lock = Lock()
+
+# 进程内共享的连接健康状态，按 (base_url, bot_id) 缓存
+_health_status = {}
+_health_probes = {}  # 正在进行的连接测试 -> 测试完成事件，同一时间只有一个线程发起测试
+_health_lock = Lock()
+
+
+class CozeAPIError(Exception):
+    """Coze API 调用异常，retryable 表示可以退避后重试（限流、服务端错误、网络超时）"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None,
+                 retryable: bool = False, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+def get_session(pool_size: int = 10) -> requests.Session:
+    """获取进程内共享的 HTTP 会话，连接池大小与并发线程数匹配"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+                logger.info(f"已创建共享 HTTP 会话，连接池大小: {pool_size}")
+    return _session
+
+
 class CozeHandler:
-    def __init__(self, api_key: str, bot_id: str):
+    def __init__(self, api_key: str, bot_id: str, base_url: Optional[str] = None,
+                 timeout: Tuple[float, float] = (5, 30), probe_timeout: float = 10,
+                 health_ttl: float = 300, failure_ttl: float = 10, pool_size: int = 10):
         self.api_key = api_key
         self.bot_id = bot_id
-        self.base_url = 'https://api.coze.cn/open_api/v2/chat'
+        self.base_url = base_url or DEFAULT_BASE_URL
         self.headers = {
             'Authorization': f'Bearer {api_key}',
             'Content-Type': 'application/json'
         }
+        self.timeout = timeout  # (连接超时, 读取超时)
+        self.probe_timeout = probe_timeout
+        self.health_ttl = health_ttl  # 连接正常状态的缓存时间（秒）
+        self.failure_ttl = failure_ttl  # 连接失败状态的缓存时间（秒）
+        self.session = get_session(pool_size)
         self.connection_tested = False
         self.connection_ok = False
         logger.info(f"初始化 CozeHandler: bot_id={bot_id}, api_key={api_key[:8]}...")
-        
-        # 在初始化时测试连接
-        if self._test_connection():
-            self.connection_tested = True
-            self.connection_ok = True
+
+    def ensure_connection(self) -> None:
+        """确认 API 可用，健康状态在进程内缓存，过期后才重新测试连接
+
+        测试在锁外进行：只有一个线程发起测试，其他线程等待测试完成后读取结果。
+        连接不可用时抛出可重试的 CozeAPIError，调度器在失败状态过期后再重试。
+        """
+        key = (self.base_url, self.bot_id)
+        while True:
+            with _health_lock:
+                status = _health_status.get(key)
+                if status:
+                    ttl = self.health_ttl if status['ok'] else self.failure_ttl
+                    remaining = ttl - (time.time() - status['checked_time'])
+                    if remaining > 0:
+                        self._apply_health(status['ok'], remaining)
+                        return
+                probe = _health_probes.get(key)
+                if probe is None:
+                    probe = _health_probes[key] = Event()
+                    break
+            probe.wait(self.timeout[0] + self.probe_timeout)
+
+        ok = False
+        try:
+            ok = self._test_connection()
+        finally:
+            with _health_lock:
+                _health_status[key] = {'ok': ok, 'checked_time': time.time()}
+                _health_probes.pop(key, None)
+            probe.set()
+
+        if ok:
             logger.info("API 连接测试成功")
         else:
             logger.error("API 连接测试失败")
-            raise Exception("无法连接到 Coze API，请检查网络连接和 API 配置")
+        self._apply_health(ok, self.failure_ttl)
+
+    def _apply_health(self, ok: bool, retry_after: float) -> None:
+        """记录连接状态，不可用时抛出可重试的异常"""
+        self.connection_tested = True
+        self.connection_ok = ok
+        if not ok:
+            raise CozeAPIError("无法连接到 Coze API，请检查网络连接和 API 配置",
+                               retryable=True, retry_after=retry_after)
+
+    def _mark_healthy(self) -> None:
+        """成功的请求同样证明连接可用，刷新健康状态"""
+        with _health_lock:
+            _health_status[(self.base_url, self.bot_id)] = {'ok': True, 'checked_time': time.time()}
 
     def _normalize_passport_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """规范化护照数据"""
@@ -105,6 +192,28 @@ class CozeHandler:
         chars = string.ascii_letters + string.digits
         return ''.join(random.choice(chars) for _ in range(16))
 
+    def _post(self, request_data: Dict[str, Any], timeout, call: str) -> requests.Response:
+        """发送请求，记录耗时和状态码（或异常类型）"""
+        start_time = time.perf_counter()
+        status = 'error'
+        try:
+            response = self.session.post(
+                self.base_url,
+                headers=self.headers,
+                json=request_data,
+                timeout=timeout
+            )
+            status = str(response.status_code)
+            return response
+        except requests.Timeout:
+            status = 'timeout'
+            raise
+        except requests.ConnectionError:
+            status = 'connection_error'
+            raise
+        finally:
+            metrics.observe('coze_request_seconds', time.perf_counter() - start_time, call=call, status=status)
+
     def _test_connection(self) -> bool:
         """测试 API 连接"""
         try:
@@ -119,12 +228,7 @@ class CozeHandler:
                 'stream': False
             }
             
-            response = requests.post(
-                self.base_url,
-                headers=self.headers,
-                json=request_data,
-                timeout=10
-            )
+            response = self._post(request_data, (self.timeout[0], self.probe_timeout), call='probe')
             
             if response.status_code == 200:
                 response_json = response.json()
@@ -137,8 +241,7 @@ class CozeHandler:
 
     def process_passport_text(self, text: str) -> Optional[Dict[str, Any]]:
         """处理护照文本并获取结构化数据"""
-        if not self.connection_ok:
-            raise Exception("API 连接未就绪")
+        self.ensure_connection()
             
         try:
             logger.info("开始处理护照文本...")
@@ -154,24 +257,27 @@ class CozeHandler:
             logger.debug(f"发送护照文本处理请求，文本长度: {len(text)}")
             
             # 发送请求
-            response = requests.post(
-                self.base_url,
-                headers=self.headers,
-                json=request_data,
-                timeout=30
-            )
+            response = self._post(request_data, self.timeout, call='passport')
             
             logger.debug(f"收到护照处理响应: 状态码={response.status_code}")
             
             if response.status_code != 200:
                 logger.error(f"API 请求失败: {response.status_code} - {response.text}")
-                raise Exception(f"API 请求失败: {response.status_code}")
+                retry_after = response.headers.get('Retry-After')
+                raise CozeAPIError(
+                    f"API 请求失败: {response.status_code}",
+                    status_code=response.status_code,
+                    retryable=response.status_code == 429 or response.status_code >= 500,
+                    retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None
+                )
 
             response_json = response.json()
             
             if response_json.get('code') != 0:
                 logger.error(f"API 返回错误: {response_json}")
                 raise Exception(f"API 返回错误: {response_json.get('message')}")
+            
+            self._mark_healthy()
 
             # 处理返回的消息
             messages = response_json.get('messages', [])
@@ -217,12 +323,19 @@ class CozeHandler:
 
             raise Exception("API 返回数据中没有找到有效的护照信息")
             
+        except CozeAPIError as e:
+            logger.error(f"处理护照文本失败: {str(e)}")
+            raise CozeAPIError(f"处理护照文本失败: {str(e)}", e.status_code, e.retryable, e.retry_after)
+        except (requests.Timeout, requests.ConnectionError) as e:
+            logger.error(f"处理护照文本失败: {str(e)}")
+            raise CozeAPIError(f"处理护照文本失败: {str(e)}", retryable=True)
         except Exception as e:
             logger.error(f"处理护照文本失败: {str(e)}", exc_info=True)
             raise Exception(f"处理护照文本失败: {str(e)}")
 
-    def validate_response(self, response: Dict[str, Any]) -> bool:
-        """验证响应数据的完整性"""
+    @staticmethod
+    def validate_response(response: Dict[str, Any]) -> bool:
+        """验证响应数据的完整性（也用于校验本地机读区解析结果）"""
         # 必需字段
         required_fields = [
             'passport_number', 
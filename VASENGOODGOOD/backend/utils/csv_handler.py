@@ -1,241 +1,423 @@
+import io
+import re
+import csv
 import pandas as pd
-import os
-from typing import Dict, List, Any
+from itertools import islice
+from typing import Dict, Iterator, List, Any, Optional, Tuple
 import numpy as np
+from pandas.api.types import union_categoricals
 import json
+import time
 import logging
-import hashlib
+from difflib import SequenceMatcher
+from utils.cache_manager import MISS
+from utils.file_hash import hash_file
+from utils.handler_registry import estimate_size
+from utils.metrics import metrics
+from utils.passport_index import OCR_CONFUSIONS
+
+# 批量比对的字段及错误信息（与前端检查结果保持一致）
+RECONCILE_FIELDS = ['passport_number', 'surname', 'given_name', 'gender', 'birth_date', 'expiry_date']
+
+# 姓名模糊匹配的最低相似度
+NAME_SIMILARITY_THRESHOLD = 0.85
+
+# CSV 文件固定的 23 列（无表头）
+CSV_COLUMNS = [
+    'index', 'valid', 'passport_number', 'expiry_date',
+    'surname', 'given_name', 'gender', 'birth_date',
+    'nationality', 'unused1', 'unused2', 'unused3',
+    'unused4', 'photo_filename', 'batch_number', 'unused5',
+    'type', 'duration', 'category', 'validity',
+    'unused6', 'unused7', 'chinese_name'
+]
+
+# 取值种类很少的列按分类类型存储，其余列均按字符串读取（保留护照号码、日期的前导零）
+CATEGORY_COLUMNS = ['valid', 'gender', 'nationality', 'batch_number', 'type', 'category', 'validity']
+
+# 多出的字段读入该列，用于发现字段数超过 23 的行
+EXTRA_COLUMN = '_extra'
+TOO_MANY_FIELDS = '字段数超过 23 列'
+
+# 每次解析的行数
+CSV_CHUNK_SIZE = 50000
+
+# 校验报告中最多保留的问题行数
+MAX_REPORTED_ISSUES = 1000
+
+DATE_FIELDS = {'birth_date': '出生日期', 'expiry_date': '护照到期日'}
+
+
+def _passport_key(series: pd.Series) -> pd.Series:
+    """规范化护照号码作为连接键：大写、去除非字母数字、统一 OCR 易混淆字符"""
+    return (series.str.upper()
+            .str.replace(r'[^A-Z0-9]', '', regex=True)
+            .str.translate(OCR_CONFUSIONS))
+
+
+def _name_key(surname: pd.Series, given_name: pd.Series) -> pd.Series:
+    """规范化姓名：大写并去除空格等分隔符"""
+    return (surname + given_name).str.upper().str.replace(r'[^A-Z]', '', regex=True)
+
+
+def normalize_passport_number(value: Optional[str]) -> str:
+    """单个护照号码的规范化，与 _passport_key 的规则一致"""
+    return re.sub(r'[^A-Z0-9]', '', str(value or '').upper()).translate(OCR_CONFUSIONS)
+
+
+def normalize_name(value: Optional[str]) -> str:
+    """单个姓名字段的规范化：大写并去除空格等分隔符"""
+    return re.sub(r'[^A-Z]', '', str(value or '').upper())
+
+
+def _map_unique(series: pd.Series, func, missing) -> pd.Series:
+    """对去重后的取值执行 func 再按原顺序展开，日期等重复值多的列只需逐个处理一次；空值对应 missing"""
+    codes, uniques = pd.factorize(series)
+    mapped = np.append(func(pd.Series(uniques)).to_numpy(dtype=object), missing)
+    return pd.Series(mapped[codes], index=series.index)
+
 
 class CSVHandler:
-    def __init__(self, file_path: str, cache=None):
+    def __init__(self, file_path: str, cache=None, file_hash: str = None, photo_index=None):
         self.file_path = file_path
         self.data = None
-        self.photo_filename_map = {}  # 添加文件名映射字典
-        self.cache = cache  # 缓存对象
-        self.file_hash = None  # 文件哈希值
+        self.cache = cache  # 缓存管理器（CacheManager）
+        self.file_hash = file_hash  # 文件哈希值（上传时已计算则直接使用）
+        self.photo_index = photo_index  # 照片文件名索引（PhotoIndex），用于解析实际的照片文件名
+        self._json_records = None  # (照片索引版本, to_json 的结果)
+        self.validation = None  # 校验报告：问题行数、丢弃行数和问题明细
+        self.passport_index = {}  # 规范化护照号码 -> 行号（重复的号码取第一行）
+        self.identity_index = {}  # (规范化姓, 规范化名, 出生日期) -> 行号列表
+        self._data_bytes = None  # DataFrame 和索引占用的字节数（加载后不再变化）
         
         # 计算文件哈希
-        self._calculate_file_hash()
+        if not self.file_hash:
+            self._calculate_file_hash()
         
         # 从缓存加载或处理CSV
         self._load_or_process_csv()
 
     def _calculate_file_hash(self) -> None:
-        """计算文件的 SHA-256 哈希值"""
+        """计算整个文件的 SHA-256 哈希值"""
         try:
-            sha256_hash = hashlib.sha256()
-            with open(self.file_path, "rb") as f:
-                # 读取前1MB进行哈希计算
-                data = f.read(1024 * 1024)
-                if data:
-                    sha256_hash.update(data)
-            self.file_hash = sha256_hash.hexdigest()
+            self.file_hash = hash_file(self.file_path)
             logging.info(f"CSV文件哈希值: {self.file_hash}")
         except Exception as e:
             logging.error(f"计算CSV文件哈希值失败: {str(e)}")
             raise
 
-    def _get_cache_key(self) -> str:
-        """获取缓存键"""
-        return f"csv_data_{self.file_hash}"
-
-    def _get_file_cache_path(self) -> str:
-        """获取文件缓存路径"""
-        # 获取 uploads 目录
-        uploads_dir = os.path.dirname(os.path.dirname(self.file_path))
-        # 创建 cache 目录
-        cache_dir = os.path.join(uploads_dir, 'cache')
-        os.makedirs(cache_dir, exist_ok=True)
-        return os.path.join(cache_dir, f"{self.file_hash}_csv.json")
-
     def _load_or_process_csv(self) -> None:
-        """从缓存加载或处理CSV文件"""
-        # 如果有缓存对象，尝试从缓存加载
+        """从缓存加载或处理CSV文件
+
+        缓存内容是按列存储的 DataFrame（pickle），加载时直接恢复各列数组，
+        无需逐行重建字典。
+        """
         if self.cache:
-            cache_key = self._get_cache_key()
-            cached_data = self.cache.get(cache_key)
-            if cached_data:
-                logging.info(f"从内存缓存加载CSV数据: {cache_key}")
-                # 重构DataFrame
-                self.data = pd.DataFrame(cached_data['data'])
-                self.photo_filename_map = cached_data['photo_filename_map']
+            cached = self.cache.get('csv_data', self.file_hash)
+            if cached is not MISS:
+                logging.info(f"从缓存加载CSV数据: {self.file_hash}")
+                self.data = cached['data']
+                self.validation = cached['validation']
+                self.passport_index, self.identity_index = cached['indexes']
                 return
 
-        # 如果没有内存缓存，尝试从文件缓存加载
-        file_cache_path = self._get_file_cache_path()
-        if os.path.exists(file_cache_path):
-            try:
-                with open(file_cache_path, 'r', encoding='utf-8') as f:
-                    cached_data = json.load(f)
-                    # 重构DataFrame
-                    self.data = pd.DataFrame(cached_data['data'])
-                    self.photo_filename_map = cached_data['photo_filename_map']
-                    logging.info(f"从文件缓存加载CSV数据: {file_cache_path}")
-                    
-                    # 将文件缓存同步到内存缓存
-                    if self.cache:
-                        self.cache.set(self._get_cache_key(), cached_data)
-                    return
-            except Exception as e:
-                logging.warning(f"从文件缓存加载CSV失败: {str(e)}")
-
-        # 如果没有缓存或加载失败，处理CSV
+        # 如果没有缓存，处理CSV
         self.load_csv()
+        self._build_indexes()
         
         # 将处理结果保存到缓存
-        if self.data is not None:
-            # 准备缓存数据
-            cache_data = {
-                'data': self.data.to_dict('records'),
-                'photo_filename_map': self.photo_filename_map,
-                'processed_time': pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')
-            }
-            
-            # 保存到内存缓存
-            if self.cache:
-                self.cache.set(self._get_cache_key(), cache_data)
-            
-            # 保存到文件缓存
-            try:
-                with open(file_cache_path, 'w', encoding='utf-8') as f:
-                    json.dump(cache_data, f, ensure_ascii=False)
-                logging.info(f"CSV数据已缓存到文件: {file_cache_path}")
-            except Exception as e:
-                logging.error(f"保存CSV缓存到文件失败: {str(e)}")
+        if self.data is not None and self.cache:
+            self.cache.set('csv_data', self.file_hash, {
+                'data': self.data,
+                'validation': self.validation,
+                'indexes': (self.passport_index, self.identity_index)
+            })
 
     def load_csv(self) -> None:
-        """加载 CSV 文件"""
+        """分块读取 CSV 文件，逐块规范化并校验
+
+        所有列按字符串读取（少数分类列按分类类型），避免含空值的日期列被推断为浮点数。
+        格式有问题的行记录到校验报告中，不会中断加载；字段数超过 23 的行会错位，直接丢弃。
+        """
+        start_time = time.perf_counter()
         try:
-            # 设置列名
-            columns = [
-                'index', 'valid', 'passport_number', 'expiry_date',
-                'surname', 'given_name', 'gender', 'birth_date',
-                'nationality', 'unused1', 'unused2', 'unused3',
-                'unused4', 'photo_filename', 'batch_number', 'unused5',
-                'type', 'duration', 'category', 'validity',
-                'unused6', 'unused7', 'chinese_name'
-            ]
-            
-            # 读取 CSV 文件
-            self.data = pd.read_csv(self.file_path, header=None, names=columns)
-            
-            # 替换所有的 NaN 值为 None
-            self.data = self.data.replace({np.nan: None})
-            
-            # 确保日期格式统一
-            self.data['birth_date'] = self.data['birth_date'].apply(
-                lambda x: str(x).zfill(8) if pd.notna(x) else None
-            )
-            self.data['expiry_date'] = self.data['expiry_date'].apply(
-                lambda x: str(x).zfill(8) if pd.notna(x) else None
-            )
+            try:
+                self.data, self.validation = self._parse(lenient=False)
+            except pd.errors.ParserError as e:
+                # C 解析器遇到字段数超过 24 的行会报错，改为逐行拆分后重新读取
+                logging.warning(f"CSV 中有字段数过多的行，改为逐行拆分后重新读取: {str(e)}")
+                self.data, self.validation = self._parse(lenient=True)
             
-            # 更新照片文件名映射
-            self._update_photo_filename_map()
+            metrics.observe('csv_parse_seconds', time.perf_counter() - start_time)
+            metrics.inc('csv_rows_parsed_total', len(self.data))
             
             # 打印调试信息
-            logging.info(f"CSV 列名: {self.data.columns.tolist()}")
-            logging.info(f"第一行数据: {self.data.iloc[0].to_dict()}")
+            invalid_rows = self.validation['invalid_rows']
+            logging.info(f"CSV 已加载 {len(self.data)} 行，{invalid_rows} 行有格式问题，"
+                         f"丢弃 {self.validation['dropped_rows']} 行")
+            if invalid_rows:
+                logging.warning(f"CSV 格式问题示例: {self.validation['issues'][:3]}")
             
         except Exception as e:
             logging.error(f"CSV 加载错误: {str(e)}")
             raise Exception(f"无法加载 CSV 文件: {str(e)}")
 
-    def _update_photo_filename_map(self):
-        """更新照片文件名映射"""
-        try:
-            # 获取照片目录
-            photos_dir = os.path.join(os.path.dirname(os.path.dirname(self.file_path)), 'uploads', 'photos')
-            if not os.path.exists(photos_dir):
-                logging.warning(f"照片目录不存在: {photos_dir}")
-                return
-
-            # 获取目录中的所有文件
-            files = os.listdir(photos_dir)
+    def _parse(self, lenient: bool) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """分块读取、规范化并校验，返回 (数据, 校验报告)"""
+        chunks = []
+        issues = []
+        invalid_rows = 0
+        dropped_rows = 0
+        
+        for chunk in self._read_chunks(lenient):
+            chunk = self._normalize_chunk(chunk)
+            errors = self._validate_chunk(chunk)
             
-            # 为每个 CSV 中的文件名找到对应的实际文件名
-            for _, row in self.data.iterrows():
-                if pd.isna(row['photo_filename']):
-                    continue
-                    
-                base_filename = str(row['photo_filename']).strip()
-                if not base_filename:
+            has_errors = errors.any(axis=1)
+            invalid_rows += int(has_errors.sum())
+            if len(issues) < MAX_REPORTED_ISSUES:
+                issues.extend(self._describe_issues(chunk, errors, has_errors,
+                                                    MAX_REPORTED_ISSUES - len(issues)))
+            
+            too_many_fields = errors[TOO_MANY_FIELDS]
+            dropped_rows += int(too_many_fields.sum())
+            chunks.append(chunk[~too_many_fields].drop(columns=[EXTRA_COLUMN]))
+        
+        data = self._concat_chunks(chunks)
+        return data, {
+            'total_rows': len(data) + dropped_rows,
+            'invalid_rows': invalid_rows,
+            'dropped_rows': dropped_rows,
+            'issues': issues
+        }
+
+    def _read_chunks(self, lenient: bool) -> Iterator[pd.DataFrame]:
+        """按块读取 CSV，行号（索引）在各块之间连续
+
+        lenient 为真时先用 csv 模块拆分每行，多出的字段合并到哨兵列，
+        再按块交给 pandas 解析，与直接读取时的类型和空值处理保持一致。
+        """
+        options = {
+            'header': None,
+            'names': CSV_COLUMNS + [EXTRA_COLUMN],
+            'index_col': False,
+            'dtype': {column: 'category' if column in CATEGORY_COLUMNS else 'str'
+                      for column in CSV_COLUMNS + [EXTRA_COLUMN]}
+        }
+        if not lenient:
+            with pd.read_csv(self.file_path, chunksize=CSV_CHUNK_SIZE, **options) as reader:
+                yield from reader
+            return
+        
+        width = len(CSV_COLUMNS) + 1
+        offset = 0
+        with open(self.file_path, newline='', encoding='utf-8-sig') as f:
+            reader = csv.reader(f)
+            while True:
+                rows = list(islice(reader, CSV_CHUNK_SIZE))
+                if not rows:
+                    break
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(
+                    fields[:width - 1] + [','.join(fields[width - 1:])] if len(fields) > width else fields
+                    for fields in rows if fields  # 跳过空行
+                )
+                if not buffer.tell():
                     continue
+                buffer.seek(0)
+                chunk = pd.read_csv(buffer, **options)
+                chunk.index += offset
+                offset += len(chunk)
+                yield chunk
 
-                # 查找匹配的文件
-                for file in files:
-                    if base_filename in file:
-                        self.photo_filename_map[base_filename] = file
-                        logging.debug(f"找到文件名映射: {base_filename} -> {file}")
-                        break
+    @staticmethod
+    def _normalize_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+        """规范化日期：去除空白，位数不足 8 位的纯数字日期补前导零"""
+        def normalize(values: pd.Series) -> pd.Series:
+            values = values.str.strip()
+            return values.mask(values.str.fullmatch(r'\d{1,7}'), values.str.zfill(8))
 
-            logging.info(f"已建立 {len(self.photo_filename_map)} 个文件名映射")
-        except Exception as e:
-            logging.error(f"更新文件名映射时出错: {str(e)}")
+        # 转换回原来的类型，空值保持为空（pandas 2 中 astype('str') 会把 NaN 变成 'nan'）
+        for field in DATE_FIELDS:
+            chunk[field] = _map_unique(chunk[field], normalize, np.nan).astype(chunk[field].dtype)
+        return chunk
+
+    @staticmethod
+    def _validate_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+        """逐列校验，返回 问题描述 -> 每行是否有该问题 的布尔表"""
+        passport_number = chunk['passport_number']
+        # pandas 2 中 object 列的匹配结果含 NaN，与 True 比较得到布尔列
+        well_formed = passport_number.str.fullmatch(r'\s*[A-Za-z0-9]+\s*') == True  # noqa: E712
+        # 只有格式不正确的少数行才需要进一步区分是否为空
+        blank = ~well_formed & (passport_number.isna() | (passport_number.str.strip() == ''))
+        errors = {
+            TOO_MANY_FIELDS: chunk[EXTRA_COLUMN].notna(),
+            '缺少护照号码': blank,
+            '护照号码格式不正确': ~well_formed & ~blank,
+            '性别格式不正确': chunk['gender'].notna() & ~chunk['gender'].isin(['M', 'F'])
+        }
+
+        def invalid_date(values: pd.Series) -> pd.Series:
+            dates = pd.to_datetime(values.where(values.str.fullmatch(r'\d{8}')), format='%Y%m%d', errors='coerce')
+            return pd.Series(dates.isna(), index=values.index)
+
+        for field, display_name in DATE_FIELDS.items():
+            errors[f'{display_name}格式不正确'] = _map_unique(chunk[field], invalid_date, False).astype(bool)
+        return pd.DataFrame(errors, index=chunk.index)
+
+    @staticmethod
+    def _describe_issues(chunk: pd.DataFrame, errors: pd.DataFrame, has_errors: pd.Series,
+                         limit: int) -> List[Dict[str, Any]]:
+        """生成问题行的明细，row 为数据行号（从 1 开始，不含空行和 python 解析器跳过的行）"""
+        rows = errors[has_errors].head(limit)
+        messages = np.array(errors.columns)
+        return [
+            {
+                'row': int(row) + 1,
+                'index': None if pd.isna(chunk.at[row, 'index']) else chunk.at[row, 'index'],
+                'passport_number': None if pd.isna(chunk.at[row, 'passport_number']) else chunk.at[row, 'passport_number'],
+                'errors': list(messages[flags])
+            }
+            for row, flags in zip(rows.index, rows.to_numpy())
+        ]
+
+    @staticmethod
+    def _concat_chunks(chunks: List[pd.DataFrame]) -> pd.DataFrame:
+        """合并各块，分类列合并类别后保持分类类型（直接 concat 类别不同时会退化为 object）"""
+        if not chunks:
+            return pd.DataFrame({
+                column: pd.Series(dtype='category' if column in CATEGORY_COLUMNS else 'str')
+                for column in CSV_COLUMNS
+            })
+        data = pd.concat(chunks, ignore_index=True)
+        for column in CATEGORY_COLUMNS:
+            data[column] = union_categoricals([chunk[column] for chunk in chunks], ignore_order=True)
+        return data
+
+    def _build_indexes(self) -> None:
+        """建立护照号码和 (姓, 名, 出生日期) 到行号的索引，单条查询无需扫描整列"""
+        if self.data is None or self.data.empty:
+            self.passport_index, self.identity_index = {}, {}
+            return
+
+        frame = self._string_frame(['passport_number', 'surname', 'given_name', 'birth_date'])
+        keys = _passport_key(frame['passport_number'])
+        keys = keys[keys != ''].drop_duplicates()
+        self.passport_index = dict(zip(keys.tolist(), keys.index.tolist()))
+
+        def letters(values: pd.Series) -> pd.Series:
+            return values.str.upper().str.replace(r'[^A-Z]', '', regex=True)
+
+        surnames = _map_unique(frame['surname'], letters, '')
+        given_names = _map_unique(frame['given_name'], letters, '')
+        birth_dates = frame['birth_date'].str.strip()
+        usable = ((surnames != '') | (given_names != '')) & (birth_dates != '')
+        self.identity_index = {}
+        for row, key in zip(usable.index[usable].tolist(),
+                            zip(surnames[usable].tolist(), given_names[usable].tolist(), birth_dates[usable].tolist())):
+            self.identity_index.setdefault(key, []).append(row)
+
+    def memory_usage(self) -> int:
+        """估算占用的内存字节数：DataFrame、查询索引和 to_json 的结果"""
+        if self._data_bytes is None:
+            data_bytes = int(self.data.memory_usage(deep=True).sum()) if self.data is not None else 0
+            self._data_bytes = data_bytes + estimate_size(self.passport_index) + estimate_size(self.identity_index)
+        records = self._json_records[1] if self._json_records else None
+        return self._data_bytes + (estimate_size(records) if records else 0)
+
+    def _get_json_cache_key(self, photo_signature) -> str:
+        """获取 to_json 结果的缓存键（照片目录变化后实际文件名可能不同）"""
+        return f"{self.file_hash}_{photo_signature}"
 
     def to_json(self) -> List[Dict[str, Any]]:
-        """将 CSV 数据转换为 JSON 格式"""
+        """将 CSV 数据转换为 JSON 格式
+
+        按列一次性完成空值处理和类型转换，结果按文件哈希缓存。
+        """
         if self.data is None:
             return []
-        
-        # 将数据转换为字典列表
-        records = []
-        for _, row in self.data.iterrows():
-            photo_filename = str(row['photo_filename']) if pd.notna(row['photo_filename']) else ''
-            # 使用映射获取实际的文件名
-            actual_filename = self.photo_filename_map.get(photo_filename, photo_filename)
-            
-            record = {
-                'index': str(row['index']) if pd.notna(row['index']) else '',
-                'passport_number': str(row['passport_number']) if pd.notna(row['passport_number']) else '',
-                'surname': str(row['surname']) if pd.notna(row['surname']) else '',
-                'given_name': str(row['given_name']) if pd.notna(row['given_name']) else '',
-                'gender': str(row['gender']) if pd.notna(row['gender']) else '',
-                'birth_date': str(row['birth_date']) if pd.notna(row['birth_date']) else '',
-                'expiry_date': str(row['expiry_date']) if pd.notna(row['expiry_date']) else '',
-                'photo_filename': actual_filename,
-                'chinese_name': str(row['chinese_name']) if pd.notna(row.get('chinese_name')) else '',
-                'team_acceptance_number': str(row['batch_number']) if pd.notna(row.get('batch_number')) else ''
-            }
-            
-            # 清理数据中的 'nan' 字符串
-            for key, value in record.items():
-                if value.lower() == 'nan':
-                    record[key] = ''
-                
-            # 确保日期格式正确
-            for date_field in ['birth_date', 'expiry_date']:
-                if record[date_field]:
-                    record[date_field] = record[date_field].zfill(8)
-            
-            records.append(record)
-            
+
+        photo_signature = self.photo_index.signature if self.photo_index else None
+        if self._json_records is not None and self._json_records[0] == photo_signature:
+            return self._json_records[1]
+
+        if self.cache:
+            records = self.cache.get('csv_json', self._get_json_cache_key(photo_signature))
+            if records is not MISS:
+                self._json_records = (photo_signature, records)
+                return records
+
+        start_time = time.perf_counter()
+        frame = self._string_frame([
+            'index', 'passport_number', 'surname', 'given_name', 'gender',
+            'birth_date', 'expiry_date', 'photo_filename', 'chinese_name', 'batch_number'
+        ])
+
+        # 通过照片索引获取实际的文件名
+        if self.photo_index:
+            frame['photo_filename'] = self.photo_index.resolve_many(frame['photo_filename'].tolist())
+
+        # 确保日期格式正确
+        for date_field in ['birth_date', 'expiry_date']:
+            frame[date_field] = frame[date_field].str.zfill(8).where(frame[date_field] != '', '')
+
+        # 按列取出后再组装字典，避免 DataFrame.to_dict 逐个单元格装箱
+        frame = frame.rename(columns={'batch_number': 'team_acceptance_number'})
+        keys = list(frame.columns)
+        records = [dict(zip(keys, row)) for row in zip(*(frame[key].tolist() for key in keys))]
+        metrics.observe('csv_to_json_seconds', time.perf_counter() - start_time)
+
         # 打印调试信息
         if records:
             logging.info(f"转换后的第一条记录: {json.dumps(records[0], ensure_ascii=False)}")
         else:
             logging.warning("没有记录被转换")
-        
+
+        self._json_records = (photo_signature, records)
+        if self.cache:
+            self.cache.set('csv_json', self._get_json_cache_key(photo_signature), records)
         return records
 
-    def get_record_by_passport(self, passport_number: str) -> Dict[str, Any]:
-        """根据护照号码获取记录"""
-        if self.data is None:
+    def get_record(self, row: int) -> Dict[str, Any]:
+        """按行号获取记录，空值为 None"""
+        if self.data is None or not 0 <= row < len(self.data):
             return None
-        
-        record = self.data[self.data['passport_number'] == passport_number]
-        if record.empty:
+        return {key: None if pd.isna(value) else value for key, value in self.data.iloc[row].items()}
+
+    def find_row_by_passport(self, passport_number: str) -> Optional[int]:
+        """根据护照号码（规范化后）查找行号"""
+        return self.passport_index.get(normalize_passport_number(passport_number))
+
+    def find_rows_by_identity(self, surname: str, given_name: str, birth_date: str) -> List[int]:
+        """根据姓、名和出生日期查找行号"""
+        key = (normalize_name(surname), normalize_name(given_name), str(birth_date or '').strip().zfill(8))
+        return list(self.identity_index.get(key, []))
+
+    def find_row(self, passport_data: Dict[str, Any]) -> Optional[int]:
+        """为一条护照数据查找对应的 CSV 行：先按护照号码，再按唯一匹配的姓名和出生日期"""
+        row = self.find_row_by_passport(passport_data.get('passport_number'))
+        if row is not None:
+            return row
+        if not passport_data.get('birth_date'):
             return None
-        
-        # 确保返回的数据不包含 NaN
-        return record.iloc[0].replace({np.nan: None}).to_dict()
+        rows = self.find_rows_by_identity(passport_data.get('surname'), passport_data.get('given_name'),
+                                          passport_data.get('birth_date'))
+        return rows[0] if len(rows) == 1 else None
+
+    def get_record_by_passport(self, passport_number: str) -> Dict[str, Any]:
+        """根据护照号码获取记录"""
+        row = self.find_row_by_passport(passport_number)
+        return self.get_record(row) if row is not None else None
 
     def get_photo_path(self, record_index: int) -> str:
         """获取证件照路径"""
         if self.data is None or record_index >= len(self.data):
             return None
         
-        return self.data.iloc[record_index]['photo_filename']
+        photo_filename = self.data.iloc[record_index]['photo_filename']
+        if self.photo_index and photo_filename:
+            return self.photo_index.resolve_many([photo_filename])[0]
+        return photo_filename
 
     def compare_with_passport_data(self, record_index: int, passport_data: Dict[str, Any]) -> Dict[str, List[str]]:
         """比较 CSV 记录与护照数据"""
@@ -259,9 +441,7 @@ class CSVHandler:
         }
 
         for csv_field, display_name in fields_to_compare.items():
-            csv_value = None
-            if pd.isna(record[csv_field]):
-                csv_value = None
+            csv_value = None if pd.isna(record[csv_field]) else record[csv_field]
             passport_value = passport_data.get(csv_field)
             
             if csv_value and passport_value and str(csv_value).strip() != str(passport_value).strip():
@@ -269,4 +449,121 @@ class CSVHandler:
                     f"{display_name}不匹配: CSV={csv_value}, 护照={passport_value}"
                 )
 
-        return discrepancies 
\ No newline at end of file
+        return discrepancies 
+
+    def _string_frame(self, columns: List[str]) -> pd.DataFrame:
+        """将指定列转换为字符串，空值和 'nan' 统一为空字符串"""
+        frame = pd.DataFrame(index=self.data.index)
+        for column in columns:
+            values = self.data[column] if column in self.data.columns else pd.Series(None, index=self.data.index)
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.astype(object)
+            values = values.where(values.notna(), '').astype(str)
+            frame[column] = values.mask(values.str.lower() == 'nan', '')
+        return frame
+
+    def reconcile_passports(self, passport_data_list: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """批量比对 CSV 记录与护照数据，返回完整的匹配和差异报告
+
+        先按规范化护照号码做连接；未匹配的记录再按出生日期分块，
+        在块内按姓名相似度匹配，用于护照号码识别错误的情况。
+        """
+        if self.data is None:
+            return None
+
+        csv_frame = self._string_frame(['index', 'chinese_name'] + RECONCILE_FIELDS)
+        csv_frame[RECONCILE_FIELDS] = csv_frame[RECONCILE_FIELDS].apply(lambda c: c.str.strip())
+        csv_frame['row'] = np.arange(len(csv_frame))
+        csv_frame['key'] = _passport_key(csv_frame['passport_number'])
+
+        passports = pd.DataFrame(passport_data_list or [], columns=RECONCILE_FIELDS + ['page_number'])
+        passports[RECONCILE_FIELDS] = passports[RECONCILE_FIELDS].fillna('').astype(str).apply(lambda c: c.str.strip())
+        passports['passport_index'] = np.arange(len(passports))
+        passports['key'] = _passport_key(passports['passport_number'])
+
+        # 1. 按规范化护照号码连接（同一护照号只取第一条护照数据）
+        keyed_passports = passports[passports['key'] != ''].drop_duplicates('key')
+        matched = csv_frame[csv_frame['key'] != ''].merge(
+            keyed_passports, on='key', how='inner', suffixes=('', '_passport')
+        )
+        matched['match_type'] = 'passport_number'
+        # 同一条护照数据只匹配一条 CSV 记录
+        matched = matched.drop_duplicates('passport_index')
+
+        # 2. 未匹配的记录按出生日期分块，再按姓名相似度匹配
+        rest_csv = csv_frame[~csv_frame['row'].isin(matched['row']) & (csv_frame['birth_date'] != '')]
+        rest_passports = passports[~passports['passport_index'].isin(matched['passport_index'])
+                                   & (passports['birth_date'] != '')]
+        candidates = rest_csv.merge(rest_passports, on='birth_date', how='inner', suffixes=('', '_passport'))
+        if not candidates.empty:
+            csv_names = _name_key(candidates['surname'], candidates['given_name'])
+            passport_names = _name_key(candidates['surname_passport'], candidates['given_name_passport'])
+            candidates['similarity'] = [
+                SequenceMatcher(None, a, b).ratio() if a and b else 0.0
+                for a, b in zip(csv_names, passport_names)
+            ]
+            candidates = candidates[candidates['similarity'] >= NAME_SIMILARITY_THRESHOLD]
+            # 按相似度从高到低贪心地一对一匹配
+            candidates = (candidates.sort_values('similarity', ascending=False, kind='stable')
+                          .drop_duplicates('row').drop_duplicates('passport_index'))
+            candidates['birth_date_passport'] = candidates['birth_date']
+            candidates['match_type'] = 'name_birth_date'
+            matched = pd.concat([matched, candidates.drop(columns=['similarity'])], ignore_index=True)
+
+        # 3. 逐字段比较差异（向量化）
+        report = csv_frame.merge(
+            matched[['row', 'match_type', 'page_number', 'passport_index']
+                    + [f'{field}_passport' for field in RECONCILE_FIELDS]],
+            on='row', how='left'
+        )
+        has_match = report['match_type'].notna()
+        checks = {
+            '护照号码不匹配': report['passport_number'] != report['passport_number_passport'],
+            '姓名不匹配': (report['surname'] + ' ' + report['given_name']).str.strip()
+                         != (report['surname_passport'] + ' ' + report['given_name_passport']).str.strip(),
+            '性别不匹配': report['gender'] != report['gender_passport'],
+            '出生日期不匹配': report['birth_date'] != report['birth_date_passport'],
+            '到期日期不匹配': report['expiry_date'] != report['expiry_date_passport']
+        }
+        error_flags = pd.DataFrame({message: flag & has_match for message, flag in checks.items()})
+        messages = np.array(list(checks.keys()))
+        errors = [list(messages[row]) for row in error_flags.to_numpy()]
+
+        page_numbers = report['page_number'].astype(object).where(report['page_number'].notna(), None)
+        records = [
+            {
+                'row': int(row),
+                'index': index,
+                'chinese_name': chinese_name,
+                'passport_number': passport_number,
+                'status': ('error' if row_errors else 'ok') if match_type else 'missing',
+                'match_type': match_type,
+                'page_number': int(page_number) if page_number is not None else None,
+                'passport_index': int(passport_index) if match_type else None,
+                'errors': row_errors if match_type else ['未找到对应的护照数据']
+            }
+            for row, index, chinese_name, passport_number, match_type, page_number, passport_index, row_errors in zip(
+                report['row'], report['index'], report['chinese_name'], report['passport_number'],
+                report['match_type'].astype(object).where(has_match, None), page_numbers,
+                report['passport_index'].fillna(-1), errors
+            )
+        ]
+
+        unmatched_passports = passports[~passports['passport_index'].isin(matched['passport_index'])]
+        summary = {
+            'total_records': len(records),
+            'matched': int(has_match.sum()),
+            'matched_by_passport_number': int((report['match_type'] == 'passport_number').sum()),
+            'matched_by_name_birth_date': int((report['match_type'] == 'name_birth_date').sum()),
+            'with_errors': sum(1 for record in records if record['status'] == 'error'),
+            'missing': int((~has_match).sum()),
+            'unmatched_passports': len(unmatched_passports)
+        }
+
+        return {
+            'summary': summary,
+            'records': records,
+            'unmatched_passports': [
+                passport_data_list[i] for i in unmatched_passports['passport_index']
+            ]
+        }
@@ -0,0 +1,88 @@
+import os
+import time
+import logging
+from threading import Lock
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DirectoryQuota:
+    """限制缓存目录（页面渲染图、照片缩略图）的磁盘占用
+
+    每写入约上限的 1/10 检查一次目录：删除超过 max_age 的文件；总大小超过上限时
+    按修改时间删除最久未使用的文件，直到低于上限的 90%。命中缓存时调用 touch() 更新修改时间。
+    """
+
+    def __init__(self, directory: str, max_bytes: int, max_age: Optional[float] = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age  # 文件最长保留时间（秒），None 表示不限制
+        self._written = 0  # 上次清理后写入的字节数
+        self._lock = Lock()
+
+    def record_write(self, size: int) -> None:
+        """记录新写入的文件大小，累计达到上限的 1/10 时清理目录"""
+        with self._lock:
+            self._written += size
+            should_prune = self._written >= self.max_bytes // 10
+            if should_prune:
+                self._written = 0
+        if should_prune:
+            self.prune()
+
+    @staticmethod
+    def touch(path: str) -> None:
+        """更新文件的修改时间，清理时保留最近使用的文件"""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def prune(self) -> int:
+        """清理过期文件和超出上限的文件，返回删除的文件数"""
+        now = time.time()
+        entries = []
+        total_bytes = 0
+        removed = 0
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not entry.is_file():
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    # 过期文件（以及残留的临时文件）直接删除
+                    if ((self.max_age and stat.st_mtime + self.max_age <= now)
+                            or (entry.name.endswith('.tmp') and stat.st_mtime + 3600 <= now)):
+                        removed += self._remove(entry.path)
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total_bytes += stat.st_size
+        except FileNotFoundError:
+            return 0
+
+        if total_bytes > self.max_bytes:
+            entries.sort()
+            target = self.max_bytes * 0.9
+            for _, size, path in entries:
+                if total_bytes <= target:
+                    break
+                if self._remove(path):
+                    total_bytes -= size
+                    removed += 1
+
+        if removed:
+            logger.info(f"缓存目录清理：{self.directory} 已删除 {removed} 个文件，"
+                        f"当前占用 {total_bytes // (1024 * 1024)}MB")
+        return removed
+
+    @staticmethod
+    def _remove(path: str) -> int:
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            return 0
@@ -0,0 +1,79 @@
+import os
+import uuid
+import hashlib
+import logging
+from threading import Lock
+from typing import BinaryIO, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 每次读取的块大小
+CHUNK_SIZE = 1024 * 1024
+
+# 进程内的哈希结果缓存：路径 -> ((文件大小, 修改时间), 哈希值)
+_hash_memo = {}
+_hash_memo_lock = Lock()
+_HASH_MEMO_MAX_ENTRIES = 1024
+
+
+def _file_signature(file_path: str) -> Tuple[int, int]:
+    """文件大小和修改时间，任一变化都视为内容已改变"""
+    stat = os.stat(file_path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def record_hash(file_path: str, file_hash: str) -> None:
+    """记录文件当前签名对应的哈希值（用于文件重命名后复用已算出的哈希）"""
+    file_path = os.path.abspath(file_path)
+    with _hash_memo_lock:
+        if len(_hash_memo) >= _HASH_MEMO_MAX_ENTRIES:
+            _hash_memo.clear()
+        _hash_memo[file_path] = (_file_signature(file_path), file_hash)
+
+
+def hash_file(file_path: str) -> str:
+    """分块计算整个文件的 SHA-256，作为文件内容的唯一标识
+
+    文件大小和修改时间未变化时直接返回上次的结果，避免重复读取整个文件。
+    """
+    file_path = os.path.abspath(file_path)
+    signature = _file_signature(file_path)
+    with _hash_memo_lock:
+        memo = _hash_memo.get(file_path)
+    if memo and memo[0] == signature:
+        return memo[1]
+
+    sha256_hash = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha256_hash.update(chunk)
+    file_hash = sha256_hash.hexdigest()
+
+    record_hash(file_path, file_hash)
+    return file_hash
+
+
+def save_stream(stream: BinaryIO, file_path: str) -> Tuple[str, int]:
+    """将上传流分块写入文件，同时计算哈希值，返回 (哈希值, 文件大小)
+
+    先写入同目录下的临时文件再原子替换，不会出现写了一半的文件。
+    """
+    file_path = os.path.abspath(file_path)
+    tmp_path = f"{file_path}.{uuid.uuid4().hex}.uploading"
+    sha256_hash = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                sha256_hash.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        os.replace(tmp_path, file_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    file_hash = sha256_hash.hexdigest()
+    record_hash(file_path, file_hash)
+    return file_hash, size
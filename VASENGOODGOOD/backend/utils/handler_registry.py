@@ -0,0 +1,150 @@
+import os
+import sys
+import logging
+from itertools import islice
+from collections import OrderedDict, defaultdict
+from threading import Lock
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 估算容器大小时抽样的元素个数
+SIZE_SAMPLE = 100
+
+
+def _shallow_size(obj: Any) -> int:
+    """对象本身及其直接包含的元素的大小"""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(sys.getsizeof(key) + sys.getsizeof(value) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(sys.getsizeof(item) for item in obj)
+    return size
+
+
+def estimate_size(container: Any) -> int:
+    """按抽样元素的平均大小估算字典或列表（如记录列表、索引）占用的字节数"""
+    if not container:
+        return sys.getsizeof(container)
+    items = container.items() if isinstance(container, dict) else container
+    sample = list(islice(items, SIZE_SAMPLE))
+    per_item = sum(_shallow_size(item) for item in sample) / len(sample)
+    return int(sys.getsizeof(container) + per_item * len(container))
+
+
+class HandlerRegistry:
+    """进程内的 CSVHandler/PDFHandler 实例注册表，按 (类型, 文件内容哈希) 复用
+
+    同一文件的多次请求直接使用内存中的处理器，不再重新读取缓存、重建 DataFrame。
+    - 按处理器的 memory_usage() 统计内存占用，超过 max_bytes 或 max_entries 时淘汰最久未使用的处理器
+    - 按需模式的 PDF 处理器会逐步提取页面文本，每次取用时重新统计占用
+    - 同一处理器只创建一次，并发请求等待创建完成后共用
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024, max_entries: int = 16):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (类型, 哈希) -> [处理器, 字节数, 文件路径]
+        self._bytes = 0
+        self._lock = Lock()
+        self._creating: Dict[tuple, Lock] = {}  # 正在创建的处理器 -> 创建锁
+        self._stats = defaultdict(int)
+
+    def get(self, kind: str, file_hash: str, file_path: str, factory: Callable[[], Any]) -> Any:
+        """获取处理器，不存在时调用 factory 创建并登记"""
+        key = (kind, file_hash)
+        handler = self._lookup(key)
+        if handler is not None:
+            self._count('hits')
+            return handler
+
+        with self._lock:
+            creating = self._creating.setdefault(key, Lock())
+        with creating:
+            handler = self._lookup(key)
+            if handler is not None:
+                self._count('hits')
+                return handler
+            try:
+                handler = factory()
+                self._count('misses')
+                self._store(key, handler, file_path)
+            finally:
+                with self._lock:
+                    self._creating.pop(key, None)
+        return handler
+
+    def invalidate(self, file_hash: Optional[str] = None, file_path: Optional[str] = None) -> int:
+        """删除指定内容哈希或文件路径的处理器（文件被覆盖时旧内容的处理器按路径删除），返回删除数量"""
+        file_path = os.path.abspath(file_path) if file_path else None
+        with self._lock:
+            keys = [key for key, (_, _, path) in self._entries.items()
+                    if key[1] == file_hash or (file_path and path == file_path)]
+            for key in keys:
+                self._bytes -= self._entries.pop(key)[1]
+            self._stats['invalidations'] += len(keys)
+        if keys:
+            logger.info(f"已移除 {len(keys)} 个处理器: {file_hash or file_path}")
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), bytes=self._bytes)
+
+    def _lookup(self, key) -> Any:
+        """取出处理器并更新最近使用顺序和内存占用"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            handler = entry[0]
+        self._update_size(key, handler)
+        return handler
+
+    def _store(self, key, handler: Any, file_path: str) -> None:
+        size = self._measure(handler)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = [handler, size, os.path.abspath(file_path)]
+            self._bytes += size
+            self._evict(keep=key)
+
+    def _update_size(self, key, handler: Any) -> None:
+        size = self._measure(handler)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] is not handler:
+                return
+            self._bytes += size - entry[1]
+            entry[1] = size
+            self._evict(keep=key)
+
+    def _evict(self, keep) -> None:
+        """淘汰最久未使用的处理器，刚取用的处理器保留（调用方需持有锁）"""
+        while len(self._entries) > 1 and (self._bytes > self.max_bytes or len(self._entries) > self.max_entries):
+            key = next(iter(self._entries))
+            if key == keep:
+                break
+            self._bytes -= self._entries.pop(key)[1]
+            self._stats['evictions'] += 1
+            logger.debug(f"淘汰处理器: {key[0]} {key[1]}")
+
+    @staticmethod
+    def _measure(handler: Any) -> int:
+        try:
+            return int(handler.memory_usage())
+        except Exception as e:
+            logger.warning(f"统计处理器内存占用失败: {str(e)}")
+            return 0
+
+    def _count(self, metric: str) -> None:
+        with self._lock:
+            self._stats[metric] += 1
@@ -0,0 +1,393 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+from contextlib import contextmanager
+from threading import Lock, Thread
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Iterable, Iterator, Callable, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows 开发环境只有单进程，使用进程内的锁即可
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+STATE_QUEUED = 'queued'
+STATE_RUNNING = 'running'
+STATE_DONE = 'done'
+STATE_FAILED = 'failed'
+FINISHED_STATES = (STATE_DONE, STATE_FAILED)
+
+# 状态快照中固定保留的字段，其余字段只保留最新事件的内容
+BASE_STATE_KEYS = ('job_id', 'job_type', 'params', 'created_time')
+
+
+class JobManager:
+    """后台任务管理器
+
+    任务函数是一个逐条产生进度事件(dict)的生成器，在后台线程池中执行。
+    每个事件追加到 jobs_dir 下的 {job_id}.jsonl，最新状态写入 {job_id}.json，
+    因此任意 gunicorn worker 都可以通过任务ID查询进度或订阅事件流。
+
+    提交时可以指定去重键：同一个键的任务运行期间，其他 worker 再次提交会直接返回
+    正在运行的任务ID，不会重复执行。占用关系记录在 jobs_dir 下的 {键哈希}.lease 文件中，
+    读写时加文件锁。
+
+    本进程中排队和运行的任务由心跳线程定期更新状态文件的修改时间，
+    所在 worker 退出后心跳停止，超过 stale_timeout 的任务视为失效。
+    """
+
+    def __init__(self, jobs_dir: str, max_workers: int = 4, retention: int = 24 * 60 * 60,
+                 stale_timeout: int = 120):
+        self.jobs_dir = jobs_dir
+        self.retention = retention  # 已结束任务文件的保留时间（秒）
+        self.stale_timeout = stale_timeout  # 未结束的任务超过该时间没有心跳视为失效（秒）
+        self.heartbeat_interval = max(1.0, min(30.0, stale_timeout / 4))  # 心跳间隔（秒）
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._lease_thread_lock = Lock()
+        self._counts_lock = Lock()
+        self._queued = 0  # 本进程中等待执行的任务数
+        self._running = 0  # 本进程中正在执行的任务数
+        self._active = set()  # 本进程中排队或运行的任务ID，由心跳线程维持
+        self._heartbeat_thread = None
+        os.makedirs(self.jobs_dir, exist_ok=True)
+
+    def _get_state_path(self, job_id: str) -> str:
+        """获取任务状态文件路径"""
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _get_events_path(self, job_id: str) -> str:
+        """获取任务事件日志路径"""
+        return os.path.join(self.jobs_dir, f"{job_id}.jsonl")
+
+    def _create(self, job_type: str, params: Optional[Dict[str, Any]] = None) -> str:
+        """创建任务状态文件和空的事件日志"""
+        self._prune()
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        open(self._get_events_path(job_id), 'wb').close()
+        self._write_state(job_id, {
+            'job_id': job_id,
+            'job_type': job_type,
+            'params': params or {},
+            'state': STATE_QUEUED,
+            'status': '排队中...',
+            'progress': 0,
+            'created_time': now,
+            'updated_time': now
+        })
+        return job_id
+
+    def submit(self, job_type: str, func: Callable[..., Iterable[Dict[str, Any]]], *args,
+               params: Optional[Dict[str, Any]] = None, dedupe_key: Optional[str] = None) -> str:
+        """提交后台任务，返回任务ID
+
+        指定 dedupe_key 时，如果相同键的任务仍在运行（包括其他 worker 中的任务），
+        直接返回该任务的ID，调用方订阅同一个事件流。
+        """
+        if dedupe_key is None:
+            job_id = self._create(job_type, params)
+        else:
+            job_id, created = self._create_or_attach(job_type, params, dedupe_key)
+            if not created:
+                logger.info(f"相同任务正在运行，复用任务: {job_type} {job_id}")
+                return job_id
+
+        with self._counts_lock:
+            self._queued += 1
+            self._active.add(job_id)
+        self._start_heartbeat()
+        self.executor.submit(self._run, job_id, func, *args, dedupe_key=dedupe_key, queued=True)
+        logger.info(f"已提交后台任务: {job_type} {job_id}")
+        return job_id
+
+    def _get_lease_path(self, dedupe_key: str) -> str:
+        """获取去重键的占用文件路径（键取哈希，避免特殊字符）"""
+        key_hash = hashlib.sha256(dedupe_key.encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self.jobs_dir, f"{key_hash}.lease")
+
+    @contextmanager
+    def _lease_lock(self):
+        """跨进程互斥：线程锁 + jobs_dir 下锁文件的排他锁"""
+        with self._lease_thread_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.jobs_dir, '.lease.lock'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_lease(self, lease_path: str) -> Optional[str]:
+        """读取占用该键的任务ID"""
+        try:
+            with open(lease_path, 'r', encoding='utf-8') as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def _create_or_attach(self, job_type: str, params: Optional[Dict[str, Any]],
+                          dedupe_key: str) -> Tuple[str, bool]:
+        """返回 (任务ID, 是否新建)：相同键的任务仍在运行时返回该任务，否则新建任务并占用该键"""
+        lease_path = self._get_lease_path(dedupe_key)
+        with self._lease_lock():
+            holder = self._read_lease(lease_path)
+            if holder:
+                state = self.get(holder)
+                if state and not self._can_take_over(state):
+                    return holder, False
+
+            job_id = self._create(job_type, params)
+            with open(lease_path, 'w', encoding='utf-8') as f:
+                f.write(job_id)
+            return job_id, True
+
+    def _can_take_over(self, state: Dict[str, Any]) -> bool:
+        """占用该键的任务已结束，或正在运行但已没有心跳（所在 worker 已退出）时，由新任务接管
+
+        排队中的任务即使等待时间很长也不接管，避免负载高时重复处理同一文件；
+        所在 worker 退出后排队任务的心跳同样会停止，此时也可以接管。
+        """
+        if state.get('state') in FINISHED_STATES:
+            return True
+        return self.is_stale(state)
+
+    def _release_lease(self, dedupe_key: str, job_id: str) -> None:
+        """任务结束后释放去重键（仅当仍由该任务占用时）"""
+        lease_path = self._get_lease_path(dedupe_key)
+        try:
+            with self._lease_lock():
+                if self._read_lease(lease_path) == job_id:
+                    os.remove(lease_path)
+        except OSError as e:
+            logger.warning(f"释放任务占用失败: {job_id}, {str(e)}")
+
+    def run(self, job_type: str, func: Callable[..., Iterable[Dict[str, Any]]], *args,
+            params: Optional[Dict[str, Any]] = None) -> str:
+        """在当前线程中同步执行任务（用于可立即完成的任务，如命中缓存）"""
+        job_id = self._create(job_type, params)
+        self._run(job_id, func, *args)
+        return job_id
+
+    def stats(self) -> Dict[str, int]:
+        """本进程中排队和正在执行的任务数"""
+        with self._counts_lock:
+            return {'queued': self._queued, 'running': self._running}
+
+    def _run(self, job_id: str, func: Callable[..., Iterable[Dict[str, Any]]], *args,
+             dedupe_key: Optional[str] = None, queued: bool = False) -> None:
+        """执行任务并记录每个进度事件"""
+        with self._counts_lock:
+            if queued:
+                self._queued -= 1
+            self._running += 1
+        try:
+            self._execute(job_id, func, *args, dedupe_key=dedupe_key)
+        finally:
+            with self._counts_lock:
+                self._running -= 1
+                self._active.discard(job_id)
+
+    def _start_heartbeat(self) -> None:
+        """首次提交任务时启动心跳线程（gunicorn fork 出的每个 worker 各自启动）"""
+        with self._counts_lock:
+            if self._heartbeat_thread is not None and self._heartbeat_thread.is_alive():
+                return
+            self._heartbeat_thread = Thread(target=self._heartbeat_loop, name='job-heartbeat', daemon=True)
+            self._heartbeat_thread.start()
+
+    def _heartbeat_loop(self) -> None:
+        """定期更新本进程中排队和运行的任务状态文件的修改时间"""
+        while True:
+            time.sleep(self.heartbeat_interval)
+            with self._counts_lock:
+                job_ids = list(self._active)
+            for job_id in job_ids:
+                try:
+                    os.utime(self._get_state_path(job_id))
+                except OSError:
+                    pass
+
+    def _execute(self, job_id: str, func: Callable[..., Iterable[Dict[str, Any]]], *args,
+                 dedupe_key: Optional[str] = None) -> None:
+        """执行任务函数，逐条记录事件并在结束时更新最终状态"""
+        self._update_state(job_id, {'state': STATE_RUNNING, 'status': '正在处理...'})
+        last_event = {}
+        try:
+            for event in func(*args):
+                last_event = event
+                self._record(job_id, event, STATE_RUNNING)
+        except Exception as e:
+            logger.error(f"后台任务执行失败: {job_id}, {str(e)}", exc_info=True)
+            last_event = {
+                'status': '处理失败',
+                'progress': 100,
+                'error': str(e)
+            }
+            self._record(job_id, last_event, STATE_RUNNING)
+
+        final_state = STATE_FAILED if last_event.get('error') else STATE_DONE
+        self._update_state(job_id, {'state': final_state})
+        if dedupe_key is not None:
+            self._release_lease(dedupe_key, job_id)
+        logger.info(f"后台任务结束: {job_id}, 状态: {final_state}")
+
+    def _record(self, job_id: str, event: Dict[str, Any], state: str) -> None:
+        """追加事件到事件日志并更新状态快照"""
+        line = json.dumps(event, ensure_ascii=False) + '\n'
+        with open(self._get_events_path(job_id), 'ab') as f:
+            f.write(line.encode('utf-8'))
+
+        # 快照只保留最新事件，最终结果随最后一个事件一起保存
+        current = self.get(job_id) or {'job_id': job_id}
+        snapshot = {key: current[key] for key in BASE_STATE_KEYS if key in current}
+        snapshot['state'] = state
+        snapshot.update(event)
+        snapshot['updated_time'] = time.time()
+        self._write_state(job_id, snapshot)
+
+    def _write_state(self, job_id: str, state: Dict[str, Any]) -> None:
+        """原子写入任务状态文件"""
+        state_path = self._get_state_path(job_id)
+        tmp_path = f"{state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, state_path)
+
+    def _update_state(self, job_id: str, update: Dict[str, Any]) -> None:
+        """合并更新任务状态"""
+        state = self.get(job_id) or {'job_id': job_id}
+        state.pop('heartbeat_time', None)
+        state.update(update)
+        state['updated_time'] = time.time()
+        self._write_state(job_id, state)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """获取任务状态，任务不存在时返回 None"""
+        if not self._is_valid_job_id(job_id):
+            return None
+
+        state_path = self._get_state_path(job_id)
+        if not os.path.exists(state_path):
+            return None
+
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+                state['heartbeat_time'] = os.fstat(f.fileno()).st_mtime
+                return state
+        except Exception as e:
+            logger.error(f"读取任务状态失败: {job_id}, {str(e)}")
+            return None
+
+    def is_stale(self, state: Dict[str, Any]) -> bool:
+        """判断未结束的任务是否已失效：超过 stale_timeout 没有心跳（所在 worker 已退出）
+
+        排队中的任务同样有心跳，线程池占满时等待执行的任务不会被误判为失效。
+        """
+        last_seen = max(state.get('heartbeat_time', 0), state.get('updated_time', 0))
+        return (state.get('state') not in FINISHED_STATES and
+                time.time() - last_seen > self.stale_timeout)
+
+    def read_events(self, job_id: str, offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        """读取事件日志中 offset 之后的完整事件，返回 (事件列表, 新的 offset)，用于轮询"""
+        with open(self._get_events_path(job_id), 'rb') as f:
+            f.seek(offset)
+            chunk = f.read()
+
+        # 只返回完整的行，未写完的行留到下次读取
+        end = chunk.rfind(b'\n') + 1
+        events = []
+        for line in chunk[:end].split(b'\n'):
+            if line.strip():
+                event = json.loads(line.decode('utf-8'))
+                event['job_id'] = job_id
+                events.append(event)
+        return events, offset + end
+
+    def iter_events(self, job_id: str, poll_interval: float = 0.5) -> Iterator[str]:
+        """订阅任务事件流，逐行返回 JSON 字符串，直到任务结束"""
+        offset = 0
+        while True:
+            state = self.get(job_id)
+            if state is None:
+                yield json.dumps({'status': '任务不存在', 'progress': 100, 'error': '任务不存在'},
+                                 ensure_ascii=False) + '\n'
+                return
+
+            # 先读取状态再读取日志，保证任务结束时所有事件都已写入
+            events, offset = self.read_events(job_id, offset)
+            for event in events:
+                yield json.dumps(event, ensure_ascii=False) + '\n'
+
+            if state.get('state') in FINISHED_STATES:
+                return
+
+            if self.is_stale(state):
+                yield json.dumps(self.stale_event(job_id), ensure_ascii=False) + '\n'
+                return
+
+            if not events:
+                time.sleep(poll_interval)
+
+    @staticmethod
+    def stale_event(job_id: str) -> Dict[str, Any]:
+        """任务失效时返回给客户端的事件"""
+        return {'status': '处理失败', 'progress': 100, 'job_id': job_id,
+                'error': '任务长时间无响应，请重新提交'}
+
+    @staticmethod
+    def _is_valid_job_id(job_id: str) -> bool:
+        """任务ID必须是32位十六进制字符串，防止路径穿越"""
+        return isinstance(job_id, str) and len(job_id) == 32 and all(c in '0123456789abcdef' for c in job_id)
+
+    def _prune(self) -> None:
+        """删除超过保留时间的任务文件
+
+        锁文件和占用文件不删除：锁文件的修改时间不会变化，删除后其他进程会创建新的文件，
+        文件锁不再互斥；占用文件在任务结束时释放。
+        """
+        try:
+            expire_time = time.time() - self.retention
+            with os.scandir(self.jobs_dir) as it:
+                for entry in it:
+                    if entry.name.endswith(('.lock', '.lease')):
+                        continue
+                    if entry.is_file() and entry.stat().st_mtime < expire_time:
+                        os.remove(entry.path)
+        except Exception as e:
+            logger.warning(f"清理过期任务文件失败: {str(e)}")
+
+    def clear_finished(self) -> int:
+        """删除已结束任务的状态和事件文件，返回删除的文件数
+
+        排队和运行中的任务、锁文件和占用文件保留，其他 worker 仍可查询进度，去重也不受影响。
+        """
+        removed = 0
+        try:
+            with os.scandir(self.jobs_dir) as it:
+                job_ids = [entry.name[:-5] for entry in it if entry.name.endswith('.json')]
+        except FileNotFoundError:
+            return 0
+
+        for job_id in job_ids:
+            state = self.get(job_id)
+            if not state or state.get('state') not in FINISHED_STATES:
+                continue
+            for path in (self._get_state_path(job_id), self._get_events_path(job_id)):
+                try:
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(f"删除任务文件失败: {path}, {str(e)}")
+        return removed
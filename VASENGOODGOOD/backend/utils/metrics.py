@@ -0,0 +1,168 @@
+import time
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+from threading import Lock
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from flask import g, has_request_context
+
+logger = logging.getLogger(__name__)
+
+# 耗时直方图的桶上限（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# 指标说明，输出为 Prometheus 的 HELP 行
+METRIC_HELP = {
+    'http_request_seconds': 'HTTP 请求处理耗时（流式响应只包含首个字节之前的时间）',
+    'pdf_extract_seconds': 'PDF 打开并提取全部页面文本的耗时',
+    'pdf_page_text_seconds': '按需提取单页文本的耗时',
+    'pdf_render_seconds': 'PDF 单页渲染为图片的耗时',
+    'pdf_pages_extracted_total': '已提取文本的 PDF 页数',
+    'coze_request_seconds': 'Coze API 单次请求耗时，按状态码或异常类型区分',
+    'scheduler_retries_total': '远程调用的重试次数',
+    'scheduler_failures_total': '重试后仍然失败的远程调用数',
+    'csv_parse_seconds': 'CSV 文件解析耗时',
+    'csv_to_json_seconds': 'CSV 转换为记录列表的耗时（不含命中缓存的情况）',
+    'csv_rows_parsed_total': '已解析的 CSV 行数',
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, str, Dict[str, object], float]  # (指标名, 类型, 标签, 值)
+
+
+def _escape(value: str) -> str:
+    """转义标签值中的反斜杠、引号和换行"""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class MetricsRegistry:
+    """进程内的指标注册表：计数器、耗时直方图，以及导出时调用的状态采集函数
+
+    每个 gunicorn worker 各自计数，/metrics 返回处理该请求的 worker 的数据。
+    在请求上下文中计时的区间同时汇总到该请求的 Server-Timing 响应头。
+    """
+
+    def __init__(self, prefix: str = 'passport_', buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.buckets = tuple(buckets)
+        self._counters: Dict[str, Dict[Labels, float]] = defaultdict(dict)
+        self._histograms: Dict[str, Dict[Labels, List[float]]] = defaultdict(dict)  # 各桶计数 + [总和, 次数]
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+        self._lock = Lock()
+
+    @staticmethod
+    def _labels(labels: Dict[str, object]) -> Labels:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        """计数器加 amount"""
+        key = self._labels(labels)
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        """记录一次耗时"""
+        key = self._labels(labels)
+        with self._lock:
+            series = self._histograms[name]
+            values = series.get(key)
+            if values is None:
+                values = series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    values[i] += 1
+            values[-2] += seconds
+            values[-1] += 1
+        add_server_timing(name, seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """统计代码块的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def register_collector(self, collector: Callable[[], Iterable[Sample]]) -> None:
+        """注册导出时调用的采集函数，返回 (指标名, 'gauge'|'counter', 标签, 值) 列表"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """以 Prometheus 文本格式输出所有指标"""
+        lines = []
+
+        def header(name: str, metric_type: str) -> None:
+            help_text = METRIC_HELP.get(name)
+            if help_text:
+                lines.append(f"# HELP {self.prefix}{name} {help_text}")
+            lines.append(f"# TYPE {self.prefix}{name} {metric_type}")
+
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {name: {key: list(values) for key, values in series.items()}
+                          for name, series in self._histograms.items()}
+
+        for name in sorted(counters):
+            header(name, 'counter')
+            for key, value in sorted(counters[name].items()):
+                lines.append(f"{self.prefix}{name}{_format_labels(key)} {_format_value(value)}")
+
+        for name in sorted(histograms):
+            header(name, 'histogram')
+            for key, values in sorted(histograms[name].items()):
+                for bound, count in zip(self.buckets, values):
+                    lines.append(f"{self.prefix}{name}_bucket{_format_labels(key + (('le', str(bound)),))} {count}")
+                lines.append(f"{self.prefix}{name}_bucket{_format_labels(key + (('le', '+Inf'),))} {values[-1]}")
+                lines.append(f"{self.prefix}{name}_sum{_format_labels(key)} {_format_value(values[-2])}")
+                lines.append(f"{self.prefix}{name}_count{_format_labels(key)} {values[-1]}")
+
+        collected: Dict[str, Tuple[str, List[Tuple[Labels, float]]]] = {}
+        for collector in self._collectors:
+            try:
+                for name, metric_type, labels, value in collector():
+                    collected.setdefault(name, (metric_type, []))[1].append((self._labels(labels), value))
+            except Exception as e:
+                logger.warning(f"采集指标失败: {str(e)}")
+        for name in sorted(collected):
+            metric_type, samples = collected[name]
+            header(name, metric_type)
+            for key, value in samples:
+                lines.append(f"{self.prefix}{name}{_format_labels(key)} {_format_value(value)}")
+
+        return '\n'.join(lines) + '\n'
+
+
+def add_server_timing(name: str, seconds: float) -> None:
+    """在请求上下文中累计各区间的耗时，用于 Server-Timing 响应头（后台线程中不记录）"""
+    if not has_request_context():
+        return
+    timings = g.setdefault('server_timing', {})
+    total, count = timings.get(name, (0.0, 0))
+    timings[name] = (total + seconds, count + 1)
+
+
+def server_timing_header(total_seconds: Optional[float] = None) -> Optional[str]:
+    """生成当前请求的 Server-Timing 响应头"""
+    entries = []
+    for name, (seconds, count) in g.get('server_timing', {}).items():
+        metric = name[:-len('_seconds')] if name.endswith('_seconds') else name
+        entries.append(f'{metric};dur={seconds * 1000:.1f};desc="{count}x"')
+    if total_seconds is not None:
+        entries.append(f'total;dur={total_seconds * 1000:.1f}')
+    return ', '.join(entries) or None
+
+
+# 进程内共享的指标注册表
+metrics = MetricsRegistry()
@@ -0,0 +1,118 @@
+import re
+import time
+import logging
+from typing import Dict, Any, Optional, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# TD3（护照）机读区每行 44 个字符
+MRZ_LINE_LENGTH = 44
+MRZ_LINE_PATTERN = re.compile(r'^[A-Z0-9<]{44}$')
+
+# 校验位权重
+CHECK_WEIGHTS = (7, 3, 1)
+
+# 数字字段中常见的 OCR 误识别
+DIGIT_FIXES = str.maketrans({'O': '0', 'Q': '0', 'D': '0', 'I': '1', 'L': '1', 'Z': '2', 'S': '5', 'B': '8'})
+
+
+def _char_value(char: str) -> int:
+    """机读区字符对应的校验值：数字为本身，字母 A-Z 为 10-35，填充符 < 为 0"""
+    if char.isdigit():
+        return int(char)
+    if 'A' <= char <= 'Z':
+        return ord(char) - ord('A') + 10
+    return 0
+
+
+def compute_check_digit(field: str) -> str:
+    """按 ICAO 9303 计算校验位"""
+    total = sum(_char_value(c) * CHECK_WEIGHTS[i % 3] for i, c in enumerate(field))
+    return str(total % 10)
+
+
+def _fix_digits(field: str) -> str:
+    """修正只能是数字的字段中的 OCR 误识别"""
+    return field.translate(DIGIT_FIXES)
+
+
+def _expand_date(yymmdd: str, is_expiry: bool) -> Optional[str]:
+    """将 YYMMDD 转换为 YYYYMMDD"""
+    if not yymmdd.isdigit():
+        return None
+    year = int(yymmdd[:2])
+    if is_expiry:
+        century = 2000
+    else:
+        # 出生日期不可能晚于今年
+        century = 2000 if 2000 + year <= time.localtime().tm_year else 1900
+    return f"{century + year:04d}{yymmdd[2:]}"
+
+
+def find_mrz_lines(text: str) -> Optional[Tuple[str, str]]:
+    """从页面文本中查找 TD3 机读区的两行"""
+    if not text or '<' not in text:
+        return None
+
+    lines: List[str] = []
+    for line in text.splitlines():
+        # 去除文本层中插入的空格，并统一填充符
+        line = re.sub(r'\s+', '', line).upper().replace('«', '<<')
+        if not line:
+            continue
+        # 两行被合并为一行的情况
+        if len(line) == MRZ_LINE_LENGTH * 2 and MRZ_LINE_PATTERN.match(line[:MRZ_LINE_LENGTH]):
+            lines.extend([line[:MRZ_LINE_LENGTH], line[MRZ_LINE_LENGTH:]])
+        else:
+            lines.append(line)
+
+    for i in range(len(lines) - 1):
+        first, second = lines[i], lines[i + 1]
+        if (first.startswith('P') and MRZ_LINE_PATTERN.match(first)
+                and MRZ_LINE_PATTERN.match(second)):
+            return first, second
+    return None
+
+
+def parse_mrz(text: str) -> Optional[Dict[str, Any]]:
+    """解析页面文本中的护照机读区
+
+    返回与 CozeHandler.process_passport_text 相同结构的数据；
+    未找到机读区或任一校验位不通过时返回 None，由调用方回退到远程识别。
+    """
+    mrz_lines = find_mrz_lines(text)
+    if not mrz_lines:
+        return None
+    first, second = mrz_lines
+
+    passport_number = second[0:9]
+    birth_date = _fix_digits(second[13:19])
+    expiry_date = _fix_digits(second[21:27])
+    checks = _fix_digits(second[9] + second[19] + second[27] + second[43])
+
+    if (compute_check_digit(passport_number) != checks[0]
+            or compute_check_digit(birth_date) != checks[1]
+            or compute_check_digit(expiry_date) != checks[2]):
+        logger.debug(f"机读区校验位不通过: {second}")
+        return None
+
+    composite = second[0:10] + birth_date + checks[1] + expiry_date + checks[2] + second[28:43]
+    if compute_check_digit(composite) != checks[3]:
+        logger.debug(f"机读区综合校验位不通过: {second}")
+        return None
+
+    names = first[5:].split('<<', 1)
+    surname = names[0].replace('<', ' ').strip()
+    given_name = names[1].replace('<', ' ').strip() if len(names) > 1 else ''
+
+    gender = second[20]
+
+    return {
+        'passport_number': passport_number.replace('<', ''),
+        'surname': surname,
+        'given_name': given_name,
+        'gender': gender if gender in ('M', 'F') else '',
+        'birth_date': _expand_date(birth_date, is_expiry=False),
+        'expiry_date': _expand_date(expiry_date, is_expiry=True),
+        'chinese_name': None  # 机读区不包含中文姓名
+    }
@@ -0,0 +1,48 @@
+import re
+import hashlib
+from typing import Dict, Any, Optional, Tuple
+from utils.cache_manager import CacheManager, MISS
+
+# 在 CacheManager 中使用的缓存类型
+NAMESPACE = 'page_result'
+INVALID_NAMESPACE = 'page_result_invalid'  # 带过期时间
+
+
+class PageResultCache:
+    """按页面文本哈希缓存单页识别结果，跨文档共享
+
+    存储在 CacheManager 的 page_result 类型中（内存LRU + 磁盘文件）。
+    未通过校验的结果（非护照页或 API 返回的数据不完整）存储在带过期时间的 page_result_invalid 中，
+    一次错误的返回不会被永久记住。
+    """
+
+    def __init__(self, cache_manager: CacheManager):
+        self.cache_manager = cache_manager
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        """计算规范化页面文本的哈希值"""
+        # 合并空白字符，避免重新扫描导致的换行/空格差异
+        normalized = re.sub(r'\s+', ' ', text or '').strip()
+        return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+    def get(self, text_hash: str) -> Any:
+        """获取缓存结果，未命中时返回 MISS"""
+        result = self.cache_manager.get(NAMESPACE, text_hash)
+        if result is MISS:
+            result = self.cache_manager.get(INVALID_NAMESPACE, text_hash)
+        return result
+
+    def set(self, text_hash: str, passport_data: Optional[Dict[str, Any]]) -> None:
+        """保存单页结果，passport_data 为 None 表示该页没有有效的护照信息；同时删除另一类型中的旧结果"""
+        if passport_data is None:
+            self.cache_manager.set(INVALID_NAMESPACE, text_hash, None)
+            self.cache_manager.delete(NAMESPACE, text_hash)
+        else:
+            self.cache_manager.set(NAMESPACE, text_hash, passport_data)
+            self.cache_manager.delete(INVALID_NAMESPACE, text_hash)
+
+    def lookup(self, text: str) -> Tuple[str, Any]:
+        """按页面文本查找缓存，返回 (文本哈希, 结果或 MISS)"""
+        text_hash = self.text_hash(text)
+        return text_hash, self.get(text_hash)
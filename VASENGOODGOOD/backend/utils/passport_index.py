@@ -0,0 +1,104 @@
+import re
+from typing import Dict, List, Optional, Set
+
+# 索引格式版本，格式变化时旧的索引文件自动失效
+INDEX_VERSION = 1
+
+# 与 CozeHandler._normalize_passport_data 一致的 OCR 易混淆字符，统一为数字形式作为索引键
+OCR_CONFUSIONS = str.maketrans({'O': '0', 'I': '1', 'L': '1'})
+
+# 护照号码形状：8-9 位字母数字，且至少包含 6 位数字
+PASSPORT_NUMBER_PATTERN = re.compile(r'^[A-Z0-9]{8,9}$')
+
+# 机读区第二行以护照号码开头
+MRZ_NUMBER_LENGTH = 9
+
+TOKEN_PATTERN = re.compile(r'[A-Z0-9]+')
+
+
+def canonical_token(token: str) -> str:
+    """规范化索引键：大写并统一 OCR 易混淆字符"""
+    return token.upper().translate(OCR_CONFUSIONS)
+
+
+def _is_passport_number(token: str) -> bool:
+    """判断是否为护照号码形状的字符串"""
+    return bool(PASSPORT_NUMBER_PATTERN.match(token)) and sum(c.isdigit() for c in token) >= 6
+
+
+class PassportPageIndex:
+    """PDF 文档的倒排索引：护照号码 / 姓名拼音 -> 页码(从0开始)
+
+    每份文档只构建一次，用于复核时按护照号或姓名直接定位页面，
+    替代逐页扫描文本。
+    """
+
+    def __init__(self, numbers: Optional[Dict[str, List[int]]] = None,
+                 tokens: Optional[Dict[str, List[int]]] = None):
+        self.numbers = numbers or {}  # 规范化护照号码 -> 页码列表
+        self.tokens = tokens or {}  # 规范化单词（姓名拼音等） -> 页码列表
+
+    @classmethod
+    def build(cls, text_by_page: Dict[str, str]) -> 'PassportPageIndex':
+        """从每页文本构建索引"""
+        numbers: Dict[str, Set[int]] = {}
+        tokens: Dict[str, Set[int]] = {}
+
+        for page_key, text in text_by_page.items():
+            page_num = int(page_key)
+            # 机读区的填充符视为分隔符
+            for token in TOKEN_PATTERN.findall((text or '').upper().replace('<', ' ')):
+                key = canonical_token(token)
+                if len(key) >= 2:
+                    tokens.setdefault(key, set()).add(page_num)
+
+                if _is_passport_number(token):
+                    numbers.setdefault(key, set()).add(page_num)
+                elif len(token) > MRZ_NUMBER_LENGTH and _is_passport_number(token[:MRZ_NUMBER_LENGTH]):
+                    # 机读区第二行：护照号码后紧跟校验位和国籍代码
+                    numbers.setdefault(canonical_token(token[:MRZ_NUMBER_LENGTH]), set()).add(page_num)
+
+        return cls(
+            {key: sorted(pages) for key, pages in numbers.items()},
+            {key: sorted(pages) for key, pages in tokens.items()}
+        )
+
+    def find_pages(self, passport_number: Optional[str] = None, surname: Optional[str] = None,
+                   given_name: Optional[str] = None) -> List[int]:
+        """查找可能包含该护照的页码，优先按护照号码匹配，其次按姓名匹配"""
+        if passport_number:
+            key = canonical_token(re.sub(r'[^A-Za-z0-9]', '', passport_number))
+            pages = self.numbers.get(key) or self.tokens.get(key)
+            if pages:
+                return list(pages)
+
+        name_tokens = []
+        for name in (surname, given_name):
+            if name:
+                name_tokens.extend(canonical_token(t) for t in TOKEN_PATTERN.findall(name.upper()))
+        if not name_tokens:
+            return []
+
+        # 所有姓名单词都出现的页面
+        pages = None
+        for token in name_tokens:
+            token_pages = set(self.tokens.get(token, ()))
+            pages = token_pages if pages is None else pages & token_pages
+            if not pages:
+                return []
+        return sorted(pages)
+
+    def to_dict(self) -> Dict:
+        """序列化为可保存为 JSON 的字典"""
+        return {
+            'version': INDEX_VERSION,
+            'numbers': self.numbers,
+            'tokens': self.tokens
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> Optional['PassportPageIndex']:
+        """从字典恢复索引，版本不匹配时返回 None"""
+        if not data or data.get('version') != INDEX_VERSION:
+            return None
+        return cls(data.get('numbers'), data.get('tokens'))
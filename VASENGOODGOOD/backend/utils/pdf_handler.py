@@ -1,126 +1,126 @@
 import fitz  # PyMuPDF
 import os
-import hashlib
-from typing import Optional, List, Dict
+import re
+from utils.cache_manager import MISS
+from utils.file_hash import hash_file
+from utils.handler_registry import estimate_size
+from utils.passport_index import PassportPageIndex
+from utils.metrics import metrics
+from typing import Optional, List, Dict, Tuple
 import logging
-import json
 import time
-from flask import current_app
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock, RLock
 
 logger = logging.getLogger(__name__)
 
+# 进程内共享的文本提取进程池（延迟创建）
+_process_pool = None
+_process_pool_size = 0
+_process_pool_lock = Lock()
+
+
+def _get_process_pool(max_processes: int) -> ProcessPoolExecutor:
+    """获取文本提取进程池，使用 spawn 方式启动，避免在多线程进程中 fork"""
+    global _process_pool, _process_pool_size
+    with _process_pool_lock:
+        if _process_pool is None or _process_pool_size != max_processes:
+            if _process_pool is not None:
+                _process_pool.shutdown(wait=False)
+            _process_pool = ProcessPoolExecutor(
+                max_workers=max_processes,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            _process_pool_size = max_processes
+            logger.info(f"已创建PDF文本提取进程池，进程数: {max_processes}")
+        return _process_pool
+
+
+def _reset_process_pool() -> None:
+    """丢弃已损坏的进程池，下次使用时重新创建"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False)
+            _process_pool = None
+
+
+def _extract_page_range(file_path: str, start: int, end: int) -> Dict[str, str]:
+    """在子进程中打开文档并提取 [start, end) 页的文本"""
+    text_by_page = {}
+    with fitz.open(file_path) as doc:
+        for page_num in range(start, end):
+            text = doc[page_num].get_text()
+            if text.strip():
+                text_by_page[str(page_num)] = text
+    return text_by_page
+
+
 class PDFHandler:
-    def __init__(self, file_path: str, cache=None):
+    def __init__(self, file_path: str, cache=None, parallel_threshold: int = 64,
+                 max_processes: Optional[int] = None, lazy: bool = False):
         self.file_path = file_path
         self.text_by_page = {}  # 存储每页的文本
         self.file_hash = None
         self.processed_data = None
-        self.cache = cache  # 接收外部传入的缓存对象
+        self.cache = cache  # 缓存管理器（CacheManager）
+        self.parallel_threshold = parallel_threshold  # 超过该页数时使用多进程提取文本
+        self.max_processes = max_processes or os.cpu_count() or 1
+        self.lazy = lazy  # 按需模式：只在访问时提取单页文本
+        self.total_pages = None
+        self.fully_loaded = False
+        self.page_index = None  # 护照号码/姓名 -> 页码的倒排索引
+        self._load_lock = RLock()  # 处理器可能被多个请求共用，避免重复提取全部文本或构建索引
         
-        # 计算文件哈希值 - 使用文件名中的哈希值而不是重新计算
-        file_name = os.path.basename(file_path)
-        if file_name.endswith('.pdf') and len(file_name) > 4:
-            self.file_hash = file_name[:-4]  # 移除.pdf后缀
+        # 计算文件哈希值 - 上传的文件以内容哈希命名，直接使用文件名中的哈希值
+        self.file_hash = self.hash_from_filename(file_path)
+        if self.file_hash:
             logger.info(f"从文件名获取哈希值: {self.file_hash}")
         else:
             # 如果文件名不符合预期格式，重新计算哈希值
             self._calculate_file_hash()
         
-        # 检查是否存在预处理数据
-        self._load_or_process_pdf()
+        # 检查是否存在预处理数据（按需模式下延迟到首次需要全部文本时）
+        if not self.lazy:
+            self._load_or_process_pdf()
+
+    @staticmethod
+    def hash_from_filename(file_path: str) -> Optional[str]:
+        """上传的 PDF 以内容哈希命名（{sha256}.pdf），返回文件名中的哈希值，其他文件名返回 None"""
+        file_name = os.path.basename(file_path)
+        if re.fullmatch(r'[0-9a-f]{64}\.pdf', file_name):
+            return file_name[:-4]  # 移除.pdf后缀
+        return None
 
     def _calculate_file_hash(self) -> None:
-        """计算文件的 SHA-256 哈希值"""
+        """计算整个文件的 SHA-256 哈希值"""
         try:
-            sha256_hash = hashlib.sha256()
-            with open(self.file_path, "rb") as f:
-                # 读取前1MB用于计算哈希值，提高性能
-                data = f.read(1024 * 1024)
-                if data:
-                    sha256_hash.update(data)
-            self.file_hash = sha256_hash.hexdigest()
+            self.file_hash = hash_file(self.file_path)
             logger.info(f"计算文件哈希值: {self.file_hash}")
         except Exception as e:
             logger.error(f"计算文件哈希值失败: {str(e)}")
             raise
 
-    def _get_cache_key(self) -> str:
-        """获取缓存键"""
-        return f"pdf_data_{self.file_hash}"
-
     def _load_or_process_pdf(self) -> None:
         """从缓存加载或处理PDF文件"""
-        cache_key = self._get_cache_key()
-        
-        # 尝试从Flask缓存获取
-        cached_data = None
         if self.cache:
-            cached_data = self.cache.get(cache_key)
-            if cached_data:
-                logger.info(f"从Flask缓存加载PDF数据: {cache_key}")
+            cached_data = self.cache.get('pdf_text', self.file_hash)
+            if cached_data is not MISS:
+                logger.info(f"从缓存加载PDF数据: {self.file_hash}")
                 self.processed_data = cached_data
                 self.text_by_page = cached_data.get('text_by_page', {})
+                self.fully_loaded = True
                 return
         
-        # 如果没有Flask缓存，尝试从文件缓存加载
-        cache_path = self._get_file_cache_path()
-        try:
-            if os.path.exists(cache_path):
-                file_modify_time = os.path.getmtime(self.file_path)
-                cache_modify_time = os.path.getmtime(cache_path)
-                
-                # 只使用比PDF文件更新的缓存
-                if cache_modify_time > file_modify_time:
-                    logger.info(f"从文件缓存加载PDF数据: {cache_path}")
-                    with open(cache_path, 'r', encoding='utf-8') as f:
-                        cached_data = json.load(f)
-                        self.processed_data = cached_data
-                        self.text_by_page = cached_data.get('text_by_page', {})
-                        
-                        # 将文件缓存同步到Flask缓存
-                        if self.cache:
-                            self.cache.set(cache_key, cached_data)
-                        return
-                else:
-                    logger.info(f"文件缓存过期，PDF文件({file_modify_time})比缓存({cache_modify_time})更新")
-            else:
-                logger.info(f"未找到文件缓存: {cache_path}")
-        except Exception as e:
-            logger.warning(f"从文件缓存加载失败，将处理PDF: {str(e)}")
-            # 尝试删除损坏的缓存
-            try:
-                if os.path.exists(cache_path):
-                    os.remove(cache_path)
-                    logger.info(f"已删除损坏的缓存文件: {cache_path}")
-            except:
-                pass
-        
         # 如果没有缓存，处理PDF
         self._process_pdf()
+        self.fully_loaded = True
         
         # 保存处理结果到缓存
-        if self.processed_data:
-            # 保存到Flask缓存
-            if self.cache:
-                self.cache.set(cache_key, self.processed_data)
-                logger.info(f"已保存到Flask缓存: {cache_key}")
-            
-            # 同时保存到文件缓存作为备份
-            try:
-                with open(cache_path, 'w', encoding='utf-8') as f:
-                    json.dump(self.processed_data, f, ensure_ascii=False)
-                logger.info(f"已保存到文件缓存: {cache_path}")
-            except Exception as e:
-                logger.error(f"保存到文件缓存失败: {str(e)}")
-
-    def _get_file_cache_path(self) -> str:
-        """获取文件缓存路径"""
-        # 获取 uploads 目录
-        uploads_dir = os.path.dirname(os.path.dirname(self.file_path))
-        # 创建 cache 目录
-        cache_dir = os.path.join(uploads_dir, 'cache')
-        os.makedirs(cache_dir, exist_ok=True)
-        return os.path.join(cache_dir, f"{self.file_hash}_text.json")
+        if self.processed_data and self.cache:
+            self.cache.set('pdf_text', self.file_hash, self.processed_data)
+            logger.info(f"已保存PDF数据到缓存: {self.file_hash}")
 
     def _process_pdf(self) -> None:
         """处理 PDF 文件并提取所有页面的文本"""
@@ -131,43 +131,160 @@ class PDFHandler:
         if file_ext != '.pdf':
             raise ValueError(f"不支持的文件格式: {file_ext}，只支持 PDF 文件")
 
+        start_time = time.perf_counter()
         try:
             with fitz.open(self.file_path) as doc:
                 total_pages = len(doc)
                 logger.info(f"开始处理 PDF 文件，共 {total_pages} 页")
                 
-                for page_num in range(total_pages):
-                    page = doc[page_num]
-                    text = page.get_text()
-                    
-                    if not text.strip():
-                        logger.warning(f"第 {page_num + 1} 页是空白页或无法提取文本")
-                        continue
+                # 页数较少时多进程的启动和传输开销大于收益，保持单进程提取
+                use_parallel = total_pages >= self.parallel_threshold and self.max_processes > 1
+                if not use_parallel:
+                    for page_num in range(total_pages):
+                        page = doc[page_num]
+                        text = page.get_text()
                         
-                    self.text_by_page[str(page_num)] = text
-                    logger.debug(f"已提取第 {page_num + 1} 页文本")
-                
-                logger.info(f"成功提取 {len(self.text_by_page)} 页文本")
-                
-                # 保存处理后的数据，包括时间戳
-                self.processed_data = {
-                    'file_hash': self.file_hash,
-                    'total_pages': total_pages,
-                    'text_by_page': self.text_by_page,
-                    'processed_time': time.time()
-                }
+                        if not text.strip():
+                            continue
+                            
+                        self.text_by_page[str(page_num)] = text
+                        logger.debug(f"已提取第 {page_num + 1} 页文本")
+            
+            if use_parallel:
+                self.text_by_page = self._extract_parallel(total_pages)
+            
+            for page_num in range(total_pages):
+                if str(page_num) not in self.text_by_page:
+                    logger.warning(f"第 {page_num + 1} 页是空白页或无法提取文本")
+            
+            logger.info(f"成功提取 {len(self.text_by_page)} 页文本")
+            metrics.observe('pdf_extract_seconds', time.perf_counter() - start_time,
+                            mode='parallel' if use_parallel else 'serial')
+            metrics.inc('pdf_pages_extracted_total', total_pages)
+            
+            # 保存处理后的数据，包括时间戳
+            self.processed_data = {
+                'file_hash': self.file_hash,
+                'total_pages': total_pages,
+                'text_by_page': self.text_by_page,
+                'processed_time': time.time()
+            }
         except Exception as e:
             logger.error(f"处理 PDF 文件失败: {str(e)}")
             raise
 
+    def _extract_parallel(self, total_pages: int) -> Dict[str, str]:
+        """按页码范围分片，在进程池中并行提取文本"""
+        shard_count = min(self.max_processes, total_pages)
+        shard_size = -(-total_pages // shard_count)  # 向上取整
+        pool = _get_process_pool(self.max_processes)
+        
+        logger.info(f"使用 {shard_count} 个进程并行提取文本，每片 {shard_size} 页")
+        futures = [
+            pool.submit(_extract_page_range, self.file_path, start, min(start + shard_size, total_pages))
+            for start in range(0, total_pages, shard_size)
+        ]
+        
+        text_by_page = {}
+        try:
+            for future in futures:
+                text_by_page.update(future.result())
+        except Exception as e:
+            # 子进程异常退出时回退到单进程提取
+            logger.warning(f"多进程提取文本失败，改为单进程提取: {str(e)}")
+            _reset_process_pool()
+            return _extract_page_range(self.file_path, 0, total_pages)
+        # 按页码顺序排列，与单进程提取的结果保持一致
+        return {key: text_by_page[key] for key in sorted(text_by_page, key=int)}
+
     def get_page_count(self) -> int:
-        """获取 PDF 总页数"""
-        return len(self.text_by_page)
+        """获取 PDF 总页数（包括空白页），只读取文档元数据，不提取文本"""
+        if self.processed_data and 'total_pages' in self.processed_data:
+            return self.processed_data['total_pages']
+        
+        if self.total_pages is None:
+            with fitz.open(self.file_path) as doc:
+                self.total_pages = len(doc)
+        return self.total_pages
 
     def get_text(self, page_number: int) -> Optional[str]:
-        """获取指定页码的文本"""
-        return self.text_by_page.get(str(page_number))
+        """获取指定页码的文本，按需模式下只提取并缓存该页"""
+        key = str(page_number)
+        if self.fully_loaded or key in self.text_by_page:
+            return self.text_by_page.get(key)
+        
+        if not 0 <= page_number < self.get_page_count():
+            return None
+        
+        with metrics.timer('pdf_page_text_seconds'):
+            text = _extract_page_range(self.file_path, page_number, page_number + 1).get(key)
+        if text:
+            self.text_by_page[key] = text
+            logger.debug(f"按需提取第 {page_number + 1} 页文本")
+        return text
+
+    def render_page(self, page_number: int, zoom: float = 1.0,
+                    clip: Optional[Tuple[float, float, float, float]] = None, quality: int = 85) -> bytes:
+        """将单页渲染为 JPEG 图片
+
+        clip 为按页面宽高比例表示的裁剪区域 (x0, y0, x1, y1)，如 (0, 0.5, 1, 1) 表示下半页。
+        页码超出范围时抛出 IndexError。
+        """
+        with metrics.timer('pdf_render_seconds'), fitz.open(self.file_path) as doc:
+            self.total_pages = len(doc)
+            if not 0 <= page_number < self.total_pages:
+                raise IndexError(f"页码超出范围: {page_number + 1}/{self.total_pages}")
+            
+            page = doc[page_number]
+            clip_rect = None
+            if clip:
+                rect = page.rect
+                x0, y0, x1, y1 = clip
+                clip_rect = fitz.Rect(rect.x0 + rect.width * x0, rect.y0 + rect.height * y0,
+                                      rect.x0 + rect.width * x1, rect.y0 + rect.height * y1)
+            pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip_rect, alpha=False)
+            return pixmap.tobytes('jpeg', jpg_quality=quality)
 
     def get_all_texts(self) -> Dict[str, str]:
         """获取所有页面的文本"""
-        return self.text_by_page 
\ No newline at end of file
+        if not self.fully_loaded:
+            with self._load_lock:
+                if not self.fully_loaded:
+                    self.text_by_page = {}
+                    self._load_or_process_pdf()
+        return self.text_by_page 
+
+    def memory_usage(self) -> int:
+        """估算占用的内存字节数：页面文本和倒排索引"""
+        size = estimate_size(self.text_by_page)
+        if self.page_index is not None:
+            size += estimate_size(self.page_index.numbers) + estimate_size(self.page_index.tokens)
+        return size
+
+    def get_page_index(self) -> PassportPageIndex:
+        """获取文档的倒排索引，优先从缓存加载，不存在时构建并保存"""
+        if self.page_index is not None:
+            return self.page_index
+        
+        with self._load_lock:
+            if self.page_index is None:
+                self.page_index = self._load_or_build_page_index()
+        return self.page_index
+
+    def _load_or_build_page_index(self) -> PassportPageIndex:
+        if self.cache:
+            page_index = PassportPageIndex.from_dict(self.cache.get('pdf_index', self.file_hash, None))
+            if page_index:
+                return page_index
+        
+        page_index = PassportPageIndex.build(self.get_all_texts())
+        logger.info(f"已构建文档索引: {len(page_index.numbers)} 个护照号码")
+        
+        if self.cache:
+            self.cache.set('pdf_index', self.file_hash, page_index.to_dict())
+        return page_index
+
+    def find_pages(self, passport_number: Optional[str] = None, surname: Optional[str] = None,
+                   given_name: Optional[str] = None) -> List[int]:
+        """根据护照号码或姓名查找页码（从0开始）"""
+        return self.get_page_index().find_pages(passport_number, surname, given_name)
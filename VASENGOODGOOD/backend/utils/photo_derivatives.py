@@ -0,0 +1,75 @@
+import os
+import logging
+from threading import get_ident
+from typing import Dict, Optional, Tuple
+from PIL import Image, ImageOps, features
+from utils.disk_quota import DirectoryQuota
+from utils.file_hash import hash_file
+
+logger = logging.getLogger(__name__)
+
+# 输出格式 -> (Pillow 格式名, 文件扩展名, MIME 类型)
+FORMATS = {
+    'webp': ('WEBP', 'webp', 'image/webp'),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg')
+}
+
+# 当前 Pillow 是否支持 WebP 编码
+WEBP_SUPPORTED = features.check('webp')
+
+
+class PhotoDerivativeCache:
+    """证件照缩略图/预览图缓存
+
+    按原图内容哈希、尺寸和格式生成缩放后的图片并保存到磁盘，
+    原图内容不变时直接复用，内容变化后哈希不同会自动生成新的图片。
+    缓存目录的总大小超过 max_bytes 时删除最久未使用的图片。
+    """
+
+    def __init__(self, cache_dir: str, sizes: Dict[str, int], quality: int = 80,
+                 max_bytes: int = 1024 * 1024 * 1024, max_age: Optional[float] = None):
+        self.cache_dir = cache_dir
+        self.sizes = sizes  # 尺寸名称 -> 最长边像素
+        self.quality = quality
+        self.quota = DirectoryQuota(cache_dir, max_bytes, max_age)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def choose_format(self, accept: str = '') -> str:
+        """根据请求的 Accept 头选择输出格式，浏览器支持且服务端可编码时使用 WebP"""
+        if WEBP_SUPPORTED and 'image/webp' in (accept or ''):
+            return 'webp'
+        return 'jpeg'
+
+    def get(self, source_path: str, size: str, fmt: str = 'jpeg') -> Tuple[str, str, str]:
+        """获取（必要时生成）缩放后的图片，返回 (文件路径, ETag, MIME 类型)"""
+        if size not in self.sizes:
+            raise ValueError(f"不支持的图片尺寸: {size}")
+        pil_format, extension, mimetype = FORMATS[fmt]
+
+        content_hash = hash_file(source_path)
+        etag = f"{content_hash}-{size}-{extension}"
+        path = os.path.join(self.cache_dir, f"{etag}.{extension}")
+        if os.path.exists(path):
+            self.quota.touch(path)
+        else:
+            self._generate(source_path, path, self.sizes[size], pil_format)
+            self.quota.record_write(os.path.getsize(path))
+        return path, etag, mimetype
+
+    def _generate(self, source_path: str, path: str, max_side: int, pil_format: str) -> None:
+        """缩放图片并原子写入缓存文件"""
+        tmp_path = f"{path}.{os.getpid()}_{get_ident()}.tmp"
+        try:
+            with Image.open(source_path) as image:
+                # 按 EXIF 方向旋转，避免手机照片显示方向错误
+                image = ImageOps.exif_transpose(image)
+                image.thumbnail((max_side, max_side))
+                if image.mode not in ('RGB', 'L'):
+                    image = image.convert('RGB')
+                image.save(tmp_path, format=pil_format, quality=self.quality)
+            os.replace(tmp_path, path)
+            logger.debug(f"已生成照片缩略图: {path}")
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
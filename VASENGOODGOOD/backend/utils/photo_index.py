@@ -0,0 +1,110 @@
+import os
+import bisect
+import logging
+from threading import Lock
+from typing import Dict, List, Optional
+from werkzeug.utils import secure_filename
+
+logger = logging.getLogger(__name__)
+
+
+class PhotoIndex:
+    """照片目录的文件名索引，用于把 CSV 中的照片文件名解析为实际文件名
+
+    目录只扫描一次，建立 完整文件名 / 文件名主干 -> 实际文件名 的映射，
+    另外保存排序后的文件名列表用于前缀查找。每条记录的解析为 O(1)（前缀查找为 O(log n)）。
+    上传照片后调用 add() 增量更新；其他 worker 修改了目录时，根据目录修改时间自动重新扫描。
+    """
+
+    def __init__(self, photos_dir: str):
+        self.photos_dir = photos_dir
+        self._names: Dict[str, str] = {}  # 小写文件名 -> 实际文件名
+        self._stems: Dict[str, str] = {}  # 小写文件名主干（不含扩展名） -> 实际文件名
+        self._sorted: List[str] = []  # 排序后的小写文件名，用于前缀查找
+        self._signature = None  # 上次扫描时目录的修改时间
+        self._lock = Lock()
+
+    def dir_signature(self) -> Optional[int]:
+        """目录修改时间，目录中增删文件时会变化"""
+        try:
+            return os.stat(self.photos_dir).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    @property
+    def signature(self) -> Optional[int]:
+        """索引对应的目录版本（检查前先刷新），可用于缓存键"""
+        self.refresh()
+        return self._signature
+
+    def refresh(self) -> None:
+        """目录有变化时重新扫描"""
+        signature = self.dir_signature()
+        if signature == self._signature:
+            return
+
+        with self._lock:
+            if signature == self._signature:
+                return
+            names, stems = {}, {}
+            if signature is not None:
+                with os.scandir(self.photos_dir) as it:
+                    for entry in it:
+                        if entry.is_file() and not entry.name.startswith('.'):
+                            self._index_name(entry.name, names, stems)
+            self._names, self._stems = names, stems
+            self._sorted = sorted(names)
+            self._signature = signature
+            logger.info(f"已建立照片索引: {len(names)} 个文件")
+
+    @staticmethod
+    def _index_name(filename: str, names: Dict[str, str], stems: Dict[str, str]) -> None:
+        """把文件名加入映射"""
+        key = filename.lower()
+        names[key] = filename
+        stems.setdefault(os.path.splitext(key)[0], filename)
+
+    def add(self, filename: str, previous_signature: Optional[int] = None) -> None:
+        """增量添加新上传的文件
+
+        previous_signature 为把文件移入目录前的目录修改时间。它与索引版本一致时，说明索引建立后
+        没有其他 worker 修改目录，把索引版本更新为当前目录修改时间，下次 refresh() 无需重新扫描；
+        否则保留原版本，由 refresh() 重新扫描。
+        """
+        with self._lock:
+            key = filename.lower()
+            if key not in self._names:
+                bisect.insort(self._sorted, key)
+            self._index_name(filename, self._names, self._stems)
+            if previous_signature is not None and previous_signature == self._signature:
+                self._signature = self.dir_signature()
+
+    def resolve(self, photo_filename: str) -> Optional[str]:
+        """解析 CSV 中的照片文件名，找不到时返回 None
+
+        依次尝试：完整文件名、上传时经过 secure_filename 处理后的文件名、
+        不含扩展名的文件名主干，最后是以该名称开头的文件。
+        """
+        base = (photo_filename or '').strip().lower()
+        if not base:
+            return None
+
+        for key in (base, secure_filename(base).lower()):
+            if key in self._names:
+                return self._names[key]
+            if key in self._stems:
+                return self._stems[key]
+
+        position = bisect.bisect_left(self._sorted, base)
+        if position < len(self._sorted) and self._sorted[position].startswith(base):
+            return self._names[self._sorted[position]]
+        return None
+
+    def resolve_many(self, photo_filenames) -> List[str]:
+        """批量解析，找不到的保留原文件名"""
+        self.refresh()
+        resolved = []
+        for name in photo_filenames:
+            actual = self.resolve(name)
+            resolved.append(actual if actual is not None else name)
+        return resolved
@@ -0,0 +1,195 @@
+import time
+import heapq
+import random
+import logging
+import itertools
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from threading import Condition, Thread
+from typing import Any, Callable, Dict
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class _Task:
+    """调度队列中的单个任务"""
+
+    __slots__ = ('tenant', 'func', 'args', 'kwargs', 'future', 'attempts')
+
+    def __init__(self, tenant: str, func: Callable, args: tuple, kwargs: dict):
+        self.tenant = tenant
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.attempts = 0
+
+
+class AdaptiveScheduler:
+    """远程调用调度器：自适应并发、限流重试和按租户公平调度
+
+    - 并发上限采用 AIMD：请求成功且延迟低于目标时缓慢增加，
+      遇到限流(429)/服务端错误(5xx)/超时或延迟过高时成倍减少
+    - 可重试的异常（异常对象的 retryable 属性为真）按指数退避加随机抖动重新排队
+    - 每个租户（如一份PDF）一个队列，按轮询方式取任务，大文件不会饿死小文件
+    """
+
+    def __init__(self, min_concurrency: int = 1, max_concurrency: int = 12,
+                 initial_concurrency: int = 6, target_latency: float = 15.0,
+                 max_retries: int = 3, base_delay: float = 1.0, max_delay: float = 30.0):
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency  # 目标延迟（秒），超过视为过载
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._limit = float(min(max(initial_concurrency, min_concurrency), max_concurrency))
+        self._in_flight = 0
+        self._queues = OrderedDict()  # 租户 -> 待执行任务队列
+        self._delayed = []  # (可执行时间, 序号, 任务) 的最小堆，保存等待重试的任务
+        self._sequence = itertools.count()
+        self._last_decrease = 0.0
+        self._cond = Condition()
+
+        for i in range(max_concurrency):
+            Thread(target=self._worker, name=f'scheduler-{i}', daemon=True).start()
+
+    @property
+    def concurrency_limit(self) -> int:
+        """当前允许的并发请求数"""
+        return int(self._limit)
+
+    def stats(self) -> Dict[str, Any]:
+        """调度器当前状态"""
+        with self._cond:
+            return {
+                'concurrency_limit': int(self._limit),
+                'in_flight': self._in_flight,
+                'queued': sum(len(q) for q in self._queues.values()),
+                'delayed': len(self._delayed),
+                'tenants': len(self._queues)
+            }
+
+    def submit(self, tenant: str, func: Callable, *args, **kwargs) -> Future:
+        """提交任务到指定租户的队列，返回 Future"""
+        task = _Task(tenant, func, args, kwargs)
+        with self._cond:
+            self._enqueue(task)
+            self._cond.notify()
+        return task.future
+
+    def _enqueue(self, task: _Task) -> None:
+        """将任务加入租户队列（调用方需持有锁）"""
+        queue = self._queues.get(task.tenant)
+        if queue is None:
+            queue = self._queues[task.tenant] = deque()
+        queue.append(task)
+
+    def _promote_delayed(self) -> None:
+        """将退避时间已到的任务放回队列（调用方需持有锁）"""
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, task = heapq.heappop(self._delayed)
+            self._enqueue(task)
+
+    def _next_task(self):
+        """按租户轮询取出下一个任务（调用方需持有锁）"""
+        while self._queues:
+            tenant, queue = next(iter(self._queues.items()))
+            if not queue:
+                del self._queues[tenant]
+                continue
+            task = queue.popleft()
+            # 取出任务后把该租户移到末尾，实现轮询
+            if queue:
+                self._queues.move_to_end(tenant)
+            else:
+                del self._queues[tenant]
+            return task
+        return None
+
+    def _worker(self) -> None:
+        """工作线程：在并发上限内取任务执行"""
+        while True:
+            with self._cond:
+                while True:
+                    self._promote_delayed()
+                    if self._in_flight < int(self._limit):
+                        task = self._next_task()
+                        if task is not None:
+                            break
+                    wait_time = None
+                    if self._delayed:
+                        wait_time = max(0.0, self._delayed[0][0] - time.monotonic())
+                    self._cond.wait(wait_time)
+                self._in_flight += 1
+
+            if task.attempts == 0 and not task.future.set_running_or_notify_cancel():
+                self._release()
+                continue
+
+            self._execute(task)
+            self._release()
+
+    def _release(self) -> None:
+        """释放一个并发名额并唤醒等待的线程"""
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def _execute(self, task: _Task) -> None:
+        """执行任务，根据结果调整并发上限或安排重试"""
+        task.attempts += 1
+        start_time = time.monotonic()
+        try:
+            result = task.func(*task.args, **task.kwargs)
+        except Exception as e:
+            retryable = getattr(e, 'retryable', False)
+            if retryable:
+                self._decrease()
+            if retryable and task.attempts <= self.max_retries:
+                delay = self._backoff_delay(task.attempts, getattr(e, 'retry_after', None))
+                logger.warning(f"远程调用失败，{delay:.1f} 秒后第 {task.attempts} 次重试: {str(e)}")
+                metrics.inc('scheduler_retries_total')
+                with self._cond:
+                    heapq.heappush(self._delayed, (time.monotonic() + delay, next(self._sequence), task))
+                    self._cond.notify()
+                return
+            metrics.inc('scheduler_failures_total')
+            task.future.set_exception(e)
+            return
+
+        latency = time.monotonic() - start_time
+        if latency > self.target_latency:
+            self._decrease()
+        else:
+            self._increase()
+        task.future.set_result(result)
+
+    def _backoff_delay(self, attempts: int, retry_after=None) -> float:
+        """指数退避加随机抖动，服务端给出 Retry-After 时不早于该时间"""
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        delay = random.uniform(delay / 2, delay)
+        if retry_after:
+            delay = max(delay, float(retry_after))
+        return delay
+
+    def _increase(self) -> None:
+        """加性增加并发上限"""
+        with self._cond:
+            self._limit = min(self.max_concurrency, self._limit + 1 / self._limit)
+            self._cond.notify()
+
+    def _decrease(self) -> None:
+        """乘性减少并发上限，同一批并发请求的失败只减少一次"""
+        with self._cond:
+            now = time.monotonic()
+            if now - self._last_decrease < 1.0:
+                return
+            self._last_decrease = now
+            new_limit = max(self.min_concurrency, self._limit / 2)
+            if int(new_limit) != int(self._limit):
+                logger.info(f"远程调用过载，并发上限调整为 {int(new_limit)}")
+            self._limit = new_limit
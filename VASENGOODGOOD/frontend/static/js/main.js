@@ -9,6 +9,9 @@ let currentErrorIndex = -1;
 let markedRecords = new Set();
 let currentPdfScale = 1.0;
 let currentPdfPage = null;
+// 服务端渲染PDF单页图片时使用的缩放比例（放大显示时仍保持清晰）
+const PDF_PAGE_RENDER_ZOOM = 2;
+const PREPROCESS_POLL_INTERVAL = 1000; // 预处理进度轮询间隔（毫秒）
 let acceptanceNumbersChecked = false; // 添加受理号核对标志
 let markedAcceptanceNumbers = new Set(); // 添加标记的受理号集合
 let highlightedAcceptanceNumbers = []; // 存储需要重点核对的受理号索引
@@ -791,6 +794,13 @@ async function handlePhotoFilesUpload(e) {
         const file = files[i];
         const ext = file.name.split('.').pop().toLowerCase();
         
+        // zip 压缩包由服务端解压
+        if (ext === 'zip') {
+            totalSize += file.size;
+            validFiles.push(file);
+            continue;
+        }
+        
         if (!['jpg', 'jpeg', 'png', 'bmp'].includes(ext)) {
             invalidFiles.push({name: file.name, reason: '不支持的文件格式'});
             continue;
@@ -837,6 +847,13 @@ async function handlePhotoFilesUpload(e) {
         if (result.uploaded_files && result.uploaded_files.length > 0) {
             showSuccess(`成功上传 ${result.uploaded_files.length} 个文件`);
             displayPhoto(result.uploaded_files[0]);
+            
+            // 后台为当前CSV的所有照片生成预览图，不等待结果
+            fetch('/api/photos/prewarm', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({sizes: ['preview']})
+            }).catch(error => console.warn('预生成照片预览图失败:', error));
         }
         
         if (result.errors && result.errors.length > 0) {
@@ -1194,7 +1211,8 @@ function displayPhoto(filename) {
     const img = new Image();
     
     // 构建图片URL时确保使用正确的编码
-    const imageUrl = `/uploads/photos/${encodeURIComponent(cleanFilename)}`;
+    // 使用服务端缓存的预览图，不直接加载原图
+    const imageUrl = `/uploads/photos/${encodeURIComponent(cleanFilename)}?size=preview`;
     console.log('尝试加载图片URL:', imageUrl);
     
     img.onload = () => {
@@ -1268,6 +1286,41 @@ function displayPDFPreview(pdfUrl, pageNumber = 1, forceReload = false) {
     loadingDiv.textContent = '正在加载PDF...';
     canvasContainer.appendChild(loadingDiv);
 
+    // 优先加载服务端渲染的单页图片，无需下载整个PDF
+    const pdfFilename = pdfUrl.split('/').pop().split('?')[0];
+    const pageImage = new Image();
+    pageImage.onload = () => {
+        if (canvasContainer.contains(loadingDiv)) {
+            canvasContainer.removeChild(loadingDiv);
+        }
+        currentPdfPage = createImagePdfPage(pageImage);
+        currentPdfScale = 1.0;
+        bindZoomEvents();
+        requestAnimationFrame(renderPdfPage);
+    };
+    pageImage.onerror = () => {
+        console.warn('加载PDF页面图片失败，改为加载整个PDF');
+        loadPdfDocument(pdfUrl, pageNumber, forceReload, pdfPreview, canvasContainer, loadingDiv);
+    };
+    pageImage.src = `/api/passport_page/${encodeURIComponent(pdfFilename)}/${Math.max(1, pageNumber)}?zoom=${PDF_PAGE_RENDER_ZOOM}`;
+}
+
+// 将服务端渲染的页面图片包装为与 PDF.js 页面相同的接口，供 renderPdfPage 使用
+function createImagePdfPage(image) {
+    return {
+        getViewport: ({ scale }) => ({
+            width: image.naturalWidth / PDF_PAGE_RENDER_ZOOM * scale,
+            height: image.naturalHeight / PDF_PAGE_RENDER_ZOOM * scale
+        }),
+        render: ({ canvasContext, viewport }) => {
+            canvasContext.drawImage(image, 0, 0, viewport.width, viewport.height);
+            return { promise: Promise.resolve() };
+        }
+    };
+}
+
+// 使用 PDF.js 加载整个 PDF（页面图片不可用时）
+function loadPdfDocument(pdfUrl, pageNumber, forceReload, pdfPreview, canvasContainer, loadingDiv) {
     // 防止缓存，添加时间戳
     const cacheBustUrl = pdfUrl.includes('?') ? 
         `${pdfUrl}&_t=${Date.now()}` : 
@@ -1586,7 +1639,8 @@ async function startPreprocessing() {
         
         console.log(`开始预处理护照 ${currentPdfFilename}，强制重新处理: ${shouldForceReprocess}`);
         
-        const response = await fetch('/preprocess/passport', {
+        // 提交后台任务后轮询进度事件，每次请求立即返回，不会长时间占用服务端 worker
+        const submitResponse = await fetch('/jobs/passport', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -1597,28 +1651,29 @@ async function startPreprocessing() {
             })
         });
         
-        if (!response.ok) {
-            throw new Error(`HTTP error! status: ${response.status}`);
+        if (!submitResponse.ok) {
+            throw new Error(`HTTP error! status: ${submitResponse.status}`);
         }
         
-        const reader = response.body.getReader();
+        const {job_id: jobId} = await submitResponse.json();
+        let offset = 0;
+        let finished = false;
+        let jobError = null;
         let isFromCache = false;
         let receivedPassportData = false; // 标记是否接收到有效的护照数据
+        let partialPassportData = []; // 逐页返回的护照数据，处理完成前即可用于比对
         
-        while (true) {
-            const {value, done} = await reader.read();
-            
-            if (done) {
-                break;
+        while (!finished) {
+            const response = await fetch(`/jobs/${jobId}/events?offset=${offset}`);
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
             }
+            const batch = await response.json();
+            offset = batch.offset;
+            finished = batch.finished;
             
-            // 解析进度消息
-            const text = new TextDecoder().decode(value);
-            const messages = text.split('\n').filter(msg => msg.trim());
-            
-            for (const msg of messages) {
+            for (const data of batch.events) {
                 try {
-                    const data = JSON.parse(msg);
                     if (data.from_cache) {
                         isFromCache = true;
                         console.log('从缓存加载数据', data);
@@ -1634,7 +1689,23 @@ async function startPreprocessing() {
                     
                     if (data.error) {
                         console.error('预处理过程中发生错误:', data.error);
-                        throw new Error(data.error);
+                        jobError = data.error;
+                        continue;
+                    }
+                    
+                    // 单页结果按完成顺序到达，先加入护照数据以便提前比对
+                    if (data.passport_data && !data.passport_data_list) {
+                        partialPassportData.push(data.passport_data);
+                        currentPassportData = {
+                            passport_data_list: partialPassportData,
+                            valid_pages: partialPassportData.map(p => p.page_number)
+                        };
+                        
+                        // 当前显示的记录刚好匹配到新结果时刷新显示
+                        const currentRecord = currentCsvData && currentCsvData[currentRecordIndex];
+                        if (currentRecord && currentRecord.passport_number === data.passport_data.passport_number) {
+                            updateRecordDisplay();
+                        }
                     }
                     
                     // 检查是否有护照数据
@@ -1684,9 +1755,17 @@ async function startPreprocessing() {
                         }
                     }
                 } catch (e) {
-                    console.error('解析进度消息失败:', e);
+                    console.error('处理进度消息失败:', e);
                 }
             }
+            
+            if (!finished && batch.events.length === 0) {
+                await new Promise(resolve => setTimeout(resolve, PREPROCESS_POLL_INTERVAL));
+            }
+        }
+        
+        if (jobError) {
+            throw new Error(jobError);
         }
         
         // 处理完成检查